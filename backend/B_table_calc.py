@@ -2,6 +2,8 @@ import pandas as pd
 import math
 import numpy as np
 
+import profiling
+
 # Read the input CSV file (assumed to be named 'input_big.csv')
 # The CSV file should have two columns:
 #   - First column: wavelength (in nm), expected to be in the range 1530 to 1565.
@@ -12,7 +14,7 @@ df_input = pd.read_csv("input_big.csv", header=None, names=["x", "y"])
 # It is assumed that x values are unique.
 y_lookup = dict(zip(df_input["x"], df_input["y"]))
 
-def compute_B(a, b):
+def compute_B(a, b, lookup=None):
     """
     Compute B(a, b) using the formula:
     
@@ -24,7 +26,11 @@ def compute_B(a, b):
       B(1550, λ_del) is obtained by directly looking up λ_del in the input data.
     
     Special case: if a equals b, return infinity.
+    `lookup` replaces the spectrum read from input_big.csv (used by conformance.py).
     """
+    if lookup is None:
+        lookup = y_lookup
+
     # Special case: when a equals b
     if math.isclose(a, b, rel_tol=1e-9):
         return math.inf
@@ -42,47 +48,49 @@ def compute_B(a, b):
     lambda_q = b
 
     # Lookup B(1550, λ_del) from the input data dictionary
-    if lambda_del not in y_lookup:
+    if lambda_del not in lookup:
         raise ValueError(f"λ_del value {lambda_del} not found in input data.")
-    B1550_lambda_del = y_lookup[lambda_del]
+    B1550_lambda_del = lookup[lambda_del]
     
     # Compute the final value using the formula
     result = ((lambda_del / lambda_q) ** 4) * B1550_lambda_del
     return result
 
-# Define the range for a and b (both from 1530 to 1565 inclusive)
-a_values = range(1530, 1566)
-b_values = range(1530, 1566)
-
-# Create an empty DataFrame to hold the B(a,b) values.
-# Rows are a values and columns are b values.
-B_table = pd.DataFrame(index=a_values, columns=b_values)
+def build_and_save_B_table(a_values=range(1530, 1566), b_values=range(1530, 1566), filename="B_table.csv"):
+    """
+    Build the B(a,b) lookup table for the given ranges and save it to CSV.
+    Rows are a values and columns are b values.
+    """
+    # Create an empty DataFrame to hold the B(a,b) values.
+    B_table = pd.DataFrame(index=a_values, columns=b_values)
 
-# Populate the lookup table
-for a in a_values:
-    for b in b_values:
-        try:
-            B_table.at[a, b] = compute_B(a, b)
-        except ValueError as e:
-            print(f"Skipping a={a}, b={b} due to error: {e}")
-            B_table.at[a, b] = np.nan
+    # Populate the lookup table
+    for a in a_values:
+        for b in b_values:
+            try:
+                B_table.at[a, b] = compute_B(a, b)
+            except ValueError as e:
+                print(f"Skipping a={a}, b={b} due to error: {e}")
+                B_table.at[a, b] = np.nan
 
-# Optionally, set the index and column names for clarity.
-B_table.index.name = "a"
-B_table.columns.name = "b"
+    # Optionally, set the index and column names for clarity.
+    B_table.index.name = "a"
+    B_table.columns.name = "b"
 
-# Save the complete lookup table to a single CSV file.
-B_table.to_csv("B_table.csv")
-print("Saved the B_table to 'B_table.csv'")
+    # Save the complete lookup table to a single CSV file.
+    B_table.to_csv(filename)
+    print(f"Saved the B_table to '{filename}'")
+    return B_table
 
-def get_B(a, b, table=B_table):
+def get_B(a, b, table=None):
     """
     Retrieve B(a, b) from the precomputed B_table.
     
     Parameters:
       a (int or float): the value for a (should be between 1530 and 1565)
       b (int or float): the value for b (should be between 1530 and 1565)
-      table (DataFrame): the lookup table containing B(a,b) values.
+      table (DataFrame): the lookup table containing B(a,b) values
+                         (defaults to the saved B_table.csv).
     
     Returns:
       The B(a, b) value from the table.
@@ -94,6 +102,11 @@ def get_B(a, b, table=B_table):
     except ValueError:
         raise ValueError("Both a and b must be numeric.")
     
+    if table is None:
+        table = pd.read_csv("B_table.csv", index_col=0)
+        table.index = table.index.astype(int)
+        table.columns = table.columns.astype(int)
+
     # Retrieve from the table (note: the index and columns of the table are the a and b values)
     try:
         return table.at[int(a), int(b)]
@@ -102,11 +115,14 @@ def get_B(a, b, table=B_table):
 
 # Example usage:
 if __name__ == "__main__":
+    # Build the table for 1530..1565 (sampled by the batch profiler when enabled).
+    B_table = profiling.profile_batch("B_table_calc", build_and_save_B_table)
+
     # For example, retrieve B(1545, 1536)
     a_example = 1545
     b_example = 1536
     try:
-        result = get_B(a_example, b_example)
+        result = get_B(a_example, b_example, B_table)
         print(f"B({a_example}, {b_example}) = {result}")
     except Exception as e:
         print(e)
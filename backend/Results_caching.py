@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 import itertools
 
+import profiling
+
 def load_B_table(filename="B_table.csv"):
     """
     Load the precomputed B table from a CSV file.
@@ -115,4 +117,4 @@ def main():
     store_results_to_csv(results, filename="results.csv")
 
 if __name__ == "__main__":
-    main()
+    profiling.profile_batch("Results_caching.main", main)
@@ -0,0 +1,138 @@
+import heapq
+
+import numpy as np
+
+import strategies
+
+#############################################
+# Stateful channel allocators for one Q
+#############################################
+#
+# S(gi, Q) does not depend on which channels are in use, so for a fixed Q the
+# least-S allocation order is a fixed permutation of G. RankAllocator stores that
+# permutation once and keeps the free channels in a min-heap keyed by rank:
+# allocate() pops the smallest free rank and release() pushes it back, both
+# O(log n), with no scan of the results and no argmin. Channels taken outside the
+# allocator (reserve) are dropped lazily when they reach the top of the heap.
+#
+# StrategyAllocator offers the same interface on top of any AllocationStrategy
+# for the policies whose choice does depend on the current occupancy.
+
+
+class RankAllocator:
+    name = "least_s"
+
+    def __init__(self, ctx, CCh=()):
+        S = ctx["S"]
+        usable = np.flatnonzero(np.isfinite(S))
+        order = usable[np.argsort(S[usable], kind="stable")]  # rank -> position
+        self.G = [int(g) for g in ctx["G"]]
+        self.S = [float(S[pos]) for pos in order]            # rank -> S
+        self.channels = [self.G[pos] for pos in order]       # rank -> gi
+        self.rank_of = {gi: r for r, gi in enumerate(self.channels)}
+        self.reset(CCh)
+
+    def reset(self, CCh=()):
+        """
+        Start over with exactly the channels in CCh in use.
+        """
+        self.taken = [False] * len(self.channels)
+        self.heap = list(range(len(self.channels)))  # sorted, hence already a heap
+        self.other = []  # exclusion entries that are not candidates for this Q
+        for gi in CCh:
+            self.reserve(gi)
+
+    def allocate(self):
+        """
+        Take the free channel with the smallest S. Returns (gi, S) or None.
+        """
+        while self.heap:
+            r = heapq.heappop(self.heap)
+            if not self.taken[r]:
+                self.taken[r] = True
+                return self.channels[r], self.S[r]
+        return None
+
+    def reserve(self, gi):
+        """
+        Mark gi as in use without allocating it (e.g. entries loaded from file).
+        """
+        r = self.rank_of.get(int(gi))
+        if r is None:
+            if int(gi) not in self.other:
+                self.other.append(int(gi))
+        else:
+            self.taken[r] = True
+
+    def release(self, gi):
+        """
+        Return gi to the free pool. Unknown or already free channels are ignored.
+        """
+        r = self.rank_of.get(int(gi))
+        if r is None:
+            if int(gi) in self.other:
+                self.other.remove(int(gi))
+            return
+        if self.taken[r]:
+            self.taken[r] = False
+            heapq.heappush(self.heap, r)
+
+    def exclusion_list(self):
+        """
+        Channels in use, in the format of exclusion_list.json.
+        """
+        return self.other + [self.channels[r] for r, t in enumerate(self.taken) if t]
+
+
+class StrategyAllocator:
+    """
+    Allocator backed by an AllocationStrategy and an occupancy mask.
+    """
+
+    def __init__(self, strategy, ctx, CCh=()):
+        self.strategy = strategy
+        self.name = strategy.name
+        self.ctx = ctx
+        self.pos_of = {int(g): i for i, g in enumerate(ctx["G"])}
+        self.reset(CCh)
+
+    def reset(self, CCh=()):
+        self.occupied = np.zeros(len(self.ctx["G"]), dtype=bool)
+        self.other = []
+        for gi in CCh:
+            self.reserve(gi)
+
+    def allocate(self):
+        pos = self.strategy.select(self.ctx, self.occupied)
+        if pos is None:
+            return None
+        self.occupied[pos] = True
+        return int(self.ctx["G"][pos]), float(self.ctx["S"][pos])
+
+    def reserve(self, gi):
+        pos = self.pos_of.get(int(gi))
+        if pos is None:
+            if int(gi) not in self.other:
+                self.other.append(int(gi))
+        else:
+            self.occupied[pos] = True
+
+    def release(self, gi):
+        pos = self.pos_of.get(int(gi))
+        if pos is None:
+            if int(gi) in self.other:
+                self.other.remove(int(gi))
+        else:
+            self.occupied[pos] = False
+
+    def exclusion_list(self):
+        return self.other + [int(g) for g in self.ctx["G"][self.occupied]]
+
+
+def make_allocator(strategy, ctx, CCh=()):
+    """
+    RankAllocator for least-S, StrategyAllocator for every other strategy.
+    """
+    if isinstance(strategy, strategies.LeastS):
+        return RankAllocator(ctx, CCh)
+    return StrategyAllocator(strategy, ctx, CCh)
@@ -1,35 +1,172 @@
-from flask import Flask, request, render_template_string, redirect, url_for
-from flask_socketio import SocketIO, join_room, emit, disconnect
-import json
-from least_candidate_from_csv import (
-    get_least_S_for_Q_excluding_CCh_from_csv,
-    load_exclusion_list,
-    save_exclusion_list
-)
+from flask import Flask, request, redirect, url_for, g
+from flask_socketio import SocketIO, join_room, leave_room, emit, disconnect
+import functools
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+import chat_store
+import defrag
+import fanout
+import profiling
+import tracing
+import kernels
+import lifecycle
+import link_profiles
+import membership
+import raman
+import rate_limit
+import strategies
+import tenants
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
 socketio = SocketIO(app)
 
-# Fixed sets (do not change these by default)
+# Fixed sets (do not change these by default): Q of the default tenant.
 Q_demo = (1530, 1537, 1538)
-# Exclusion list is loaded from file on demand.
 
-# Global dictionaries for pairing and chat room management.
+# Allocation policy, selectable per deployment (least_s, first_fit, minimax).
+ALLOCATION_STRATEGY = strategies.get_strategy(os.environ.get("NND_ALLOCATION_STRATEGY", "least_s"))
+# Link profile (fiber length, launch power, ...) of each pair, see link_profiles.py.
+DEFAULT_LINK_PROFILE = os.environ.get("NND_LINK_PROFILE", "default")
+# Raman deployment mode (co, counter, both), see raman.py. "co" uses B_table.csv as before;
+# the other modes allocate on the forward + backward noise of the default link profile.
+RAMAN_MODE = raman.settings["mode"]
+# The server's kernels work on a few dozen channels, where NumPy is as fast as
+# Numba without its import and cache loading; NND_KERNEL_BACKEND overrides this.
+kernels.use_backend(os.environ.get("NND_KERNEL_BACKEND", "numpy"))
+B_G, B_matrix = kernels.load_B_matrix("B_table.csv")
+if RAMAN_MODE != "co":
+    B_forward, B_backward = raman.raman_matrices(B_G)
+    B_matrix = raman.combine(B_forward, B_backward, DEFAULT_LINK_PROFILE, RAMAN_MODE)
+
+# Live allocation state, one shard per tenant (see tenants.py): each has its own
+# Q, allocator, exclusion file and lock, and is built when first used. The
+# default tenant allocates Q_demo and keeps exclusion_list.json; its exclusion
+# file is written through on every change and only read at startup.
+tenant_shards = tenants.TenantRegistry(B_G, B_matrix, Q_demo, ALLOCATION_STRATEGY, tenants.load_config(),
+                                       raman_B=(B_forward, B_backward) if RAMAN_MODE != "co" else None)
+
+# Contexts for other Q configurations queried through the API. Q comes from the
+# client, so only the most recently used ones are kept.
+Q_CONTEXT_CACHE_SIZE = int(os.environ.get("NND_Q_CONTEXT_CACHE_SIZE", "64"))
+
+@functools.lru_cache(maxsize=Q_CONTEXT_CACHE_SIZE)
+def _prepare_Q_context(Q):
+    return strategies.prepare(B_G, B_matrix, Q)
+
+def get_Q_context(Q):
+    Q = tuple(Q)
+    for shard in tenant_shards.active():
+        if shard.Q == Q:
+            return shard.ctx
+    return _prepare_Q_context(Q)
+
+@functools.lru_cache(maxsize=Q_CONTEXT_CACHE_SIZE)
+def _prepare_raman_contexts(Q):
+    return tuple(strategies.prepare(B_G, B, Q) for B in (B_forward, B_backward))
+
+def get_raman_contexts(Q):
+    """
+    Forward and backward contexts of Q (RAMAN_MODE other than "co" only).
+    """
+    Q = tuple(Q)
+    for shard in tenant_shards.active():
+        if shard.Q == Q:
+            return shard.raman_contexts
+    return _prepare_raman_contexts(Q)
+
+# Background re-optimization of live allocations (see defrag.py).
+DEFRAG_INTERVAL = float(os.environ.get("NND_DEFRAG_INTERVAL", "0"))  # seconds, 0 disables the periodic pass
+DEFRAG_ON_RELEASE = os.environ.get("NND_DEFRAG_ON_RELEASE", "0") == "1"
+DEFRAG_APPLY = os.environ.get("NND_DEFRAG_APPLY", "0") == "1"         # otherwise moves are only proposed
+DEFRAG_BUDGET = int(os.environ.get("NND_DEFRAG_BUDGET", "1"))         # migrations per pass
+DEFRAG_OBJECTIVE = os.environ.get("NND_DEFRAG_OBJECTIVE", "noise")
+
+# Expiry in seconds (0 disables): a pending pair without its complementary request,
+# a channel lease without activity (joins, messages, 'renew'), and an assigned
+# channel nobody is connected to. The reaper checks the timer wheel every tick
+# (NND_REAPER_INTERVAL seconds, at least MIN_REAPER_INTERVAL).
+PENDING_TTL = float(os.environ.get("NND_PENDING_TTL", "600"))
+LEASE_TTL = float(os.environ.get("NND_LEASE_TTL", "3600"))
+IDLE_TIMEOUT = float(os.environ.get("NND_IDLE_TIMEOUT", "300"))
+MIN_REAPER_INTERVAL = 0.05
+REAPER_INTERVAL = max(MIN_REAPER_INTERVAL, float(os.environ.get("NND_REAPER_INTERVAL", "1")))
+expiry_timers = lifecycle.TimerWheel(
+    resolution=REAPER_INTERVAL,
+    n_slots=lifecycle.slots_for(max(PENDING_TTL, LEASE_TTL, IDLE_TIMEOUT), REAPER_INTERVAL))
+
+# Rate limits (requests per second and burst, 0 disables): pairing requests per
+# client IP and chat messages per Socket.IO sid. Pairing requests beyond
+# NND_MAX_INFLIGHT_PAIRINGS in progress at once are shed with 503.
+pairing_limiter = rate_limit.RateLimiter(float(os.environ.get("NND_PAIR_RATE", "2")),
+                                         float(os.environ.get("NND_PAIR_BURST", "10")))
+message_limiter = rate_limit.RateLimiter(float(os.environ.get("NND_MESSAGE_RATE", "10")),
+                                         float(os.environ.get("NND_MESSAGE_BURST", "30")))
+pairing_load = rate_limit.InFlightLimit(int(os.environ.get("NND_MAX_INFLIGHT_PAIRINGS", "32")))
+# Longest chat message (characters) accepted from a client.
+MAX_MESSAGE_LENGTH = int(os.environ.get("NND_MAX_MESSAGE_LENGTH", "4096"))
+
+# Global dictionaries for pairing and chat room management, changed under
+# pairs_lock. When a shard lock is also needed, pairs_lock is taken first.
+pairs_lock = threading.RLock()
 pending_pairs = {}             # pair (tuple) -> True (pending request exists)
 pair_to_channel = {}           # pair (tuple) -> assigned quantum channel (as int)
 allowed_pair_for_channel = {}  # channel (int) -> allowed pair (tuple)
-chat_logs = {}                 # channel (int) -> list of chat messages
+vacated_channels = {}          # channel moved by the last defrag pass -> its new channel
+# Optional coalesced fan-out of chat messages (see fanout.py): messages of a room are
+# sent together as one 'chat_batch' event after at most NND_CHAT_BATCH_WINDOW_MS
+# milliseconds or NND_CHAT_BATCH_MAX messages. 0 keeps one 'chat_message' per message.
+CHAT_BATCH_WINDOW = float(os.environ.get("NND_CHAT_BATCH_WINDOW_MS", "0")) / 1000
+CHAT_BATCH_MAX = int(os.environ.get("NND_CHAT_BATCH_MAX", "32"))
+chat_batcher = None
+if CHAT_BATCH_WINDOW > 0:
+    chat_batcher = fanout.ChatBatcher(lambda event, payload, room: socketio.emit(event, payload, room=room),
+                                      window=CHAT_BATCH_WINDOW, max_messages=CHAT_BATCH_MAX,
+                                      spawn=socketio.start_background_task, sleep=socketio.sleep)
+# Chat history per channel, persisted in append-only segments (see chat_store.py).
+chat_log = chat_store.ChatStore()
 
 # Global dictionary to count how many queries have been submitted for each pair.
 pair_query_count = {}          # pair (tuple) -> int
 
-# Dictionary to keep track of connection counts per channel.
-room_counts = {}
-# Map client socket id to the channel they joined.
-client_room = {}
+# Link profile name of each pair (defaults to DEFAULT_LINK_PROFILE).
+pair_profile = {}              # pair (tuple) -> profile name
+
+# Tenant of each pair, fixed by its first request.
+pair_tenant = {}               # pair (tuple) -> tenant name
 
-def process_request(a, b):
+# Which sids are in which chat channel (at most 2 per channel), see membership.py.
+channel_members = membership.ChannelMembership(capacity=2)
+
+def Q_of_channel(channel):
+    """
+    Q of the tenant a channel key belongs to (None if it is not a valid key).
+    """
+    try:
+        return tenant_shards.shard_of(channel)[0].Q
+    except (KeyError, ValueError):
+        return None
+
+class NoChannelAvailable(Exception):
+    """
+    Both sides of a pair have asked but every channel of their tenant is in use.
+    """
+
+# Seconds a client is told to wait before asking again when no channel is free.
+NO_CHANNEL_RETRY_AFTER = float(os.environ.get("NND_NO_CHANNEL_RETRY_AFTER", "30"))
+
+def _socket_context(data=None):
+    """
+    Request context stored with sampled Socket.IO handler profiles.
+    """
+    return {"sid": request.sid, "data": data}
+
+@profiling.profiled("process_request", context=lambda a, b, profile=None, tenant=None: {"a": a, "b": b, "tenant": tenant})
+@tracing.traced("process_request", attrs=lambda a, b, profile=None, tenant=None: {"a": a, "b": b, "tenant": tenant})
+def process_request(a, b, profile=None, tenant=None):
     """
     Process classical identifiers A and B.
     The pair is created by sorting (so (1,2) and (2,1) are the same).
@@ -39,8 +176,11 @@ def process_request(a, b):
     
     If this is the first query, mark the pair as pending and return (None, waiting_room).
     If a complementary query already exists (and query count is exactly 2),
-    load the exclusion list, perform the CSV lookup to assign a quantum channel,
-    update the exclusion list, store the allowed pair, and return (channel, waiting_room).
+    take a quantum channel from the tenant's allocator shard, persist its
+    exclusion list, store the allowed pair, and return (channel, waiting_room).
+    The channel is a tenant channel key (see tenants.channel_key). A pair stays
+    in the tenant of its first request; a request naming another one is rejected.
+    Raises NoChannelAvailable when both sides have asked but no channel is free.
     """
     try:
         a_int = int(a)
@@ -50,43 +190,255 @@ def process_request(a, b):
 
     pair = tuple(sorted((a_int, b_int)))
     waiting_room = f"waiting_{pair[0]}-{pair[1]}"
+    tenant = tenant or tenants.DEFAULT_TENANT
+    with pairs_lock:
+        if pair_tenant.setdefault(pair, tenant) != tenant:
+            return None, None
+        shard = tenant_shards.get(tenant)
+        tracing.set_attributes(pair=pair, Q=shard.Q)
 
-    # Increment the query count.
-    pair_query_count[pair] = pair_query_count.get(pair, 0) + 1
+        # Increment the query count.
+        pair_query_count[pair] = pair_query_count.get(pair, 0) + 1
+        if profile or pair not in pair_profile:
+            pair_profile[pair] = profile or DEFAULT_LINK_PROFILE
 
-    # If more than two queries for this pair, reject it.
-    if pair_query_count[pair] > 2:
-        return None, None
+        # If more than two queries for this pair, reject it.
+        if pair_query_count[pair] > 2:
+            return None, None
+
+        # If a channel was already assigned for this pair, return it.
+        if pair in pair_to_channel:
+            return pair_to_channel[pair], waiting_room
+
+        if pair not in pending_pairs:
+            # First query: mark the pair as pending.
+            pending_pairs[pair] = True
+            _arm(("pending", pair), PENDING_TTL)
+            return None, waiting_room
 
-    # If a channel was already assigned for this pair, return it.
-    if pair in pair_to_channel:
-        return pair_to_channel[pair], waiting_room
-
-    # If this is the second (complementary) query:
-    if pair in pending_pairs:
-        current_exclusion = load_exclusion_list()
-        result = get_least_S_for_Q_excluding_CCh_from_csv(Q_demo, current_exclusion, filename="results.csv")
-        if result:
-            gi, S = result
-            gi = int(gi)  # ensure native int
+    # Second (complementary) query. Only the tenant's shard is locked while
+    # allocating, so other tenants allocate in parallel; a third request for
+    # the pair meanwhile is rejected by its count.
+    with shard.lock:
+        with tracing.span("allocate", Q=shard.Q, strategy=shard.allocator.name):
+            result = shard.allocate()
+    with pairs_lock:
+        if not result:
+            # No free channel: the pair stays pending (its expiry timer still
+            # runs) with one request counted, so a retry allocates once a
+            # channel is released.
+            pair_query_count[pair] = 1
+        else:
+            gi = shard.channel_key(result[0])
+            tracing.set_attributes(channel=gi)
             pair_to_channel[pair] = gi
             allowed_pair_for_channel[gi] = pair
-            current_exclusion.append(gi)
-            save_exclusion_list(current_exclusion)
-            # Initialize chat log for this channel.
-            chat_logs[gi] = []
-            del pending_pairs[pair]
-            # Notify waiting clients that the channel has been assigned.
-            socketio.emit("channel_assigned", {"channel": gi}, room=waiting_room)
-            return gi, waiting_room
-        else:
-            return None, waiting_room
-    else:
-        # First query: mark the pair as pending.
-        pending_pairs[pair] = True
-        return None, waiting_room
+            # Start an empty chat log for this channel.
+            chat_log.clear(gi)
+            pending_pairs.pop(pair, None)
+            expiry_timers.cancel(("pending", pair))
+            _arm(("lease", gi), LEASE_TTL)
+            _arm(("idle", gi), IDLE_TIMEOUT)
+    if not result:
+        socketio.emit("no_channel", {"retry_after": NO_CHANNEL_RETRY_AFTER}, room=waiting_room)
+        raise NoChannelAvailable(f"No free quantum channel for pair {pair}.")
+    # Notify waiting clients that the channel has been assigned.
+    with tracing.span("emit_channel_assigned", channel=gi, room=waiting_room):
+        socketio.emit("channel_assigned", {"channel": gi}, room=waiting_room)
+    return gi, waiting_room
+
+def admitted_request(a, b, profile=None, tenant=None):
+    """
+    process_request behind the per-IP rate limit and the in-flight cap.
+
+    Returns:
+      - (channel, waiting_room, None) when the request was processed, or
+        (None, None, (reason, message, status, retry_after)) when it was turned
+        away; reason is "rate_limited", "busy" or "no_channel".
+    """
+    client = request.remote_addr
+    if not pairing_limiter.allow(client):
+        retry = pairing_limiter.retry_after(client)
+        return None, None, ("rate_limited", "Too many pairing requests; try again shortly.", 429, retry)
+    if not pairing_load.acquire():
+        return None, None, ("busy", "Server busy; try again shortly.", 503, 1.0)
+    try:
+        channel, waiting_room = process_request(a, b, profile, tenant)
+    except NoChannelAvailable:
+        return None, None, ("no_channel", "No quantum channel is free; try again later.", 503,
+                            NO_CHANNEL_RETRY_AFTER)
+    finally:
+        pairing_load.release()
+    return channel, waiting_room, None
+
+def _retry_headers(retry_after):
+    return {"Retry-After": str(max(1, int(-(-retry_after // 1))))}
+
+def _arm(key, ttl):
+    if ttl > 0:
+        expiry_timers.schedule(key, time.time() + ttl)
+
+def renew_lease(channel):
+    """
+    Extend the lease of a live channel by LEASE_TTL from now.
+    """
+    if channel in allowed_pair_for_channel:
+        _arm(("lease", channel), LEASE_TTL)
+
+def forget_pair(pair):
+    """
+    Drop everything kept for a pair that is no longer pending or live.
+    """
+    expiry_timers.cancel(("pending", pair))
+    with pairs_lock:
+        pending_pairs.pop(pair, None)
+        pair_query_count.pop(pair, None)
+        pair_profile.pop(pair, None)
+        pair_tenant.pop(pair, None)
+
+def _migrate_channel(old, new):
+    """
+    Move a live pairing from channel old to channel new (keys of one tenant) and
+    tell the room of old. Call with pairs_lock and the shard lock held.
+    """
+    shard, old_gi = tenant_shards.shard_of(old)
+    new_gi = tenants.parse_channel_key(new)[1]
+    pair = allowed_pair_for_channel.pop(old)
+    allowed_pair_for_channel[new] = pair
+    pair_to_channel[pair] = new
+    chat_log.move(old, new)
+    # The members are redirected to the new channel and join it with new sids;
+    # their entries under the old key must not count against whoever gets it next.
+    channel_members.close(old)
+    if chat_batcher is not None:
+        chat_batcher.flush(old)  # messages still waiting go out before the move notice
+    socketio.emit('channel_moved', {'old': old, 'new': new, 'url': f'/chat?channel={new}'}, room=old)
+    # The old channel stays reserved until the next pass, so late joiners of the
+    # old key are redirected too and no other pair is sent there meanwhile.
+    vacated_channels[old] = new
+    shard.allocator.reserve(new_gi)
+    # The members reconnect to the new channel, so it starts with a fresh idle timer.
+    expiry_timers.cancel(("lease", old))
+    expiry_timers.cancel(("idle", old))
+    _arm(("lease", new), LEASE_TTL)
+    _arm(("idle", new), IDLE_TIMEOUT)
+
+def live_channels(shard):
+    """
+    (gi, pair) of the assigned channels of one tenant.
+    """
+    live = []
+    with pairs_lock:
+        assigned = list(allowed_pair_for_channel.items())
+    for channel, pair in assigned:
+        tenant, gi = tenants.parse_channel_key(channel)
+        if tenant == shard.name:
+            live.append((gi, pair))
+    return live
+
+def release_channel(channel):
+    """
+    Return a channel to its tenant's allocator and persist the exclusion list.
+    """
+    shard, gi = tenant_shards.shard_of(channel)
+    shard.release(gi)
+
+def end_session(channel):
+    """
+    Close a channel: redirect its members, return it to the allocator and drop the
+    pair, chat log and timers that belong to it.
+    """
+    if chat_batcher is not None:
+        chat_batcher.flush(channel)  # before the room can belong to another pair
+    for sid in channel_members.close(channel):
+        socketio.emit('redirect', {'url': '/return'}, room=sid)
+    with pairs_lock:
+        pair = allowed_pair_for_channel.pop(channel, None)
+        if pair is not None:
+            pair_to_channel.pop(pair, None)
+            forget_pair(pair)
+    chat_log.clear(channel)
+    expiry_timers.cancel(("lease", channel))
+    expiry_timers.cancel(("idle", channel))
+    release_channel(channel)
+    if DEFRAG_ON_RELEASE:
+        socketio.start_background_task(reoptimize_allocations)
+
+def reap_expired(now=None):
+    """
+    Handle the timers that are due; the cost is proportional to the expired ones.
+    Each one is checked and handled under pairs_lock.
+    """
+    for kind, key in expiry_timers.advance(now):
+        with pairs_lock:
+            if kind == "pending":
+                if key in pair_to_channel:
+                    continue  # assigned just as the timer fired
+                if pair_query_count.get(key, 0) >= 2:
+                    # The complementary request is allocating right now; if that
+                    # fails the pair stays pending, so give it a fresh timer.
+                    _arm(("pending", key), PENDING_TTL)
+                    continue
+                if key in pending_pairs:
+                    socketio.emit('pair_expired', {}, room=f"waiting_{key[0]}-{key[1]}")
+                    print(f"Pending request for pair {key} expired")
+                forget_pair(key)
+            elif key in allowed_pair_for_channel:
+                if kind == "idle" and channel_members.count(key):
+                    continue
+                print(f"Channel {key} {'lease expired' if kind == 'lease' else 'idle'}; releasing it")
+                end_session(key)
+
+def reaper_loop():
+    last_retention = time.time()
+    while True:
+        socketio.sleep(REAPER_INTERVAL)
+        reap_expired()
+        # Batched fsync of the chat log, and its retention policy once an hour.
+        chat_log.sync()
+        if time.time() - last_retention >= 3600:
+            chat_log.enforce_retention()
+            last_retention = time.time()
+
+def reoptimize_allocations(apply=None, budget=None):
+    """
+    Evaluate every single-channel move of the live allocations to a free channel
+    and propose (or, with apply, perform) the ones with the largest gain for Q,
+    tenant by tenant (the budget applies per tenant). Moves are returned with
+    channel keys. Rooms of migrated channels are told to move with a
+    'channel_moved' event; the channels they leave are released by the next pass.
+    """
+    apply = DEFRAG_APPLY if apply is None else apply
+    budget = DEFRAG_BUDGET if budget is None else budget
+    moves = []
+    for shard in tenant_shards.active():
+        with pairs_lock, shard.lock:
+            released = [old for old in vacated_channels if tenants.parse_channel_key(old)[0] == shard.name]
+            for old in released:
+                del vacated_channels[old]
+                shard.allocator.release(tenants.parse_channel_key(old)[1])
+            current_exclusion = shard.exclusion_list()
+            live = [gi for gi, _ in live_channels(shard) if gi in current_exclusion]
+            proposed = defrag.propose_moves(shard.ctx, current_exclusion, live, budget,
+                                            objective=DEFRAG_OBJECTIVE)
+            for move in proposed:
+                move["from"], move["to"] = shard.channel_key(move["from"]), shard.channel_key(move["to"])
+            if apply:
+                for move in proposed:
+                    _migrate_channel(move["from"], move["to"])
+            if released or (apply and proposed):
+                shard.save()
+        moves.extend(proposed)
+    for move in moves:
+        print(f"Defrag {'applied' if apply else 'proposed'}: {move['from']} -> {move['to']} (gain {move['gain']:.4e})")
+    return moves
+
+def defrag_loop():
+    while True:
+        socketio.sleep(DEFRAG_INTERVAL)
+        reoptimize_allocations()
 
-# Waiting page template.
+# Waiting page template. The page scripts live in static/ and are cached by browsers.
 waiting_template = """
 <!doctype html>
 <html>
@@ -112,29 +464,8 @@ waiting_template = """
     {% if waiting_room %}
         <h3>Waiting for complementary request...</h3>
         <p>Your request is registered. Please wait until the other party submits their complementary request.</p>
-        <div id="status"></div>
-        <script>
-            var socket = io();
-            socket.emit('join_waiting', {'room': '{{ waiting_room }}'});
-            socket.on('channel_assigned', function(data) {
-                // When channel is assigned, check its current connection count.
-                fetch("/channel_status?channel=" + data.channel)
-                  .then(response => response.json())
-                  .then(json => {
-                      if (json.count < 2) {
-                          // If channel is not full, redirect to chat.
-                          window.location.href = "/chat?channel=" + data.channel;
-                      } else {
-                          // Otherwise, redirect back to the query page.
-                          document.getElementById('status').textContent = "Channel is full. Redirecting to query page...";
-                          setTimeout(function(){ window.location.href = "/"; }, 3000);
-                      }
-                  })
-                  .catch(err => {
-                      document.getElementById('status').textContent = "Error checking channel status.";
-                  });
-            });
-        </script>
+        <div id="status" data-room="{{ waiting_room }}"></div>
+        <script src="{{ static_url('waiting.js') }}"></script>
     {% endif %}
 </body>
 </html>
@@ -152,60 +483,210 @@ chat_template = """
 <body>
     <h2>Quantum Channel Chat</h2>
     <p>You have been assigned quantum channel: <strong>{{ channel }}</strong></p>
-    <div id="chat">
+    <div id="chat" data-channel="{{ channel }}">
         <ul id="messages" style="list-style-type: none; padding: 0;"></ul>
         <input id="message_input" autocomplete="off" placeholder="Type a message..." style="width:300px;">
         <button id="send_button">Send</button>
         <button id="end_button">End</button>
     </div>
-    <script>
-        var socket = io();
-        socket.emit('join', {'channel': {{ channel }}});
-        socket.emit('request_history', {'channel': {{ channel }}});
-        socket.on('chat_history', function(data) {
-            var messages = document.getElementById('messages');
-            messages.innerHTML = "";
-            data.history.forEach(function(msg) {
-                var item = document.createElement('li');
-                item.textContent = msg;
-                messages.appendChild(item);
-            });
-        });
-        socket.on('chat_message', function(data) {
-            var messages = document.getElementById('messages');
-            var item = document.createElement('li');
-            item.textContent = data.msg;
-            messages.appendChild(item);
-        });
-        document.getElementById('send_button').onclick = function() {
-            var input = document.getElementById('message_input');
-            var message = input.value.trim();
-            if (message) {
-                socket.emit('send_message', {'channel': {{ channel }}, 'msg': message});
-                input.value = '';
-            }
-        };
-        document.getElementById('end_button').onclick = () => {
-            socket.emit('end', {'channel': {{ channel }}});
-        }
-        socket.on('redirect', function(data) {
-            window.location.href = data.url;
-        });
-    </script>
+    <script src="{{ static_url('chat.js') }}"></script>
 </body>
 </html>
 """
 
+# Static files are versioned by content hash, so browsers may cache them for a long time.
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.environ.get("NND_STATIC_MAX_AGE", str(7 * 24 * 3600)))
+static_versions = {}
+
+def static_url(filename):
+    if filename not in static_versions:
+        with open(os.path.join(app.static_folder, filename), "rb") as file:
+            static_versions[filename] = hashlib.sha1(file.read()).hexdigest()[:10]
+    return url_for('static', filename=filename, v=static_versions[filename])
+
+# Templates are compiled once; rendered_pages caches pages that do not depend on the request.
+app.jinja_env.globals['static_url'] = static_url
+waiting_page = app.jinja_env.from_string(waiting_template)
+chat_page = app.jinja_env.from_string(chat_template)
+rendered_pages = {}
+
+def render_waiting(waiting_room=None, error=None):
+    if waiting_room is None and error is None:
+        if 'query' not in rendered_pages:
+            rendered_pages['query'] = waiting_page.render(waiting_room=None, error=None)
+        return rendered_pages['query']
+    return waiting_page.render(waiting_room=waiting_room, error=error)
+
+@app.before_request
+def start_request_trace():
+    g.trace_span = tracing.begin(request.endpoint or "http", method=request.method, path=request.path)
+
+@app.after_request
+def add_server_timing(response):
+    span = g.pop('trace_span', None)
+    trace = tracing.end(span)
+    header = tracing.server_timing(trace)
+    if header:
+        response.headers['Server-Timing'] = header
+    return response
+
+@app.teardown_request
+def close_request_trace(exc):
+    # Only reached with an open span when the request failed before after_request.
+    span = g.pop('trace_span', None)
+    if span is not None:
+        tracing.set_attributes(error=repr(exc))
+        tracing.end(span)
+
 # New endpoint to check channel connection count.
 @app.route('/channel_status')
 def channel_status():
     channel = request.args.get('channel')
     try:
-        channel = int(channel)
+        channel = tenant_shards.normalize_channel(channel)
     except:
         return {"error": "invalid channel"}
-    count = room_counts.get(channel, 0)
-    return {"count": count}
+    return {"count": channel_members.count(channel)}
+
+def _parse_channels(value):
+    """
+    Parse a hyphen-separated list of wavelengths such as "1530-1537-1538".
+    """
+    return tuple(int(x) for x in value.split('-') if x.strip())
+
+@app.route('/api/candidates')
+def api_candidates():
+    """
+    Read-only: the K best candidates for Q given the exclusion set, e.g.
+      /api/candidates?k=5&skr=1[&tenant=default][&Q=1530-1537-1538][&exclude=1531-1532]
+                            [&profile=lc_40km | &pair=1-2]
+    Q and the exclusion list default to those of the tenant. The SKR uses the
+    link profile given, or that of the pair, and the Raman mode. Nothing is saved.
+    """
+    try:
+        shard = tenant_shards.get(request.args.get('tenant'))
+        k = int(request.args.get('k', 5))
+        Q = _parse_channels(request.args['Q']) if 'Q' in request.args else shard.Q
+        if not Q or len(set(Q)) != len(Q):
+            raise ValueError("Q must name one or more distinct wavelengths.")
+        if 'exclude' in request.args:
+            excluded = list(_parse_channels(request.args['exclude']))
+        else:
+            with shard.lock:
+                excluded = shard.exclusion_list()
+        profile = _candidates_profile()
+        ctx = get_Q_context(Q)
+        contexts = get_raman_contexts(Q) if RAMAN_MODE != "co" else None
+    except KeyError:
+        return {"error": f"Unknown tenant '{request.args.get('tenant')}'."}, 400
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    with_skr = request.args.get('skr', '0').lower() in ('1', 'true', 'yes')
+    candidates = strategies.top_k_candidates(ctx, excluded, k, with_skr, profile, contexts, RAMAN_MODE)
+    return {"Q": list(Q), "excluded": excluded, "profile": profile, "candidates": candidates}
+
+def _candidates_profile():
+    """
+    Link profile for the SKR of /api/candidates: ?profile=, else that of ?pair=A-B,
+    else the default one. Raises ValueError for unknown profiles and pairs.
+    """
+    if 'profile' in request.args:
+        link_profiles.get_profile(request.args['profile'])
+        return request.args['profile']
+    if 'pair' in request.args:
+        pair = tuple(sorted(_parse_channels(request.args['pair'])))
+        with pairs_lock:
+            if pair not in pair_profile:
+                raise ValueError(f"Unknown pair {request.args['pair']}.")
+            return pair_profile[pair]
+    return DEFAULT_LINK_PROFILE
+
+@app.route('/api/skr')
+def api_skr():
+    """
+    Current secret key rate of a tenant's Q (?tenant=, default tenant otherwise)
+    for every live pair, each evaluated with its own link profile in one
+    vectorized call.
+    """
+    try:
+        shard = tenant_shards.get(request.args.get('tenant'))
+    except KeyError:
+        return {"error": f"Unknown tenant '{request.args.get('tenant')}'."}, 400
+    Q_context = shard.ctx
+    with pairs_lock, shard.lock:
+        in_use = shard.exclusion_list()
+        live = [(shard.channel_key(gi), pair) for gi, pair in live_channels(shard) if gi in in_use]
+        profiles = [pair_profile.get(pair, DEFAULT_LINK_PROFILE) for _, pair in live]
+    if not live:
+        return {"Q": list(shard.Q), "pairs": []}
+    occupied = strategies.occupied_mask(Q_context, in_use)
+    if RAMAN_MODE == "co":
+        noise = np.where(np.isfinite(Q_context["noise"]), Q_context["noise"], 0.0)
+        p_m = np.tile(noise[occupied].sum(axis=0), (len(live), 1))
+    else:
+        # The C_b / C_f weight of the backward noise depends on each pair's profile.
+        p_forward, p_backward = (
+            np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)[occupied].sum(axis=0) for ctx in shard.raman_contexts
+        )
+        p_m = np.stack([raman.effective_p_m(p_forward, p_backward, name, RAMAN_MODE) for name in profiles])
+    skr = link_profiles.skr_links(p_m, profiles)
+    return {
+        "Q": list(shard.Q),
+        "raman_mode": RAMAN_MODE,
+        "pairs": [
+            {"pair": list(pair), "channel": ch, "profile": name, "skr_per_q": row.tolist(), "skr_total": float(row.sum())}
+            for (ch, pair), name, row in zip(live, profiles, skr)
+        ],
+    }
+
+@app.route('/api/pair', methods=['POST'])
+def api_pair():
+    """
+    JSON version of the pairing form: {"a": 1, "b": 2, "profile": "default", "tenant": "default"}.
+    Returns the channel once both sides have asked, otherwise the waiting room.
+    202 "pending": waiting for the other side; 503 "no_channel": both sides asked
+    but no channel is free (retry after "retry_after" seconds).
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        a, b = int(data['a']), int(data['b'])
+    except (KeyError, TypeError, ValueError):
+        return {"error": "a and b must be integers"}, 400
+    profile = data.get('profile')
+    if profile is not None and profile not in link_profiles.PROFILES:
+        return {"error": f"Unknown link profile '{profile}'."}, 400
+    tenant = data.get('tenant')
+    if tenant is not None and tenant not in tenant_shards.config:
+        return {"error": f"Unknown tenant '{tenant}'."}, 400
+    channel, waiting_room, rejected = admitted_request(a, b, profile, tenant)
+    if rejected:
+        reason, message, status, retry_after = rejected
+        return ({"status": reason, "error": message, "retry_after": retry_after},
+                status, _retry_headers(retry_after))
+    if waiting_room is None:
+        return {"error": "Channel for that pair is already full."}, 409
+    if channel is None:
+        return {"status": "pending", "waiting_room": waiting_room}, 202
+    return {"status": "assigned", "channel": channel, "waiting_room": waiting_room}
+
+@app.route('/api/channel/<channel>')
+def api_channel(channel):
+    """
+    State of one channel: its pair, connected members, message count and lease.
+    """
+    try:
+        channel = tenant_shards.normalize_channel(channel)
+    except ValueError:
+        return {"error": "invalid channel"}, 400
+    pair = allowed_pair_for_channel.get(channel)
+    return {
+        "channel": channel,
+        "assigned": pair is not None,
+        "pair": list(pair) if pair else None,
+        "members": channel_members.count(channel),
+        "messages": chat_log.count(channel),
+        "lease_expires": expiry_timers.deadline(("lease", channel)),
+    }
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -213,7 +694,17 @@ def index():
     if request.method == 'POST':
         a = request.form.get('a')
         b = request.form.get('b')
-        channel, waiting_room = process_request(a, b)
+        profile = request.form.get('profile') or None
+        if profile is not None and profile not in link_profiles.PROFILES:
+            error = f"Unknown link profile '{profile}'."
+            return render_waiting(error=error)
+        tenant = request.form.get('tenant') or None
+        if tenant is not None and tenant not in tenant_shards.config:
+            return render_waiting(error=f"Unknown tenant '{tenant}'.")
+        channel, waiting_room, rejected = admitted_request(a, b, profile, tenant)
+        if rejected:
+            _, message, status, retry_after = rejected
+            return render_waiting(error=message), status, _retry_headers(retry_after)
         if channel:
             # Valid pair complete; redirect to chat.
             return redirect(url_for('chat', channel=channel))
@@ -222,114 +713,175 @@ def index():
             # it means the pair has already submitted 2 queries.
             if waiting_room is None:
                 error = "Channel for that pair is already full. Please try different identifiers."
-            return render_template_string(waiting_template, waiting_room=waiting_room, error=error)
-    return render_template_string(waiting_template, waiting_room=None, error=error)
+            return render_waiting(waiting_room, error)
+    return render_waiting(error=error)
 
 @app.route('/waiting')
 def waiting():
     room = request.args.get('room')
-    return render_template_string(waiting_template, waiting_room=room, error=None)
+    return render_waiting(room)
 
 @app.route('/return')
 def returnHome():
-    return render_template_string(waiting_template,waiting_room=None,error=None)
+    return render_waiting()
 
 @app.route('/chat')
 def chat():
     channel = request.args.get('channel')
     if channel:
-        return render_template_string(chat_template, channel=channel)
+        return chat_page.render(channel=channel)
     else:
         return redirect(url_for('index'))
 
+def _socket_channel(data):
+    """
+    Channel key of a socket event, or None (after telling the client) if it is malformed.
+    """
+    try:
+        return tenant_shards.normalize_channel(data['channel'])
+    except (KeyError, TypeError, ValueError):
+        emit('chat_message', {'msg': 'Error: Invalid channel.'})
+        return None
+
 @socketio.on('join')
+@profiling.profiled("on_join", context=_socket_context)
+@tracing.traced("on_join", attrs=lambda data: {"channel": data.get('channel'), "Q": Q_of_channel(data.get('channel'))})
 def on_join(data):
-    channel = int(data['channel'])
+    channel = _socket_channel(data)
+    if channel is None:
+        return
+    moved_to = vacated_channels.get(channel)
+    if moved_to is not None:
+        emit('channel_moved', {'old': channel, 'new': moved_to, 'url': f'/chat?channel={moved_to}'})
+        return
     # Restrict connections: only allow if fewer than 2 users are in the room.
-    if room_counts.get(channel, 0) >= 2:
+    previous = channel_members.channel(request.sid)
+    if not channel_members.join(request.sid, channel):
         emit('chat_message', {'msg': 'Error: This channel is full.'})
         disconnect()
         return
+    if previous is not None and previous != channel:
+        # join() moved the sid out of its old channel; leave that room too.
+        leave_room(previous)
+        if previous in allowed_pair_for_channel and not channel_members.count(previous):
+            _arm(("idle", previous), IDLE_TIMEOUT)
     join_room(channel)
-    room_counts[channel] = room_counts.get(channel, 0) + 1
-    client_room[request.sid] = channel
+    expiry_timers.cancel(("idle", channel))
+    renew_lease(channel)
     # Send chat history to this client.
-    if channel in chat_logs:
-        emit('chat_history', {'history': chat_logs[channel]})
+    emit('chat_history', {'history': chat_log.history(channel)})
+    if chat_batcher is not None:
+        chat_batcher.flush(channel)  # keep the notice after the messages already sent
     emit('chat_message', {'msg': f'A new user has joined quantum channel {channel}.'}, room=channel)
 
 @socketio.on('join_waiting')
+@profiling.profiled("on_join_waiting", context=_socket_context)
 def on_join_waiting(data):
     room = data['room']
     join_room(room)
 
 @socketio.on('send_message')
+@profiling.profiled("handle_message", context=_socket_context)
+@tracing.traced("handle_message", attrs=lambda data: {"channel": data.get('channel'), "Q": Q_of_channel(data.get('channel'))})
 def handle_message(data):
-    channel = int(data['channel'])
-    msg = data['msg']
-    if channel in chat_logs:
-        chat_logs[channel].append(msg)
+    channel = _socket_channel(data)
+    if channel is None:
+        return
+    msg = data.get('msg')
+    if not isinstance(msg, str) or not 0 < len(msg) <= MAX_MESSAGE_LENGTH:
+        emit('chat_message', {'msg': f'Error: Messages must be text of 1 to {MAX_MESSAGE_LENGTH} characters.'})
+        return
+    if not message_limiter.allow(request.sid):
+        emit('rate_limited', {'retry_after': message_limiter.retry_after(request.sid)})
+        return
+    chat_log.append(channel, msg)
+    renew_lease(channel)
+    if chat_batcher is not None:
+        chat_batcher.add(channel, msg)
     else:
-        chat_logs[channel] = [msg]
-    emit('chat_message', {'msg': msg}, room=channel)
+        emit('chat_message', {'msg': msg}, room=channel)
+
+@socketio.on('renew')
+def on_renew(data):
+    """
+    Explicit keep-alive from a chat client; extends the lease of its channel.
+    """
+    channel = channel_members.channel(request.sid)
+    if channel is not None:
+        renew_lease(channel)
 
 @socketio.on('request_history')
+@profiling.profiled("handle_history", context=_socket_context)
 def handle_history(data):
-    channel = int(data['channel'])
-    history = chat_logs.get(channel, [])
+    channel = _socket_channel(data)
+    if channel is None:
+        return
+    history = chat_log.history(channel)
     emit('chat_history', {'history': history})
 
 @socketio.on('disconnect')
+@profiling.profiled("on_disconnect", context=_socket_context)
 def on_disconnect():
-    sid = request.sid
-    if sid in client_room:
-        channel = client_room[sid]
-        room_counts[channel] = room_counts.get(channel, 1) - 1
-        if room_counts[channel] < 0:
-            room_counts[channel] = 0
-        del client_room[sid]
+    channel = channel_members.leave(request.sid)
+    message_limiter.forget(request.sid)
+    # A live channel nobody is connected to is released after IDLE_TIMEOUT.
+    if channel in allowed_pair_for_channel and not channel_members.count(channel):
+        _arm(("idle", channel), IDLE_TIMEOUT)
 
 @socketio.on('end')
+@profiling.profiled("on_end", context=_socket_context)
 def on_end(data):
-    sid = request.sid
-    try:
-        channel = client_room[request.sid]
-        for i in client_room:
-            print(client_room[i], channel)
-            if(client_room[i]==channel):
-                socketio.emit('redirect', {'url': '/return'}, room=i)
-        remove_number_from_json(channel)
-    except KeyError:
+    channel = channel_members.channel(request.sid)
+    if channel is None:
         print("error getting room no")
-    print("click registered on end button",client_room)
-
-def remove_number_from_json(ch):
-    try:
-        # Read the JSON file
-        with open("exclusion_list.json", 'r') as file:
-            data = json.load(file)
-
-        # Remove occurrences of the number
-        updated_data = [num for num in data if num != ch]
+        return
+    end_session(channel)
+    print(f"click registered on end button for channel {channel}")
 
-        print(len(data), len(updated_data))
+def _is_admin(data):
+    """
+    Admin events are only honoured when NND_ADMIN_TOKEN is set and matches.
+    """
+    token = os.environ.get("NND_ADMIN_TOKEN")
+    return bool(token) and data.get('token') == token
 
-        # Write back to the JSON file
-        with open("exclusion_list.json", 'w') as file:
-            json.dump(updated_data, file, indent=4)
+@socketio.on('admin_profiling')
+def on_admin_profiling(data):
+    """
+    Admin event to change profiling at runtime, e.g.
+      {'token': ..., 'request_rate': 0.05, 'batch_rate': 1, 'report': 20}
+    """
+    if not _is_admin(data):
+        emit('admin_profiling', {'error': 'unauthorized'})
+        return
+    current = profiling.configure(request_rate=data.get('request_rate'),
+                                  batch_rate=data.get('batch_rate'))
+    reply = {'settings': current}
+    if data.get('report'):
+        reply['report'] = profiling.report(top_n=int(data['report']))
+    emit('admin_profiling', reply)
 
-        print(f"Number {ch} removed successfully.")
-    except Exception as e:
-        print(f"Error: {e}")
+@socketio.on('admin_defrag')
+def on_admin_defrag(data):
+    """
+    Admin event to run a re-optimization pass now, e.g. {'token': ..., 'apply': False, 'budget': 3}
+    """
+    if not _is_admin(data):
+        emit('admin_defrag', {'error': 'unauthorized'})
+        return
+    moves = reoptimize_allocations(apply=data.get('apply'), budget=data.get('budget'))
+    emit('admin_defrag', {'moves': moves})
 
 def clear_json():
-    try:
-        with open("exclusion_list.json",'w') as file:
-            json.dump("",file,)
-    except Exception as e:
-        print(f"except -> {e}")
-    
+    """
+    Start every tenant with an empty exclusion list, on disk and in its allocator.
+    """
+    for name in tenant_shards.names():
+        tenant_shards.get(name).reset()
 
 if __name__ == '__main__':
     clear_json()
+    if DEFRAG_INTERVAL > 0:
+        socketio.start_background_task(defrag_loop)
+    socketio.start_background_task(reaper_loop)
     socketio.run(app, debug=True)
\ No newline at end of file
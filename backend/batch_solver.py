@@ -0,0 +1,148 @@
+import argparse
+import time
+
+import numpy as np
+
+import kernels
+import strategies
+
+#############################################
+# Exact optimal batch assignment
+#############################################
+#
+# Given Q, the channels already in use and n pending pairs, choose the n free
+# channels that together are best for Q:
+#
+#   objective="noise"    minimize the total noise on Q, sum of S(gi, Q).
+#                        S does not depend on the other choices, so the n
+#                        smallest S are optimal; this is solved directly.
+#   objective="min_skr"  maximize the minimum SKR over q in Q. SKR decreases
+#                        with p_m and every q uses the same SKR model, so this is
+#                        min over subsets of max_q (p_m[q] + sum noise[gi, q]),
+#                        solved by depth-first branch-and-bound.
+#
+# The bound at a node is max_q (current[q] + sum of the r smallest remaining
+# noise[., q]), computed for all q at once with np.partition. With time_limit
+# set, the search stops early and returns the best assignment found so far
+# (optimal=False), which makes it usable on larger grids.
+
+
+def _greedy_minimax(V, base, n):
+    """
+    Incumbent for branch-and-bound: add one channel at a time, always the one
+    with the smallest resulting worst-q noise.
+    """
+    chosen = []
+    current = base.copy()
+    available = np.ones(len(V), dtype=bool)
+    for _ in range(n):
+        worst = np.where(available, (current + V).max(axis=1), np.inf)
+        i = int(np.argmin(worst))
+        chosen.append(i)
+        available[i] = False
+        current += V[i]
+    return chosen, float(current.max())
+
+
+def _branch_and_bound(V, base, n, deadline):
+    """
+    Minimize max_q (base[q] + sum_{i in subset} V[i, q]) over subsets of size n.
+    Rows of V are expected in a promising order (smallest S first).
+    Returns (subset, value, optimal, nodes).
+    """
+    m = len(V)
+    best_subset, best_value = _greedy_minimax(V, base, n)
+    nodes = 0
+    optimal = True
+    # Stack entries: (next row, chosen rows, current per-q noise)
+    stack = [(0, (), base)]
+    while stack:
+        i, chosen, current = stack.pop()
+        nodes += 1
+        if deadline is not None and nodes % 256 == 0 and time.perf_counter() > deadline:
+            optimal = False
+            break
+        r = n - len(chosen)
+        if r == 0:
+            value = float(current.max())
+            if value < best_value:
+                best_subset, best_value = list(chosen), value
+            continue
+        if m - i < r:
+            continue
+        rest = V[i:]
+        smallest = np.partition(rest, r - 1, axis=0)[:r] if r < len(rest) else rest
+        if float((current + smallest.sum(axis=0)).max()) >= best_value:
+            continue
+        # Push "skip row i" first so that "take row i" is explored first.
+        stack.append((i + 1, chosen, current))
+        stack.append((i + 1, chosen + (i,), current + V[i]))
+    return best_subset, best_value, optimal, nodes
+
+
+def solve_batch(ctx, CCh, n, objective="noise", time_limit=None):
+    """
+    Choose n free channels for n pending pairs.
+
+    Parameters:
+      - ctx: per-Q context from strategies.prepare.
+      - CCh: channels already in use (the exclusion list).
+      - n: number of pending pairs.
+      - objective: "noise" (minimize total S) or "min_skr" (maximize the minimum SKR).
+      - time_limit: optional seconds for the best-effort mode of "min_skr".
+
+    Returns:
+      - dict with the chosen channels, total S, worst-q noise, minimum SKR over Q,
+        whether the result is proven optimal, nodes explored and elapsed time;
+        or None if fewer than n channels are free.
+    """
+    start = time.perf_counter()
+    occupied = strategies.occupied_mask(ctx, CCh)
+    noise = np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)
+    S = ctx["S"]
+    free = np.flatnonzero(~occupied & np.isfinite(S))
+    if n <= 0 or len(free) < n:
+        return None
+    base = noise[occupied].sum(axis=0)
+    order = free[np.argsort(S[free], kind="stable")]
+
+    if objective == "noise":
+        chosen, optimal, nodes = list(order[:n]), True, 0
+    elif objective == "min_skr":
+        deadline = start + time_limit if time_limit else None
+        subset, _, optimal, nodes = _branch_and_bound(noise[order], base, n, deadline)
+        chosen = [order[i] for i in subset]
+    else:
+        raise ValueError(f"Unknown objective '{objective}'. Use 'noise' or 'min_skr'.")
+
+    chosen = sorted(chosen, key=lambda pos: S[pos])
+    p_m = base + noise[chosen].sum(axis=0)
+    return {
+        "channels": [int(ctx["G"][pos]) for pos in chosen],
+        "total_S": float(S[chosen].sum()),
+        "max_q_noise": float(p_m.max()),
+        "min_skr": float(kernels.skr_batch(p_m).min()),
+        "optimal": optimal,
+        "nodes": nodes,
+        "elapsed_s": time.perf_counter() - start,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign channels to a batch of pending pairs.")
+    parser.add_argument("--Q", default="1530-1537-1538", help="hyphen-separated quantum channels")
+    parser.add_argument("--CCh", default="", help="hyphen-separated channels already in use")
+    parser.add_argument("-n", type=int, default=5, help="number of pending pairs")
+    parser.add_argument("--objective", default="noise", choices=["noise", "min_skr"])
+    parser.add_argument("--time-limit", type=float, default=None)
+    args = parser.parse_args()
+
+    G, B = kernels.load_B_matrix("B_table.csv")
+    Q_arg = tuple(int(q) for q in args.Q.split("-"))
+    CCh_arg = [int(x) for x in args.CCh.split("-") if x]
+    result = solve_batch(strategies.prepare(G, B, Q_arg), CCh_arg, args.n, args.objective, args.time_limit)
+    if result is None:
+        print(f"Fewer than {args.n} free channels for Q = {Q_arg} excluding {CCh_arg}")
+    else:
+        for key, value in result.items():
+            print(f"{key}: {value}")
@@ -1,58 +1,34 @@
-import pandas as pd
 import math
 import numpy as np
 
+import kernels
+from least_candidate_from_csv import get_least_S_for_Q_excluding_CCh_from_csv
+
 #############################################
-# Functions for loading and querying the results CSV
+# Functions for loading and querying the B_table
 #############################################
 
-def load_results_from_csv(filename="results.csv"):
-    """
-    Load the results CSV file into a DataFrame.
-    """
-    df = pd.read_csv(filename)
-    return df
-
-def get_least_S_for_Q_excluding_CCh_from_csv(Q, CCh, filename="results.csv"):
+def B_table_from_matrix(G, B):
     """
-    For a given Q configuration and exclusion list CCh, load the results from CSV,
-    filter for rows corresponding to Q, then return the candidate gi with the smallest S
-    that is not in Q and not in CCh.
+    Lookup table {(gi, q): B(gi, q)} for a B matrix with rows gi and columns q over G.
     """
-    Q_str = '-'.join(map(str, Q))
-    df = load_results_from_csv(filename)
-    df_Q = df[df["Q"] == Q_str]
-    exclusion_set = set(Q) | set(CCh)
-    df_filtered = df_Q[~df_Q["gi"].isin(exclusion_set)]
-    
-    if df_filtered.empty:
-        return None
-    
-    best_row = df_filtered.loc[df_filtered["S"].idxmin()]
-    gi = best_row["gi"]
-    S = best_row["S"]
-    return gi, S
-
-#############################################
-# Functions for loading and querying the B_table
-#############################################
+    G = [int(g) for g in G]
+    return {(gi, q): float(B[i, j]) for i, gi in enumerate(G) for j, q in enumerate(G)}
 
 def load_B_table(filename="B_table.csv"):
     """
-    Load the precomputed B_table from a CSV file.
+    Load the precomputed B_table from a CSV file (without pandas).
     The CSV is assumed to have rows indexed by 'a' values and columns labeled by 'b' values.
     """
-    table = pd.read_csv(filename, index_col=0)
-    table.index = table.index.astype(int)
-    table.columns = table.columns.astype(int)
-    return table
+    G, B = kernels.load_B_matrix(filename)
+    return B_table_from_matrix(G, B)
 
 def get_B_from_table(gi, q, B_table):
     """
     Retrieve B(gi, q) from the precomputed B_table.
     """
     try:
-        return float(B_table.at[int(gi), int(q)])
+        return B_table[(int(gi), int(q))]
     except KeyError:
         raise ValueError(f"B_table does not contain entry for gi={gi} and q={q}.")
 
@@ -0,0 +1,278 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+#############################################
+# Durable chat history in append-only segments
+#############################################
+#
+# Messages are appended to segment files seg_00000001.log, seg_00000002.log, ...
+# in a compact length-prefixed format:
+#
+#   record = kind (1 byte) | key length (2 bytes LE) | payload length (4 bytes LE) | key | payload
+#
+#   kind 0  message   payload = UTF-8 text
+#   kind 1  clear     the channel starts over (session ended or reassigned)
+#   kind 2  move      payload = new key (defrag moved the channel)
+#
+# The key is the channel as text. A new segment is started once the current one
+# reaches segment_bytes. Writes go to the OS immediately and are fsynced in
+# batches (every fsync_interval seconds or fsync_every records).
+#
+# In memory only a per-channel offset index is kept: for every live message
+# its (segment, payload offset, payload length) in three compact arrays.
+# history() memory-maps the segments that hold the requested range and slices
+# the payloads out of them. The index is rebuilt at startup by scanning the
+# segments, replaying clear/move records.
+#
+# Retention deletes the oldest sealed segments once they are older than
+# retention_seconds or the total size exceeds retention_bytes; index entries
+# pointing into deleted segments are dropped with them.
+
+HEADER = struct.Struct("<BHI")
+MESSAGE, CLEAR, MOVE = 0, 1, 2
+
+settings = {
+    "directory": os.environ.get("NND_CHAT_DIR", "chat_segments"),
+    "segment_bytes": int(os.environ.get("NND_CHAT_SEGMENT_BYTES", str(4 * 1024 * 1024))),
+    "fsync_interval": float(os.environ.get("NND_CHAT_FSYNC_INTERVAL", "0.5")),  # seconds
+    "fsync_every": int(os.environ.get("NND_CHAT_FSYNC_EVERY", "256")),          # records
+    "retention_seconds": float(os.environ.get("NND_CHAT_RETENTION_SECONDS", str(7 * 24 * 3600))),
+    "retention_bytes": int(os.environ.get("NND_CHAT_RETENTION_BYTES", str(1024 * 1024 * 1024))),
+}
+
+
+class ChannelIndex:
+    """
+    Locations of the messages of one channel, oldest first.
+    """
+
+    def __init__(self):
+        self.segments = array("I")
+        self.offsets = array("Q")
+        self.lengths = array("I")
+
+    def append(self, segment, offset, length):
+        self.segments.append(segment)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+
+    def drop_before(self, segment):
+        """
+        Forget the entries stored in segments older than `segment`.
+        """
+        n = 0
+        while n < len(self.segments) and self.segments[n] < segment:
+            n += 1
+        if n:
+            del self.segments[:n], self.offsets[:n], self.lengths[:n]
+
+    def __len__(self):
+        return len(self.segments)
+
+
+class ChatStore:
+
+    def __init__(self, directory=None, **overrides):
+        self.settings = {**settings, **overrides}
+        self.directory = directory or self.settings["directory"]
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = {}          # key -> ChannelIndex
+        self.maps = {}           # sealed segment id -> mmap
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        segments = self.segment_ids()
+        end = 0
+        for segment in segments:
+            end = self._replay(segment)
+        self.active = segments[-1] if segments else 1
+        if segments and end < os.path.getsize(self._path(self.active)):
+            # Cut a record torn by a crash so new appends stay readable.
+            os.truncate(self._path(self.active), end)
+        self.file = open(self._path(self.active), "ab")
+        self.enforce_retention()
+
+    #############################################
+    # Files
+    #############################################
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"seg_{segment:08d}.log")
+
+    def segment_ids(self):
+        return sorted(int(name[4:12]) for name in os.listdir(self.directory)
+                      if name.startswith("seg_") and name.endswith(".log"))
+
+    def _replay(self, segment):
+        """
+        Apply the records of a segment to the index. Returns the end of the last complete record.
+        """
+        with open(self._path(segment), "rb") as file:
+            data = file.read()
+        pos = 0
+        while pos + HEADER.size <= len(data):
+            kind, key_len, length = HEADER.unpack_from(data, pos)
+            start = pos + HEADER.size + key_len
+            if start + length > len(data):
+                break  # torn write at the end of the last segment
+            key = data[pos + HEADER.size:start].decode()
+            self._apply(kind, key, segment, start, length, data[start:start + length])
+            pos = start + length
+        return pos
+
+    def _apply(self, kind, key, segment, offset, length, payload=None):
+        if kind == MESSAGE:
+            self.index.setdefault(key, ChannelIndex()).append(segment, offset, length)
+        elif kind == CLEAR:
+            self.index.pop(key, None)
+        elif kind == MOVE:
+            moved = self.index.pop(key, None)
+            if moved is not None:
+                self.index[payload.decode()] = moved
+
+    def _write(self, kind, key, payload=b""):
+        key_bytes = str(key).encode()
+        if self.file.tell() >= self.settings["segment_bytes"]:
+            self._roll()
+        offset = self.file.tell() + HEADER.size + len(key_bytes)
+        self.file.write(HEADER.pack(kind, len(key_bytes), len(payload)) + key_bytes + payload)
+        self.file.flush()
+        self.unsynced += 1
+        if (self.unsynced >= self.settings["fsync_every"]
+                or time.monotonic() - self.last_sync >= self.settings["fsync_interval"]):
+            self._sync()
+        return offset
+
+    def _sync(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _roll(self):
+        self._sync()
+        self.file.close()
+        self.active += 1
+        self.file = open(self._path(self.active), "ab")
+        self._enforce_retention()
+
+    def _segment_view(self, segment):
+        """
+        A read-only memory map of a segment; sealed segments are mapped once.
+        """
+        if segment in self.maps:
+            return self.maps[segment]
+        with open(self._path(segment), "rb") as file:
+            view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if segment != self.active:
+            self.maps[segment] = view
+        return view
+
+    #############################################
+    # API
+    #############################################
+
+    def append(self, channel, msg):
+        payload = msg.encode()
+        with self.lock:
+            offset = self._write(MESSAGE, channel, payload)
+            self.index.setdefault(str(channel), ChannelIndex()).append(self.active, offset, len(payload))
+
+    def clear(self, channel):
+        """
+        Start the channel's history over (the old messages stay until retention).
+        """
+        with self.lock:
+            if str(channel) in self.index:
+                self._write(CLEAR, channel)
+                del self.index[str(channel)]
+
+    def move(self, old, new):
+        """
+        Carry the history of channel old over to channel new.
+        """
+        with self.lock:
+            self._write(CLEAR, new)
+            self.index.pop(str(new), None)
+            if str(old) in self.index:
+                self._write(MOVE, old, str(new).encode())
+                self.index[str(new)] = self.index.pop(str(old))
+
+    def count(self, channel):
+        entries = self.index.get(str(channel))
+        return len(entries) if entries else 0
+
+    def history(self, channel, limit=None):
+        """
+        Messages of a channel, oldest first (only the last `limit` if given).
+        """
+        with self.lock:
+            entries = self.index.get(str(channel))
+            if not entries:
+                return []
+            start = 0 if limit is None else max(0, len(entries) - int(limit))
+            self.file.flush()
+            messages = []
+            view, current = None, None
+            for i in range(start, len(entries)):
+                segment = entries.segments[i]
+                if segment != current:
+                    if view is not None and current == self.active:
+                        view.close()
+                    view, current = self._segment_view(segment), segment
+                offset = entries.offsets[i]
+                messages.append(view[offset:offset + entries.lengths[i]].decode())
+            if view is not None and current == self.active:
+                view.close()
+            return messages
+
+    def sync(self):
+        """
+        fsync pending writes now (called periodically and at shutdown).
+        """
+        with self.lock:
+            self._sync()
+
+    def enforce_retention(self, now=None):
+        with self.lock:
+            return self._enforce_retention(now)
+
+    def _enforce_retention(self, now=None):
+        """
+        Delete the oldest sealed segments past the age or total size limit.
+        Returns the ids of the deleted segments.
+        """
+        now = time.time() if now is None else now
+        sealed = [s for s in self.segment_ids() if s != self.active]
+        sizes = {s: os.path.getsize(self._path(s)) for s in sealed}
+        total = sum(sizes.values()) + self.file.tell()
+        deleted = []
+        for segment in sealed:
+            too_old = now - os.path.getmtime(self._path(segment)) > self.settings["retention_seconds"]
+            if not too_old and total <= self.settings["retention_bytes"]:
+                break
+            view = self.maps.pop(segment, None)
+            if view is not None:
+                view.close()
+            os.remove(self._path(segment))
+            total -= sizes[segment]
+            deleted.append(segment)
+        if deleted:
+            keep_from = deleted[-1] + 1
+            for key in list(self.index):
+                self.index[key].drop_before(keep_from)
+                if not len(self.index[key]):
+                    del self.index[key]
+        return deleted
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self.file.close()
+            for view in self.maps.values():
+                view.close()
+            self.maps.clear()
@@ -0,0 +1,361 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+
+import kernels
+import results_index
+
+#############################################
+# Reference-vs-fast conformance harness
+#############################################
+#
+# The existing pure-Python/pandas code is the reference:
+#   B        B_table_calc.compute_B (cell by cell)
+#   S        Results_caching.compute_sorted_sums_for_Q (36-channel grid)
+#            candidatenkeyrate.compute_S_for_candidate (random grids)
+#   lookup   golden answers of the original (pandas) least_candidate_from_csv lookup
+#   SKR      candidatenkeyrate.SKR
+# and every registered implementation is compared against it on the full
+# 36-wavelength space plus randomized larger grids.
+#
+# Argmin ties are compared deterministically: every candidate whose reference S
+# is within tolerance of the minimum is in the tie set, the canonical answer is
+# the lowest wavelength in it, and a fast answer elsewhere in the tie set is
+# counted as a tie, not a mismatch.
+
+IMPLEMENTATIONS = {
+    "numpy": {
+        "B": kernels.NUMPY_KERNELS["compute_B_matrix"],  # (a_values, b_values, y_lookup) -> matrix
+        "S": kernels.NUMPY_KERNELS["S_for_Q"],           # (G, Q, B) -> S over G, inf for gi in Q
+        "argmin": kernels.NUMPY_KERNELS["least_S"],      # (S_row, excluded mask) -> (pos, S) or None
+        "skr": kernels.NUMPY_KERNELS["skr_batch"],       # (p_m array) -> SKR array
+    },
+}
+
+
+def register(name, implementation):
+    """
+    Register an accelerated implementation (a dict with any of the keys above).
+    Missing keys fall back to the NumPy kernels.
+    """
+    IMPLEMENTATIONS[name] = {**IMPLEMENTATIONS["numpy"], **implementation}
+
+
+try:
+    _numba = kernels.load_backend("numba")
+except ImportError:
+    pass
+else:
+    register("numba", {"B": _numba["compute_B_matrix"], "S": _numba["S_for_Q"],
+                       "argmin": _numba["least_S"], "skr": _numba["skr_batch"]})
+
+
+#############################################
+# Comparison helpers
+#############################################
+
+def _new_result(check):
+    return {
+        "check": check, "cases": 0, "values": 0, "failures": 0,
+        "pattern_mismatches": 0, "argmin_mismatches": 0, "argmin_ties": 0,
+        "worst_abs": 0.0, "worst_rel": 0.0, "worst_case": None, "skipped": False,
+    }
+
+
+def compare_values(result, case, ref, fast, rtol, atol):
+    """
+    Compare two arrays elementwise and fold the deviations into result.
+    inf/nan must appear in the same places; finite values must satisfy
+    |fast - ref| <= atol + rtol * |ref|.
+    """
+    ref = np.asarray(ref, dtype=float)
+    fast = np.asarray(fast, dtype=float)
+    result["cases"] += 1
+    result["values"] += ref.size
+    if ref.shape != fast.shape:
+        result["failures"] += 1
+        result["worst_case"] = f"{case}: shape {fast.shape} != {ref.shape}"
+        return
+
+    pattern = (np.isnan(ref) != np.isnan(fast)) | (np.isinf(ref) != np.isinf(fast))
+    pattern |= np.isinf(ref) & np.isinf(fast) & (np.sign(ref) != np.sign(fast))
+    result["pattern_mismatches"] += int(pattern.sum())
+
+    both = np.isfinite(ref) & np.isfinite(fast)
+    with np.errstate(invalid="ignore"):
+        abs_dev = np.where(both, np.abs(fast - ref), 0.0)
+        rel_dev = np.where(both & (ref != 0), abs_dev / np.where(ref != 0, np.abs(ref), 1.0), 0.0)
+        bad = both & (abs_dev > atol + rtol * np.abs(ref))
+    result["failures"] += int(bad.sum()) + int(pattern.sum())
+
+    if abs_dev.size and rel_dev.max() >= result["worst_rel"]:
+        i = np.unravel_index(int(np.argmax(rel_dev)), rel_dev.shape)
+        result["worst_rel"] = float(rel_dev[i])
+        result["worst_case"] = f"{case} at {tuple(int(x) for x in i)}: ref={ref[i]!r} fast={fast[i]!r}"
+    if abs_dev.size:
+        result["worst_abs"] = max(result["worst_abs"], float(abs_dev.max()))
+
+
+def compare_argmin(result, ref_values, fast_pos, rtol, atol, excluded=None):
+    """
+    Check a fast argmin against the reference S values using the tie rule above.
+    """
+    ref = np.asarray(ref_values, dtype=float)
+    if excluded is not None:
+        ref = np.where(excluded, np.inf, ref)
+    finite = np.isfinite(ref)
+    if not finite.any():
+        if fast_pos is not None:
+            result["argmin_mismatches"] += 1
+        return
+    if fast_pos is None:
+        result["argmin_mismatches"] += 1
+        return
+    m = ref[finite].min()
+    tie_set = np.flatnonzero(finite & (ref <= m + max(atol, rtol * abs(m))))
+    if fast_pos == tie_set[0]:
+        return
+    if fast_pos in tie_set:
+        result["argmin_ties"] += 1
+    else:
+        result["argmin_mismatches"] += 1
+
+
+#############################################
+# Grids
+#############################################
+
+def random_grid(rng, size=60, low=1500, high=1620, missing=0.02, lambda_ref=1550):
+    """
+    A random wavelength grid with a random spectrum covering every λ_del it needs.
+    A small fraction of spectrum entries is dropped to exercise the nan path.
+    """
+    G = np.sort(rng.choice(np.arange(low, high + 1), size=size, replace=False))
+    a = G[:, None].astype(float)
+    b = G[None, :].astype(float)
+    with np.errstate(divide="ignore"):
+        lambda_del = np.floor(1 / (1 / lambda_ref - 1 / a + 1 / b))
+    lambda_del = lambda_del[np.isfinite(lambda_del)]
+    keys = np.arange(int(lambda_del.min()) - 1, int(lambda_del.max()) + 2)
+    keys = keys[rng.random(len(keys)) >= missing]
+    values = rng.uniform(1e-9, 5e-9, size=len(keys))
+    return [int(g) for g in G], {int(k): float(v) for k, v in zip(keys, values)}
+
+
+def reference_B(a_values, b_values, lookup):
+    """
+    B matrix from B_table_calc.compute_B, nan where the reference raises.
+    """
+    import B_table_calc
+
+    B = np.empty((len(a_values), len(b_values)))
+    for i, a in enumerate(a_values):
+        for j, b in enumerate(b_values):
+            try:
+                B[i, j] = B_table_calc.compute_B(a, b, lookup)
+            except ValueError:
+                B[i, j] = np.nan
+    return B
+
+
+#############################################
+# Checks
+#############################################
+
+def check_B(impl, grids, rtol, atol):
+    result = _new_result("B matrix")
+    for name, G, lookup in grids:
+        ref = reference_B(G, G, lookup)
+        fast = impl["B"](G, G, lookup)
+        compare_values(result, name, ref, fast, rtol, atol)
+    return result
+
+
+def check_S(impl, rtol, atol, random_grids, rng, samples_per_grid=200, B_file="B_table.csv", max_q=4):
+    """
+    S vectors and their argmin: every Q of size 1..max_q on the 36-wavelength grid,
+    plus sampled Q on the random grids.
+    """
+    result = _new_result("S(gi, Q) and argmin")
+
+    # Full 36-wavelength space against Results_caching.
+    import Results_caching
+
+    G36 = [int(g) for g in Results_caching.row_values]
+    _, B_fast = kernels.load_B_matrix(B_file)
+    for k in range(1, max_q + 1):
+        for Q in itertools.combinations(G36, k):
+            ref = np.full(len(G36), np.inf)
+            for gi, S in Results_caching.compute_sorted_sums_for_Q(G36, Q):
+                ref[G36.index(gi)] = S
+            fast = impl["S"](G36, Q, B_fast)
+            compare_values(result, f"G36 Q={Q}", ref, fast, rtol, atol)
+            best = impl["argmin"](np.asarray(fast), None)
+            compare_argmin(result, ref, None if best is None else best[0], rtol, atol)
+
+    # Random grids against candidatenkeyrate.compute_S_for_candidate.
+    from candidatenkeyrate import B_table_from_matrix, compute_S_for_candidate
+
+    for name, G, lookup in random_grids:
+        B = reference_B(G, G, lookup)
+        table = B_table_from_matrix(G, B)
+        for _ in range(samples_per_grid):
+            k = int(rng.integers(1, max_q + 1))
+            Q = tuple(sorted(int(q) for q in rng.choice(G, size=k, replace=False)))
+            ref = np.array([np.inf if gi in Q else compute_S_for_candidate(gi, Q, table) for gi in G])
+            fast = impl["S"](G, Q, B)
+            compare_values(result, f"{name} Q={Q}", ref, fast, rtol, atol)
+            excluded = rng.random(len(G)) < 0.3
+            best = impl["argmin"](np.asarray(fast), excluded)
+            compare_argmin(result, ref, None if best is None else best[0], rtol, atol, excluded)
+    return result
+
+
+def check_lookup(samples, rtol, atol, golden_file="lookup_golden.json", results_csv="results.csv",
+                 index_file="results_index.npy", B_file="B_table.csv"):
+    """
+    The lookups against golden answers recorded with the original pandas loader
+    of least_candidate_from_csv: the index lookup, and the CSV lookup both through
+    the index and by scanning results.csv. Without results.csv an index computed
+    from B_file is checked instead; the check is only skipped when neither file
+    exists. Uses at most `samples` golden cases.
+    """
+    from least_candidate_from_csv import get_least_S_for_Q_excluding_CCh_from_csv
+
+    result = _new_result("results lookup")
+    with open(golden_file) as file:
+        cases = json.load(file)["cases"][:samples]
+    if os.path.exists(results_csv):
+        index = results_index.load_or_build_index(index_file, results_csv)
+        lookups = {
+            "index": lambda Q, CCh: results_index.get_least_S_from_index(index, Q, CCh),
+            "csv+index": lambda Q, CCh: get_least_S_for_Q_excluding_CCh_from_csv(Q, CCh, results_csv, index_file),
+            "csv scan": lambda Q, CCh: get_least_S_for_Q_excluding_CCh_from_csv(Q, CCh, results_csv, None),
+        }
+    elif os.path.exists(B_file):
+        G, B = kernels.load_B_matrix(B_file)
+        max_q = results_index.MAX_Q_SIZE
+        index = {"G": [int(g) for g in G], "max_q": max_q, "S": results_index.compute_S_index(G, B, max_q)}
+        lookups = {"index from B table": lambda Q, CCh: results_index.get_least_S_from_index(index, Q, CCh)}
+    else:
+        result["skipped"] = True
+        result["worst_case"] = f"skipped: neither {results_csv} nor {B_file} found"
+        return result
+    for case in cases:
+        Q, CCh = tuple(case["Q"]), case["CCh"]
+        for name, lookup in lookups.items():
+            fast = lookup(Q, CCh)
+            if case["gi"] is None or fast is None:
+                result["cases"] += 1
+                if (case["gi"] is None) != (fast is None):
+                    result["argmin_mismatches"] += 1
+                continue
+            compare_values(result, f"{name} Q={Q} CCh={CCh}", [case["S"]], [fast[1]], rtol, atol)
+            if case["gi"] != int(fast[0]):
+                # Same answer up to a tie in S is accepted.
+                if abs(case["S"] - fast[1]) <= max(atol, rtol * abs(case["S"])):
+                    result["argmin_ties"] += 1
+                else:
+                    result["argmin_mismatches"] += 1
+    return result
+
+
+def check_identical(impl, grids, rng, samples_per_grid=200, max_q=4):
+    """
+    An accelerated backend must reproduce the NumPy kernels exactly: same values
+    bit for bit, same inf/nan pattern and the same argmin position.
+    """
+    numpy_impl = IMPLEMENTATIONS["numpy"]
+    result = _new_result("identical to numpy")
+    for name, G, lookup in grids:
+        B = numpy_impl["B"](G, G, lookup)
+        compare_values(result, f"{name} B", B, impl["B"](G, G, lookup), 0.0, 0.0)
+        for _ in range(samples_per_grid):
+            k = int(rng.integers(1, max_q + 1))
+            Q = tuple(sorted(int(q) for q in rng.choice(G, size=k, replace=False)))
+            ref = numpy_impl["S"](G, Q, B)
+            compare_values(result, f"{name} Q={Q}", ref, impl["S"](G, Q, B), 0.0, 0.0)
+            excluded = rng.random(len(G)) < 0.3
+            if numpy_impl["argmin"](ref, excluded) != impl["argmin"](ref, excluded):
+                result["argmin_mismatches"] += 1
+    p_m = np.concatenate([[0.0], np.logspace(-12, -1, 200), rng.uniform(0, 1e-3, 500)])
+    compare_values(result, "SKR p_m grid", numpy_impl["skr"](p_m), impl["skr"](p_m), 0.0, 0.0)
+    return result
+
+
+def check_skr(impl, rng, rtol, atol, n_random=500):
+    from candidatenkeyrate import SKR
+
+    result = _new_result("SKR")
+    p_m = np.concatenate([[0.0], np.logspace(-12, -1, 200), rng.uniform(0, 1e-3, n_random)])
+    with contextlib.redirect_stdout(io.StringIO()), np.errstate(all="ignore"):
+        ref = np.array([SKR(x) for x in p_m], dtype=float)
+    fast = impl["skr"](p_m)
+    compare_values(result, "p_m grid", ref, fast, rtol, atol)
+    return result
+
+
+def run(impl_name="numpy", random_grids=3, grid_size=60, seed=0, rtol=1e-12, atol=0.0,
+        skr_rtol=1e-9, lookups=24, max_q=4):
+    """
+    Run every check for one implementation and return the list of results.
+    """
+    impl = IMPLEMENTATIONS[impl_name]
+    rng = np.random.default_rng(seed)
+
+    import B_table_calc
+
+    grid36 = ("G36", list(range(1530, 1566)), B_table_calc.y_lookup)
+    randoms = []
+    for i in range(random_grids):
+        G, lookup = random_grid(rng, size=grid_size)
+        randoms.append((f"random{i}[{len(G)}]", G, lookup))
+
+    results = [
+        check_B(impl, [grid36] + randoms, rtol, atol),
+        check_S(impl, rtol, atol, randoms, rng, max_q=max_q),
+        check_lookup(lookups, rtol, atol),
+        check_skr(impl, rng, skr_rtol, atol),
+    ]
+    if impl_name != "numpy":
+        results.append(check_identical(impl, [grid36] + randoms, rng, max_q=max_q))
+    for r in results:
+        r["passed"] = not (r["skipped"] or r["failures"] or r["pattern_mismatches"] or r["argmin_mismatches"])
+    return results
+
+
+def print_results(impl_name, results):
+    print(f"Conformance of '{impl_name}' against the reference implementations")
+    for r in results:
+        status = "SKIP" if r["skipped"] else "PASS" if r["passed"] else "FAIL"
+        print(f"[{status}] {r['check']}: {r['cases']} cases, {r['values']} values, "
+              f"worst abs {r['worst_abs']:.3e}, worst rel {r['worst_rel']:.3e}, "
+              f"failures {r['failures']}, inf/nan mismatches {r['pattern_mismatches']}, "
+              f"argmin mismatches {r['argmin_mismatches']} (ties {r['argmin_ties']})")
+        if r["worst_case"]:
+            print(f"       worst: {r['worst_case']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare accelerated kernels against the reference implementations.")
+    parser.add_argument("--impl", default="numpy", choices=sorted(IMPLEMENTATIONS))
+    parser.add_argument("--random-grids", type=int, default=3)
+    parser.add_argument("--grid-size", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rtol", type=float, default=1e-12)
+    parser.add_argument("--atol", type=float, default=0.0)
+    parser.add_argument("--skr-rtol", type=float, default=1e-9)
+    parser.add_argument("--lookups", type=int, default=24)
+    parser.add_argument("--max-q", type=int, default=4)
+    args = parser.parse_args()
+
+    results = run(args.impl, args.random_grids, args.grid_size, args.seed, args.rtol, args.atol,
+                  args.skr_rtol, args.lookups, args.max_q)
+    print_results(args.impl, results)
+    sys.exit(0 if all(r["passed"] for r in results) else 1)
@@ -0,0 +1,79 @@
+import numpy as np
+
+import strategies
+
+#############################################
+# Spectrum defragmentation
+#############################################
+#
+# After releases, a live classical channel may sit on a wavelength that is worse
+# for Q than one that has since become free. For every (live channel c, free
+# channel f) the gain of moving c to f is evaluated in one array computation:
+#
+#   objective="noise"    gain[c, f] = S[c] - S[f]
+#   objective="minimax"  gain[c, f] = max_q p_m - max_q (p_m - noise[c] + noise[f])
+#
+# Moves are chosen greedily (largest gain first) up to a migration budget,
+# re-evaluating the gains after each accepted move. A channel vacated by a move
+# is not a target for the rest of the pass; app.py also keeps it reserved until
+# the next pass, so its members are redirected before anyone else can get it.
+
+
+def move_gains(ctx, occupied, movable, objective="noise", blocked=None):
+    """
+    Gain matrix for moving each movable occupied channel to each free channel
+    that is not blocked. Returns (sources, targets, gains) with gains of shape
+    (len(sources), len(targets)).
+    """
+    S = ctx["S"]
+    sources = np.flatnonzero(occupied & movable)
+    free = ~occupied if blocked is None else ~occupied & ~blocked
+    targets = np.flatnonzero(free & np.isfinite(S))
+    if not len(sources) or not len(targets):
+        return sources, targets, np.empty((len(sources), len(targets)))
+
+    if objective == "noise":
+        gains = S[sources][:, None] - S[targets][None, :]
+    elif objective == "minimax":
+        noise = np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)
+        p_m = noise[occupied].sum(axis=0)
+        after = p_m[None, None, :] - noise[sources][:, None, :] + noise[targets][None, :, :]
+        gains = p_m.max() - after.max(axis=2)
+    else:
+        raise ValueError(f"Unknown objective '{objective}'. Use 'noise' or 'minimax'.")
+    return sources, targets, gains
+
+
+def propose_moves(ctx, CCh, movable_channels, budget=1, min_gain=0.0, objective="noise"):
+    """
+    Propose up to `budget` single-channel moves with positive gain.
+
+    Parameters:
+      - ctx: per-Q context from strategies.prepare.
+      - CCh: channels currently in use (the exclusion list).
+      - movable_channels: the live channels that may be migrated; other entries
+                          of CCh stay where they are.
+      - budget: maximum number of migrations.
+      - min_gain: only moves with a gain above this are proposed.
+
+    Returns:
+      - list of {"from": gi, "to": gi, "gain": float}, in the order to apply them.
+    """
+    occupied = strategies.occupied_mask(ctx, CCh)
+    movable = strategies.occupied_mask(ctx, movable_channels)
+    vacated = np.zeros_like(occupied)
+    G = ctx["G"]
+    moves = []
+    for _ in range(budget):
+        sources, targets, gains = move_gains(ctx, occupied, movable, objective, blocked=vacated)
+        if not gains.size:
+            break
+        i, j = np.unravel_index(int(np.argmax(gains)), gains.shape)
+        if not gains[i, j] > min_gain:
+            break
+        src, dst = sources[i], targets[j]
+        moves.append({"from": int(G[src]), "to": int(G[dst]), "gain": float(gains[i, j])})
+        occupied[src], occupied[dst] = False, True
+        movable[src], movable[dst] = False, False  # move each channel at most once per pass
+        vacated[src] = True  # and never into a channel vacated in this pass
+    return moves
@@ -1,9 +1,12 @@
 import pandas as pd
+import numpy as np
+import argparse
 import itertools
+import math
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
-# Import the CSV-based candidate function from the separate module.
-from least_candidate_from_csv import get_least_S_for_Q_excluding_CCh_from_csv
+import results_index
 
 def load_results_df(filename="results.csv"):
     """
@@ -31,44 +34,141 @@ def get_first_fit_candidate(Q, CCh, df_all):
                 return candidate, S_val
     return None
 
+#############################################
+# Vectorized equivalence checker: least-S vs. first-fit for every (Q, CCh)
+#############################################
+
+# Per-worker state (the index is memory-mapped once per process).
+_worker = {}
+
+def _init_worker(index_file):
+    _worker["index"] = results_index.load_index(index_file)
+    _worker["combos"] = {}
+
+def _cch_combinations(m, size):
+    """
+    All CCh of the given size as positions into the m available candidates (cached).
+    """
+    key = (m, size)
+    if key not in _worker["combos"]:
+        _worker["combos"][key] = np.array(list(itertools.combinations(range(m), size)), dtype=np.intp)
+    return _worker["combos"][key]
+
+def check_Q_shard(shard):
+    """
+    Check every Q in the shard against every CCh of size 1..max_cch at once.
+
+    For one Q the S row restricted to the available candidates is broadcast to one
+    row per CCh, the CCh positions are masked with inf, and argmin gives the
+    least-S answer. First fit is the highest available position not in CCh.
+
+    Parameters:
+      - shard: (size_Q, start, count, max_cch, max_examples) - a slice of the Q of
+               one size, in itertools.combinations order.
+
+    Returns:
+      - dict with the number of checked pairs, mismatch counts per (|Q|, |CCh|)
+        and up to max_examples mismatch examples.
+    """
+    size_Q, start, count, max_cch, max_examples = shard
+    index = _worker["index"]
+    G = np.asarray(index["G"])
+    n = len(G)
+    S = index["S"]
+    row0 = results_index.block_offsets(n, index["max_q"])[size_Q] + start
+
+    checked = 0
+    counts = {}
+    examples = []
+    Q_iter = itertools.islice(itertools.combinations(range(n), size_Q), start, start + count)
+    for r, Q_pos in enumerate(Q_iter):
+        s = np.asarray(S[row0 + r])
+        available = np.setdiff1d(np.arange(n), Q_pos)  # ascending wavelength order
+        s_av = s[available]
+        m = len(available)
+        for size_CCh in range(1, max_cch + 1):
+            combos = _cch_combinations(m, size_CCh)
+            c = len(combos)
+            rows = np.arange(c)[:, None]
+
+            masked = np.broadcast_to(s_av, (c, m)).copy()
+            masked[rows, combos] = np.inf
+            least = np.argmin(masked, axis=1)
+            least_none = np.isinf(masked[np.arange(c), least])
+
+            free = np.ones((c, m), dtype=bool)
+            free[rows, combos] = False
+            first_fit = m - 1 - np.argmax(free[:, ::-1], axis=1)
+            first_fit_none = ~free.any(axis=1)
+
+            bad = (least != first_fit) | (least_none != first_fit_none)
+            checked += c
+            n_bad = int(bad.sum())
+            if not n_bad:
+                continue
+            counts[(size_Q, size_CCh)] = counts.get((size_Q, size_CCh), 0) + n_bad
+            for i in np.flatnonzero(bad)[:max(0, max_examples - len(examples))]:
+                examples.append({
+                    "Q": tuple(int(G[p]) for p in Q_pos),
+                    "CCh": tuple(int(G[available[p]]) for p in combos[i]),
+                    "least_S": None if least_none[i] else (int(G[available[least[i]]]), float(s_av[least[i]])),
+                    "first_fit": None if first_fit_none[i] else (int(G[available[first_fit[i]]]), float(s_av[first_fit[i]])),
+                })
+    return {"checked": checked, "counts": counts, "examples": examples}
+
+def make_shards(n, max_q, max_cch, shard_size=500, max_examples=10):
+    """
+    Split all Q (sizes 1..max_q) into shards of at most shard_size Q each.
+    """
+    shards = []
+    for size_Q in range(1, max_q + 1):
+        total = math.comb(n, size_Q)
+        for start in range(0, total, shard_size):
+            shards.append((size_Q, start, min(shard_size, total - start), max_cch, max_examples))
+    return shards
+
+def run_check(index_file="results_index.npy", results_csv="results.csv", max_cch=3,
+              workers=None, max_examples=10, shard_size=500):
+    """
+    Check every Q against every CCh of size 1..max_cch in a process pool and
+    return the aggregated report (all mismatches are counted, not only the first).
+    """
+    index = results_index.load_or_build_index(index_file, results_csv)
+    shards = make_shards(len(index["G"]), index["max_q"], max_cch, shard_size, max_examples)
+
+    report = {"checked": 0, "mismatches": 0, "counts": {}, "examples": []}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(index_file,)) as pool:
+        for part in pool.map(check_Q_shard, shards, chunksize=4):
+            report["checked"] += part["checked"]
+            for key, value in part["counts"].items():
+                report["counts"][key] = report["counts"].get(key, 0) + value
+                report["mismatches"] += value
+            room = max_examples - len(report["examples"])
+            report["examples"].extend(part["examples"][:max(0, room)])
+    return report
+
+def print_report(report):
+    print(f"Checked {report['checked']} (Q, CCh) combinations, {report['mismatches']} mismatches.")
+    for (size_Q, size_CCh), count in sorted(report["counts"].items()):
+        print(f"  |Q| = {size_Q}, |CCh| = {size_CCh}: {count} mismatches")
+    for ex in report["examples"]:
+        print(f"  Q = {ex['Q']}, CCh = {ex['CCh']}: least S -> {ex['least_S']}, first fit -> {ex['first_fit']}")
+    if not report["mismatches"]:
+        print("All combinations produced matching results.")
+
 def main():
-    # Define candidate set G.
-    G = list(range(1530, 1566))
-    
-    # Load the CSV results DataFrame.
-    df_all = load_results_df("results.csv")
-    
-    # Iterate over all Q combinations (sizes 1 to 4).
-    for size_Q in range(1, 5):
-        for Q in itertools.combinations(G, size_Q):
-            # For each Q, define available candidates for CCh (exclude those in Q).
-            available_for_CCh = set(G) - set(Q)
-            # For CCh, consider combinations of sizes 1 to 3 from available candidates.
-            for size_CCh in range(1, 4):
-                for CCh in itertools.combinations(available_for_CCh, size_CCh):
-                    # Get candidate from the CSV-based function.
-                    result_csv = get_least_S_for_Q_excluding_CCh_from_csv(Q, CCh, filename="results.csv")
-                    # Get candidate from the first fit algorithm.
-                    result_first_fit = get_first_fit_candidate(Q, CCh, df_all)
-                    # print(Q,result_csv,result_first_fit)
-                    # Compare the results. If they differ, print details and break.
-                    if result_csv != result_first_fit:
-                        print("Mismatch found!")
-                        print("Q configuration:", Q)
-                        print("Exclusion list (CCh):", CCh)
-                        if result_csv:
-                            print("CSV function returns: gi = {}, S = {}".format(result_csv[0], result_csv[1]))
-                        else:
-                            print("CSV function returns: None")
-                        
-                        if result_first_fit:
-                            print("First fit algorithm returns: gi = {}, S = {}".format(result_first_fit[0], result_first_fit[1]))
-                        else:
-                            print("First fit algorithm returns: None")
-                        
-                        sys.exit(0)
-    
-    print("All combinations produced matching results.")
+    parser = argparse.ArgumentParser(description="Compare least-S and first-fit allocation for every (Q, CCh).")
+    parser.add_argument("--index", default="results_index.npy")
+    parser.add_argument("--results", default="results.csv")
+    parser.add_argument("--max-cch", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--examples", type=int, default=10)
+    args = parser.parse_args()
+
+    report = run_check(args.index, args.results, args.max_cch, args.workers, args.examples)
+    print_report(report)
+    sys.exit(1 if report["mismatches"] else 0)
 
 if __name__ == "__main__":
     main()
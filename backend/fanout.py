@@ -0,0 +1,65 @@
+import threading
+import time
+
+#############################################
+# Coalesced chat fan-out
+#############################################
+#
+# Instead of one 'chat_message' event per message, messages for a room are
+# collected for at most `window` seconds (or until `max_messages` are waiting)
+# and sent as one 'chat_batch' event {'messages': [...]}. A burst of N messages
+# then costs one serialization and one transport write per receiver instead of N.
+#
+# The first message of a batch starts a flush timer; reaching max_messages
+# flushes at once. Batches are taken and emitted under one lock, so a room's
+# messages always arrive in the order they were added, across batches too.
+
+
+class ChatBatcher:
+
+    def __init__(self, emit, window=0.01, max_messages=32, spawn=None, sleep=None):
+        """
+        Parameters:
+          - emit: emit(event, payload, room) used to send a batch.
+          - window: longest time (seconds) a message waits for others.
+          - max_messages: batch size that is sent without waiting for the window.
+          - spawn, sleep: start a background task / sleep in it (threads by
+            default; app.py passes socketio's so the timers follow its async mode).
+        """
+        self.emit = emit
+        self.window = float(window)
+        self.max_messages = int(max_messages)
+        self.spawn = spawn or (lambda f, *args: threading.Thread(target=f, args=args, daemon=True).start())
+        self.sleep = sleep or time.sleep
+        self.pending = {}  # room -> list of messages
+        self.lock = threading.Lock()
+
+    def add(self, room, msg):
+        with self.lock:
+            batch = self.pending.setdefault(room, [])
+            batch.append(msg)
+            if len(batch) >= self.max_messages:
+                self._flush(room)
+                return
+            first = len(batch) == 1
+        if first:
+            self.spawn(self._flush_later, room)
+
+    def flush(self, room=None):
+        """
+        Send what is waiting for room now (all rooms if room is None).
+        """
+        with self.lock:
+            for key in ([room] if room is not None else list(self.pending)):
+                self._flush(key)
+
+    def _flush_later(self, room):
+        self.sleep(self.window)
+        # A timer left over from a batch that was flushed early only sends the
+        # next batch a little sooner.
+        self.flush(room)
+
+    def _flush(self, room):
+        batch = self.pending.pop(room, None)
+        if batch:
+            self.emit("chat_batch", {"messages": batch}, room)
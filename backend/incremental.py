@@ -0,0 +1,176 @@
+import argparse
+import os
+
+import numpy as np
+
+import kernels
+import raman
+import results_index
+
+#############################################
+# Incremental B table / results index updates
+#############################################
+#
+# B(a, b) depends on the spectrum only through y(λ_del) with
+#
+#   λ_del(a, b) = floor(1 / (1/1550 - 1/a + 1/b))
+#
+# which is fixed by the grid. The dependencies are therefore:
+#
+#   spectrum entry λ  ->  cells (a, b) with λ_del(a, b) = λ
+#   cell (gi, q)      ->  rows of the results index whose Q contains q
+#
+# When a remeasured spectrum changes a few entries, only those cells are
+# recomputed and only the index rows of Q containing an affected q are rewritten
+# (in place, through a writable memory map). B_table.csv is small and is
+# rewritten as a whole in the format produced by B_table_calc.
+
+
+def lambda_del_matrix(a_values, b_values, lambda_ref=1550):
+    """
+    λ_del for every cell of the grid (nan where a == b or the denominator is zero).
+    """
+    a = np.asarray(a_values, dtype=float)[:, None]
+    b = np.asarray(b_values, dtype=float)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = 1 / lambda_ref - 1 / a + 1 / b
+        lambda_del = np.floor(1 / denominator)
+    return np.where(np.isclose(a, b, rtol=1e-9, atol=0.0) | (denominator == 0), np.nan, lambda_del)
+
+
+def cell_dependencies(lambda_del):
+    """
+    Spectrum wavelength -> array of flat cell indices that read it.
+    """
+    flat = lambda_del.ravel()
+    valid = np.flatnonzero(~np.isnan(flat))
+    order = valid[np.argsort(flat[valid], kind="stable")]
+    keys, starts = np.unique(flat[order], return_index=True)
+    return {int(k): cells for k, cells in zip(keys, np.split(order, starts[1:]))}
+
+
+def changed_wavelengths(old, new):
+    """
+    Spectrum entries that were added, removed or changed between two spectra (dicts).
+    """
+    return sorted(x for x in set(old) | set(new) if old.get(x) != new.get(x))
+
+
+def update_B(B, G, new_spectrum, changed, lambda_ref=1550):
+    """
+    Recompute, in place, the cells of B (rows a, columns b over G) that read one
+    of the changed spectrum entries. Returns the boolean mask of updated cells.
+    """
+    lambda_del = lambda_del_matrix(G, G, lambda_ref)
+    deps = cell_dependencies(lambda_del)
+    cells = [deps[x] for x in changed if x in deps]
+    mask = np.zeros(B.shape, dtype=bool)
+    if not cells:
+        return mask
+    flat = np.concatenate(cells)
+    mask.ravel()[flat] = True
+
+    rows, cols = np.nonzero(mask)
+    lam = lambda_del[rows, cols]
+    y = np.array([new_spectrum.get(int(x), np.nan) for x in lam])
+    missing = np.isnan(y)
+    if missing.any():
+        for x in sorted(set(lam[missing].astype(int).tolist())):
+            print(f"λ_del value {x} not found in the new spectrum; storing nan for its cells.")
+    B[rows, cols] = np.where(missing, np.nan, ((lam / np.asarray(G, dtype=float)[cols]) ** 4) * y)
+    return mask
+
+
+def affected_rows(affected_q, n, max_q=results_index.MAX_Q_SIZE):
+    """
+    For each Q size k, (start row, combinations) of the Q that contain an affected
+    q position. Rows are start row + position of the combination in its block.
+    """
+    offsets = results_index.block_offsets(n, max_q)
+    affected = np.zeros(n, dtype=bool)
+    affected[list(affected_q)] = True
+    blocks = []
+    for k in range(1, max_q + 1):
+        combos = results_index.combinations_array(n, k)
+        hit = np.flatnonzero(affected[combos].any(axis=1))
+        if len(hit):
+            blocks.append((offsets[k] + hit, combos[hit]))
+    return blocks
+
+
+def update_index(index_file, G, B, affected_q):
+    """
+    Rewrite, in place, the index rows of every Q that contains an affected q.
+    Returns the number of rows rewritten.
+    """
+    meta = results_index.load_index(index_file, mmap=True)
+    if list(meta["G"]) != [int(g) for g in G]:
+        raise ValueError(f"{index_file} was built for a different grid.")
+    S = np.load(index_file, mmap_mode="r+")
+    written = 0
+    for rows, combos in affected_rows(affected_q, len(G), meta["max_q"]):
+        S[rows] = results_index.S_block(G, B, combos)
+        written += len(rows)
+    S.flush()
+    if written:
+        results_index.clear_source(index_file)  # no longer the rows of the results CSV
+    return written
+
+
+def save_B_table(G, B, filename="B_table.csv"):
+    """
+    Write B in the layout of B_table_calc.build_and_save_B_table (nan as an empty field).
+    """
+    def fmt(value):
+        return "" if np.isnan(value) else repr(float(value))
+
+    with open(filename, "w") as file:
+        file.write("a," + ",".join(str(int(g)) for g in G) + "\n")
+        for g, row in zip(G, B):
+            file.write(f"{int(g)}," + ",".join(fmt(v) for v in row) + "\n")
+
+
+def apply_spectrum_update(old_spectrum, new_spectrum, B_file="B_table.csv", index_file="results_index.npy"):
+    """
+    Bring B_table.csv and the results index up to date with a new spectrum,
+    touching only what depends on the changed entries.
+
+    Parameters:
+      - old_spectrum, new_spectrum: spectrum files (input_big.csv format) the
+        current tables were built from, and the remeasured one.
+
+    Returns:
+      - dict with the changed wavelengths, the number of B cells and index rows rewritten.
+    """
+    old = raman.load_spectrum(old_spectrum)
+    new = raman.load_spectrum(new_spectrum)
+    changed = changed_wavelengths(old, new)
+    G, B = kernels.load_B_matrix(B_file)
+    mask = update_B(B, G, new, changed)
+    report = {"changed_wavelengths": changed, "cells": int(mask.sum()), "rows": 0}
+    if not mask.any():
+        return report
+
+    save_B_table(G, B, B_file)
+    affected_q = np.flatnonzero(mask.any(axis=0))  # columns are q
+    if index_file and os.path.exists(index_file):
+        report["rows"] = update_index(index_file, G, B, affected_q)
+    return report
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Update B_table.csv and the results index for a remeasured spectrum.")
+    parser.add_argument("new_spectrum", help="remeasured spectrum (input_big.csv format)")
+    parser.add_argument("--old", default="input_big.csv", help="spectrum the current tables were built from")
+    parser.add_argument("--B-file", default="B_table.csv")
+    parser.add_argument("--index", default="results_index.npy")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = apply_spectrum_update(args.old, args.new_spectrum, args.B_file, args.index)
+    print(f"{len(result['changed_wavelengths'])} spectrum entries changed: {result['cells']} B cells and "
+          f"{result['rows']} index rows rewritten in {time.perf_counter() - start:.3f} s")
+    if result["cells"]:
+        print(f"Replace {args.old} with {args.new_spectrum} so that later updates start from it.")
@@ -0,0 +1,243 @@
+import os
+
+import numpy as np
+
+#############################################
+# Vectorized NumPy kernels for the numeric hot spots
+#############################################
+#
+# These mirror the reference implementations:
+#   - compute_B_matrix      <- B_table_calc.compute_B over a whole grid
+#   - S_for_Q / sorted_sums <- Results_caching.compute_sorted_sums_for_Q
+#   - least_S               <- least_candidate_from_csv.get_least_S_for_Q_excluding_CCh_from_csv
+#   - skr_batch             <- candidatenkeyrate.SKR for an array of p_m
+# conformance.py checks that they agree with the references.
+#
+# With Numba installed, compiled versions from kernels_numba.py replace
+# compute_B_matrix, S_for_Q, least_S and skr_batch (NND_KERNEL_BACKEND=auto,
+# the default; "numpy" or "numba" force a backend). The NumPy versions stay
+# available in NUMPY_KERNELS. The backend is picked on the first kernel call
+# (or by use_backend), so importing this module does not import Numba.
+
+# Physical constants and the SKR parameters used by candidatenkeyrate.SKR.
+h = 6.626e-34  # Planck's constant (J·s)
+c = 3.0e8      # Speed of light (m/s)
+
+SKR_PARAMS = {
+    "gamma_dc": 1e-10,
+    "T_d": 100 * (10 ** (-12)),
+    "I": 0.0000000008,
+    "alpha": 0.046,
+    "L": 50,
+    "delta_lambda": 125,
+    "eta_d": 0.3,
+    "ed": 0.015,
+    "Ts": 250 * (10 ** (-12)),
+    "f": 1.16,
+    "Y1": 1,
+    "mu": 0.48,
+}
+
+
+#############################################
+# B matrix
+#############################################
+
+def load_B_matrix(filename="B_table.csv"):
+    """
+    Load B_table.csv without pandas.
+    Returns (G, B) where G holds the wavelengths and B[i, j] = B(G[i], G[j]).
+    """
+    data = np.genfromtxt(filename, delimiter=",")
+    G = data[1:, 0].astype(int)
+    cols = data[0, 1:].astype(int)
+    if not np.array_equal(G, cols):
+        raise ValueError(f"{filename} must have the same wavelengths on rows and columns.")
+    return G, data[1:, 1:]
+
+
+def compute_B_matrix(a_values, b_values, y_lookup, lambda_ref=1550):
+    """
+    Compute B(a, b) for every a in a_values (rows) and b in b_values (columns):
+
+      B(a,b) = (λ_del / b)^4 * y(λ_del),   λ_del = floor(1 / (1/λ_ref - 1/a + 1/b))
+
+    inf where a equals b, nan where λ_del is not in the spectrum (the reference
+    prints a warning and stores nan for those cells).
+    """
+    a = np.asarray(a_values, dtype=float)[:, None]
+    b = np.asarray(b_values, dtype=float)[None, :]
+    xs = np.array(sorted(y_lookup), dtype=float)
+    ys = np.array([y_lookup[x] for x in sorted(y_lookup)], dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = 1 / lambda_ref - 1 / a + 1 / b
+        lambda_del = np.floor(1 / denominator)
+        pos = np.clip(np.searchsorted(xs, lambda_del), 0, len(xs) - 1)
+        found = (xs[pos] == lambda_del) & (denominator != 0)
+        B = np.where(found, ((lambda_del / b) ** 4) * ys[pos], np.nan)
+    return np.where(np.isclose(a, b, rtol=1e-9, atol=0.0), np.inf, B)
+
+
+#############################################
+# S(gi, Q) and the masked argmin
+#############################################
+
+def Q_columns(G, Q):
+    """
+    Column positions of the Q wavelengths in G.
+    """
+    pos = {int(g): i for i, g in enumerate(G)}
+    try:
+        return np.array([pos[int(q)] for q in Q], dtype=np.intp)
+    except KeyError as e:
+        raise ValueError(f"q={e.args[0]} not found in the lookup table.")
+
+
+def S_for_Q(G, Q, B):
+    """
+    S(gi, Q) = sum_{q in Q} q * B(gi, q) for every gi in G, inf for gi in Q.
+    """
+    cols = Q_columns(G, Q)
+    S = (B[:, cols] * np.asarray(Q, dtype=float)).sum(axis=1)
+    S[cols] = np.inf
+    return S
+
+
+def sorted_sums_for_Q(G, Q, B):
+    """
+    Same output as Results_caching.compute_sorted_sums_for_Q: a list of (gi, S)
+    for gi not in Q, sorted ascending by S (stable, so ties keep G order).
+    """
+    S = S_for_Q(G, Q, B)
+    keep = np.flatnonzero(~np.isin(np.arange(len(G)), Q_columns(G, Q)))
+    order = keep[np.argsort(S[keep], kind="stable")]
+    return [(int(G[i]), S[i]) for i in order]
+
+
+def least_S(S_row, excluded=None):
+    """
+    Position and value of the smallest S among the candidates that are not excluded.
+    `excluded` is a boolean mask over G (or None). Ties resolve to the lowest position
+    and nan is skipped, as with pandas idxmin.
+    Returns None if every candidate is excluded or has S = inf.
+    """
+    unusable = np.isnan(S_row) if excluded is None else (excluded | np.isnan(S_row))
+    masked = np.where(unusable, np.inf, S_row)
+    pos = int(np.argmin(masked))
+    if not np.isfinite(masked[pos]):
+        return None
+    return pos, float(masked[pos])
+
+
+#############################################
+# Secret key rate
+#############################################
+
+def skr_constants(params=SKR_PARAMS):
+    """
+    Constants of the SKR chain that do not depend on p_m.
+    """
+    p = params
+    C_f = (p["I"] * np.exp(-p["alpha"] * p["L"]) * p["L"] * p["T_d"] * p["eta_d"]) / (2 * h * p["delta_lambda"] * (10 ** 9))
+    C_b = (p["I"] * (1 - np.exp(-2 * p["alpha"] * p["L"])) / (2 * p["alpha"]) * p["delta_lambda"] * p["T_d"] * p["eta_d"]) / (2 * h * c)
+    return {
+        "C_f": C_f,
+        "C_b": C_b,
+        "p_dc": p["gamma_dc"] * p["T_d"],
+        "eta": (1 / 2) * p["eta_d"] * np.exp(-p["alpha"] * p["L"]),
+        "Q1": p["Y1"] * p["mu"] * np.exp(-p["mu"]),
+    }
+
+
+def binary_entropy(x):
+    """
+    Elementwise binary entropy, 0 at x = 0 and x = 1.
+    """
+    x = np.asarray(x, dtype=float)
+    edge = (x == 0) | (x == 1)
+    safe = np.where(edge, 0.5, x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = -safe * np.log2(safe) - (1 - safe) * np.log2(1 - safe)
+    return np.where(edge, 0.0, value)
+
+
+def skr_batch(p_m, params=SKR_PARAMS, constants=None):
+    """
+    Vectorized candidatenkeyrate.SKR: secret key rate (scaled by 1e-7) for an
+    array of raw p_m values (before the C_f factor is applied).
+    """
+    p = params
+    k = constants or skr_constants(params)
+    p_m = np.asarray(p_m, dtype=float) * k["C_f"]
+    Y0 = 1 - (1 - (k["p_dc"] + p_m)) ** 2
+    eta = k["eta"]
+    Q_mu = 1 - (1 - Y0) * np.exp(-eta * p["mu"])
+    E_mu = (Y0 / 2 + p["ed"] * (1 - np.exp(-eta * p["mu"]))) / Q_mu
+    e1 = (Y0 / 2 + p["ed"] * eta) / p["Y1"]
+    P_Y0 = k["Q1"] * (1 - binary_entropy(e1)) - p["f"] * Q_mu * binary_entropy(E_mu)
+    Rm = P_Y0 / p["Ts"]
+    # Same as max(0, Rm) in the reference, including nan -> 0.
+    Rm = np.where(Rm > 0, Rm, 0.0)
+    return Rm * 1e-7
+
+
+#############################################
+# Backend selection
+#############################################
+
+NUMPY_KERNELS = {
+    "compute_B_matrix": compute_B_matrix,
+    "S_for_Q": S_for_Q,
+    "least_S": least_S,
+    "skr_batch": skr_batch,
+}
+
+
+def load_backend(name):
+    """
+    The kernel functions of a backend ("numpy" or "numba") as a dict like NUMPY_KERNELS.
+    """
+    if name == "numpy":
+        return dict(NUMPY_KERNELS)
+    if name == "numba":
+        import kernels_numba
+
+        return {key: getattr(kernels_numba, key) for key in NUMPY_KERNELS}
+    raise ValueError(f"Unknown kernel backend '{name}'. Use 'auto', 'numpy' or 'numba'.")
+
+
+def use_backend(name="auto"):
+    """
+    Make the module-level kernels point at the chosen backend. "auto" picks Numba
+    when it can be imported and NumPy otherwise. Returns the backend in use.
+    """
+    if name == "auto":
+        try:
+            selected = load_backend("numba")
+            name = "numba"
+        except ImportError:
+            selected = load_backend("numpy")
+            name = "numpy"
+    else:
+        selected = load_backend(name)
+    global BACKEND
+    globals().update(selected)
+    BACKEND = name
+    return name
+
+
+def _deferred(key):
+    """
+    Stand-in for a kernel that picks the configured backend on its first call.
+    """
+    def kernel(*args, **kwargs):
+        if BACKEND is None:
+            use_backend(os.environ.get("NND_KERNEL_BACKEND", "auto"))
+        return globals()[key](*args, **kwargs)
+    kernel.__name__ = key
+    return kernel
+
+
+BACKEND = None
+globals().update({key: _deferred(key) for key in NUMPY_KERNELS})
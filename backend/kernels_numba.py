@@ -0,0 +1,203 @@
+import math
+
+import numpy as np
+from numba import njit
+
+#############################################
+# Numba-compiled kernels (optional backend of kernels.py)
+#############################################
+#
+# Loop versions of the NumPy kernels that work without temporaries. They follow
+# the NumPy arithmetic step by step so the results are the same bit for bit,
+# including NumPy's pairwise summation for the row sums of S. Compiled functions are cached on disk (cache=True, see
+# NUMBA_CACHE_DIR), so only the first start after a change pays for compilation.
+# kernels.py is imported inside the wrappers because it imports this module.
+
+
+#############################################
+# B matrix
+#############################################
+
+@njit(cache=True)
+def _B_terms(a, b, xs, ys, lambda_ref):
+    # (λ_del / b, y(λ_del)) per cell; y is inf on a == b and nan where λ_del is missing.
+    ratio = np.ones((a.shape[0], b.shape[0]))
+    y = np.empty((a.shape[0], b.shape[0]))
+    for i in range(a.shape[0]):
+        for j in range(b.shape[0]):
+            if abs(a[i] - b[j]) <= 1e-9 * abs(b[j]):
+                y[i, j] = np.inf
+                continue
+            denominator = 1 / lambda_ref - 1 / a[i] + 1 / b[j]
+            if denominator == 0:
+                y[i, j] = np.nan
+                continue
+            lambda_del = math.floor(1 / denominator)
+            k = np.searchsorted(xs, lambda_del)
+            if k < xs.shape[0] and xs[k] == lambda_del:
+                ratio[i, j] = lambda_del / b[j]
+                y[i, j] = ys[k]
+            else:
+                y[i, j] = np.nan
+    return ratio, y
+
+
+def compute_B_matrix(a_values, b_values, y_lookup, lambda_ref=1550):
+    xs = np.array(sorted(y_lookup), dtype=float)
+    ys = np.array([y_lookup[x] for x in sorted(y_lookup)], dtype=float)
+    ratio, y = _B_terms(np.asarray(a_values, dtype=float), np.asarray(b_values, dtype=float), xs, ys,
+                        float(lambda_ref))
+    # The 4th power is left to NumPy: its vectorized pow can differ from libm pow
+    # in the last bit, and the result has to match the NumPy kernel exactly.
+    return ratio ** 4 * y
+
+
+#############################################
+# S(gi, Q) and the masked argmin
+#############################################
+
+@njit(cache=True)
+def _pairwise_block(values, start, n):
+    # NumPy's pairwise summation for n <= 128: 8 partial sums, combined as a tree.
+    if n < 8:
+        total = -0.0
+        for i in range(start, start + n):
+            total += values[i]
+        return total
+    r0, r1, r2, r3 = values[start], values[start + 1], values[start + 2], values[start + 3]
+    r4, r5, r6, r7 = values[start + 4], values[start + 5], values[start + 6], values[start + 7]
+    i = 8
+    while i < n - (n % 8):
+        p = start + i
+        r0 += values[p]
+        r1 += values[p + 1]
+        r2 += values[p + 2]
+        r3 += values[p + 3]
+        r4 += values[p + 4]
+        r5 += values[p + 5]
+        r6 += values[p + 6]
+        r7 += values[p + 7]
+        i += 8
+    total = ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+    while i < n:
+        total += values[start + i]
+        i += 1
+    return total
+
+
+@njit(cache=True)
+def _pairwise_sum(values, start, n):
+    # Above 128 values NumPy splits recursively; recursion does not survive the
+    # Numba disk cache, so the same splits are walked with an explicit stack.
+    if n <= 128:
+        return _pairwise_block(values, start, n)
+    tasks = np.empty((192, 3), dtype=np.int64)  # (start, n, combine?)
+    partial = np.empty(96)
+    n_tasks, n_partial = 1, 0
+    tasks[0, 0], tasks[0, 1], tasks[0, 2] = start, n, 0
+    while n_tasks:
+        n_tasks -= 1
+        s, m, combine = tasks[n_tasks, 0], tasks[n_tasks, 1], tasks[n_tasks, 2]
+        if combine:
+            n_partial -= 1
+            partial[n_partial - 1] = partial[n_partial - 1] + partial[n_partial]
+        elif m <= 128:
+            partial[n_partial] = _pairwise_block(values, s, m)
+            n_partial += 1
+        else:
+            half = m // 2
+            half -= half % 8
+            tasks[n_tasks, 0], tasks[n_tasks, 1], tasks[n_tasks, 2] = s, m, 1
+            tasks[n_tasks + 1, 0], tasks[n_tasks + 1, 1], tasks[n_tasks + 1, 2] = s + half, m - half, 0
+            tasks[n_tasks + 2, 0], tasks[n_tasks + 2, 1], tasks[n_tasks + 2, 2] = s, half, 0
+            n_tasks += 3
+    return partial[0]
+
+
+@njit(cache=True)
+def _S_for_Q(B, cols, Q):
+    n = B.shape[0]
+    terms = np.empty(cols.shape[0])
+    S = np.empty(n)
+    for i in range(n):
+        for j in range(cols.shape[0]):
+            terms[j] = B[i, cols[j]] * Q[j]
+        S[i] = _pairwise_sum(terms, 0, cols.shape[0])
+    for j in range(cols.shape[0]):
+        S[cols[j]] = np.inf
+    return S
+
+
+def S_for_Q(G, Q, B):
+    import kernels
+
+    cols = kernels.Q_columns(G, Q)
+    return _S_for_Q(np.asarray(B, dtype=float), cols, np.asarray(Q, dtype=float))
+
+
+@njit(cache=True)
+def _least_S(S_row, excluded, use_mask):
+    best = -1
+    best_value = np.inf
+    for i in range(S_row.shape[0]):
+        value = S_row[i]
+        if (use_mask and excluded[i]) or math.isnan(value):
+            continue
+        if value < best_value:
+            best, best_value = i, value
+    return best, best_value
+
+
+def least_S(S_row, excluded=None):
+    S_row = np.asarray(S_row, dtype=float)
+    use_mask = excluded is not None
+    mask = np.asarray(excluded, dtype=np.bool_) if use_mask else np.zeros(0, dtype=np.bool_)
+    pos, value = _least_S(S_row, mask, use_mask)
+    if pos < 0:
+        return None
+    return int(pos), float(value)
+
+
+#############################################
+# Secret key rate
+#############################################
+
+@njit(cache=True)
+def _entropy(x):
+    if x == 0 or x == 1:
+        return 0.0
+    return -x * math.log2(x) - (1 - x) * math.log2(1 - x)
+
+
+@njit(cache=True)
+def _skr(p_m, C_f, p_dc, exp_eta_mu, ed_term, ed_eta, Y1, Q1, f, Ts):
+    out = np.empty(p_m.shape[0])
+    for i in range(p_m.shape[0]):
+        x = 1 - (p_dc + p_m[i] * C_f)
+        Y0 = 1 - x * x
+        Q_mu = 1 - (1 - Y0) * exp_eta_mu
+        E_mu = (Y0 / 2 + ed_term) / Q_mu
+        e1 = (Y0 / 2 + ed_eta) / Y1
+        Rm = (Q1 * (1 - _entropy(e1)) - f * Q_mu * _entropy(E_mu)) / Ts
+        out[i] = Rm * 1e-7 if Rm > 0 else 0.0
+    return out
+
+
+def skr_batch(p_m, params=None, constants=None):
+    """
+    Compiled SKR for scalar parameters. Parameters given as arrays (several link
+    profiles at once) are handled by the NumPy kernel.
+    """
+    import kernels
+
+    p = params = params or kernels.SKR_PARAMS
+    k = constants or kernels.skr_constants(params)
+    scalars = [p[key] for key in ("mu", "ed", "Y1", "f", "Ts")] + [k[key] for key in ("C_f", "p_dc", "eta", "Q1")]
+    if any(np.ndim(v) for v in scalars):
+        return kernels.NUMPY_KERNELS["skr_batch"](p_m, params, k)
+    exp_eta_mu = float(np.exp(-k["eta"] * p["mu"]))
+    p_m = np.asarray(p_m, dtype=float)
+    out = _skr(np.ascontiguousarray(p_m).ravel(), float(k["C_f"]), float(k["p_dc"]), exp_eta_mu,
+               float(p["ed"] * (1 - exp_eta_mu)), float(p["ed"] * k["eta"]), float(p["Y1"]),
+               float(k["Q1"]), float(p["f"]), float(p["Ts"]))
+    return out.reshape(p_m.shape)
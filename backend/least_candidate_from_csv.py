@@ -1,50 +1,76 @@
-import pandas as pd
 import json
 import os
 
-def load_results_from_csv(filename="results.csv"):
+import results_index
+
+# Memory-mapped results indexes by file (see results_index.py), opened on first use.
+_indexes = {}
+
+def _load_index(index_file):
     """
-    Load the results CSV file into a DataFrame.
+    The memory-mapped index for index_file, reopened when it or its sidecar changes.
+    Returns None if there is no index.
     """
-    df = pd.read_csv(filename)
-    return df
+    if not os.path.exists(index_file):
+        return None
+    stamp = (os.stat(index_file).st_mtime_ns, os.stat(index_file + ".json").st_mtime_ns)
+    cached = _indexes.get(index_file)
+    if cached is None or cached[0] != stamp:
+        cached = _indexes[index_file] = (stamp, results_index.load_index(index_file, mmap=True))
+    return cached[1]
 
-def get_least_S_for_Q_excluding_CCh_from_csv(Q, CCh, filename="results.csv"):
+def load_results_for_Q(Q, filename="results.csv"):
+    """
+    Rows (gi, S) of results.csv for one Q configuration, read with the standard library.
+    results.csv is grouped by Q, so the scan stops at the end of the Q block. This
+    reads up to the whole file; it is only the fallback when there is no index.
     """
-    For a given Q configuration and exclusion list CCh, load the results from CSV,
-    filter for rows corresponding to Q, then return the candidate gi with the smallest S
-    that is not in Q and not in CCh.
+    prefix = '-'.join(map(str, Q)) + ","
+    rows = []
+    with open(filename, "r") as file:
+        next(file, None)  # header: Q,gi,S
+        for line in file:
+            if line.startswith(prefix):
+                _, gi, S = line.rstrip("\n").split(",")
+                rows.append((int(gi), float(S)))
+            elif rows:
+                break
+    return rows
+
+def get_least_S_for_Q_excluding_CCh_from_csv(Q, CCh, filename="results.csv", index_file="results_index.npy"):
+    """
+    For a given Q configuration and exclusion list CCh, return the candidate gi
+    with the smallest S that is not in Q and not in CCh.
+
+    The row of Q is read from the memory-mapped results index when it was built
+    from this CSV and the file has not changed since (one row per Q, so the lookup
+    does not depend on the file size). Otherwise the rows of Q are scanned from the CSV.
     
     Parameters:
       - Q: tuple or list of numbers representing the configuration.
       - CCh: list of numbers to exclude.
       - filename: path to the CSV file containing results.
+      - index_file: results index of that CSV (results_index.py).
       
     Returns:
-      - A tuple (gi, S) where gi is the candidate with the smallest S not in Q or CCh.
+      - A tuple (gi, S) where gi is the candidate with the smallest S not in Q or CCh
+        (the first one on ties).
       - If no candidate is found, returns None.
     """
-    # Create the string representation of Q as stored in the CSV.
-    Q_str = '-'.join(map(str, Q))
-    
-    # Load the results DataFrame.
-    df = load_results_from_csv(filename)
-    
-    # Filter for rows where the Q column matches Q_str.
-    df_Q = df[df["Q"] == Q_str]
-    
-    # Exclude rows where gi is in Q or in CCh.
+    index = _load_index(index_file) if index_file else None
+    if index is not None and results_index.built_from(index, filename):
+        try:
+            return results_index.get_least_S_from_index(index, Q, CCh)
+        except ValueError:
+            return None  # Q not covered by the index, so not in the CSV either
     exclusion_set = set(Q) | set(CCh)
-    df_filtered = df_Q[~df_Q["gi"].isin(exclusion_set)]
-    
-    if df_filtered.empty:
-        return None
-    
-    # Get the row with the minimum S value.
-    best_row = df_filtered.loc[df_filtered["S"].idxmin()]
-    gi = best_row["gi"]
-    S = best_row["S"]
-    return gi, S
+    best = None
+    for gi, S in load_results_for_Q(Q, filename):
+        if gi in exclusion_set or S != S:  # S != S skips nan, like idxmin
+            continue
+        if best is None or S < best[1]:
+            best = (gi, S)
+    return best
 
 def load_exclusion_list(filename="exclusion_list.json"):
     """
@@ -0,0 +1,103 @@
+import math
+import threading
+import time
+
+#############################################
+# Expiry timers for pending pairs and channel leases
+#############################################
+#
+# A hashed timer wheel: time is cut into ticks of `resolution` seconds and a
+# deadline goes into the slot of the first tick at or after it (tick % n_slots).
+# advance(now) visits only the slots of the ticks that have passed and returns
+# the keys that are due, so the work per call is proportional to the expired
+# timers (plus any timer more than one rotation away that shares a slot), not
+# to the number of timers. That holds as long as one rotation (n_slots ticks)
+# covers the longest TTL, so slots_for() sizes the wheel from it; slots are
+# created on first use, so a fine resolution costs a list entry per tick, not a
+# dict. Timers fire at most one tick late. A key has at most one timer;
+# scheduling it again replaces the old deadline (lease renewal) and cancel() is O(1).
+
+
+def slots_for(max_ttl, resolution, minimum=64):
+    """
+    Number of slots for which one rotation of the wheel covers max_ttl seconds.
+    """
+    return max(minimum, int(math.ceil(max_ttl / resolution)) + 1)
+
+
+class TimerWheel:
+
+    def __init__(self, resolution=1.0, n_slots=4096, now=None):
+        """
+        Parameters:
+          - resolution: tick length in seconds, must be positive.
+          - n_slots: number of wheel slots (see slots_for).
+          - now: current time (time.time() by default).
+        """
+        self.resolution = float(resolution)
+        if not self.resolution > 0:
+            raise ValueError(f"Timer resolution must be positive, got {resolution}.")
+        self.n_slots = int(n_slots)
+        self.slots = [None] * self.n_slots  # None or {key: deadline}
+        self.slot_of = {}                                   # key -> slot index
+        self.tick = self._tick(time.time() if now is None else now)
+        self.lock = threading.Lock()
+
+    def _tick(self, t):
+        return int(t // self.resolution)
+
+    def schedule(self, key, deadline):
+        """
+        (Re)arm the timer of key to fire at deadline (seconds since the epoch).
+        """
+        with self.lock:
+            self._cancel(key)
+            due = max(-int(-deadline // self.resolution), self.tick + 1)
+            slot = due % self.n_slots
+            if self.slots[slot] is None:
+                self.slots[slot] = {}
+            self.slots[slot][key] = deadline
+            self.slot_of[key] = slot
+
+    def cancel(self, key):
+        with self.lock:
+            self._cancel(key)
+
+    def deadline(self, key):
+        """
+        Deadline of key, or None if no timer is armed.
+        """
+        with self.lock:
+            slot = self.slot_of.get(key)
+            return None if slot is None else self.slots[slot][key]
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def _cancel(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self, now=None):
+        """
+        Move the wheel to now and return the keys whose deadline has passed.
+        """
+        now = time.time() if now is None else now
+        target = self._tick(now)
+        expired = []
+        with self.lock:
+            # Past a full rotation every slot is visited once.
+            steps = min(target - self.tick, self.n_slots)
+            for step in range(1, steps + 1):
+                slot = (self.tick + step) % self.n_slots
+                entries = self.slots[slot]
+                if not entries:
+                    continue
+                for key, deadline in list(entries.items()):
+                    if deadline <= now:
+                        del entries[key]
+                        del self.slot_of[key]
+                        expired.append(key)
+            self.tick = max(self.tick, target)
+        return expired
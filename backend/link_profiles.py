@@ -0,0 +1,104 @@
+import json
+import os
+
+import numpy as np
+
+import kernels
+
+#############################################
+# Named link profiles
+#############################################
+#
+# A link profile holds the fiber and detector parameters of one link (L, alpha,
+# launch power I, eta_d, mu, ...). Derived constants (C_f, C_b, eta, p_dc, Q1)
+# are computed once when the profile is created. Built-in profiles reproduce the
+# constants that were hard-coded in the scripts:
+#
+#   "default"  candidatenkeyrate.SKR: L=50, I=8e-10, computed C_f
+#   "lc_40km"  lc.SKR:                L=40, I=1e-8,  C_f fixed at 150
+#
+# More profiles can be defined in link_profiles.json as
+#   {"name": {"L": 30, "I": 1e-9, ...}, ...}
+# where any SKR parameter may be overridden and "C_f" pins the forward factor.
+
+
+class LinkProfile:
+
+    def __init__(self, name, C_f=None, **overrides):
+        unknown = set(overrides) - set(kernels.SKR_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown link parameters for profile '{name}': {sorted(unknown)}")
+        self.name = name
+        self.pinned_C_f = None if C_f is None else float(C_f)
+        self.params = {**kernels.SKR_PARAMS, **overrides}
+        self.constants = kernels.skr_constants(self.params)
+        if C_f is not None:
+            self.constants["C_f"] = self.pinned_C_f
+
+    def skr(self, p_m):
+        """
+        SKR (scaled by 1e-7) for an array of raw p_m values on this link.
+        """
+        return kernels.skr_batch(p_m, self.params, self.constants)
+
+    def __repr__(self):
+        return f"LinkProfile({self.name!r}, L={self.params['L']}, I={self.params['I']}, C_f={self.constants['C_f']:.4g})"
+
+
+PROFILES = {
+    "default": LinkProfile("default"),
+    "lc_40km": LinkProfile("lc_40km", C_f=150, L=40, I=0.00000001),
+}
+
+
+def load_profiles(filename="link_profiles.json"):
+    """
+    Add the profiles defined in the JSON file (if present) to PROFILES.
+    """
+    if os.path.exists(filename):
+        with open(filename, "r") as file:
+            for name, params in json.load(file).items():
+                PROFILES[name] = LinkProfile(name, **params)
+    return PROFILES
+
+
+def get_profile(name):
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown link profile '{name}'. Choose from {sorted(PROFILES)}.")
+
+
+def stack_profiles(profiles, ndim=1):
+    """
+    Parameters and constants of several profiles as arrays of shape
+    (n_links, 1, ..., 1) with ndim trailing axes, ready to broadcast.
+    """
+    shape = (len(profiles),) + (1,) * ndim
+    params = {key: np.array([p.params[key] for p in profiles], dtype=float).reshape(shape)
+              for key in kernels.SKR_PARAMS}
+    constants = {key: np.array([p.constants[key] for p in profiles], dtype=float).reshape(shape)
+                 for key in profiles[0].constants}
+    return params, constants
+
+
+def skr_links(p_m, profiles):
+    """
+    SKR for many links in one vectorized call.
+
+    Parameters:
+      - p_m: array of shape (n_links, ...) of raw noise values, one row per link.
+      - profiles: sequence of n_links LinkProfile objects (or profile names).
+
+    Returns:
+      - array with the same shape as p_m.
+    """
+    profiles = [get_profile(p) if isinstance(p, str) else p for p in profiles]
+    p_m = np.asarray(p_m, dtype=float)
+    if p_m.shape[0] != len(profiles):
+        raise ValueError(f"p_m has {p_m.shape[0]} rows but {len(profiles)} profiles were given.")
+    params, constants = stack_profiles(profiles, p_m.ndim - 1)
+    return kernels.skr_batch(p_m, params, constants)
+
+
+load_profiles()
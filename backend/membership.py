@@ -0,0 +1,74 @@
+import threading
+
+#############################################
+# Chat channel membership
+#############################################
+#
+# Two maps kept in step under one lock:
+#
+#   members[channel]  set of Socket.IO sids in the channel
+#   channel_of[sid]   the channel a sid has joined
+#
+# Capacity checks, counts and end-of-session fan-out only touch the members of
+# one channel, and a sid can never be counted in two channels or twice in one.
+
+
+class ChannelMembership:
+
+    def __init__(self, capacity=2):
+        self.capacity = capacity
+        self.members = {}
+        self.channel_of = {}
+        self.lock = threading.Lock()
+
+    def join(self, sid, channel):
+        """
+        Add sid to channel if there is room. A sid that was in another channel
+        leaves it first (the caller leaves its Socket.IO room). Returns False if
+        the channel is full.
+        """
+        with self.lock:
+            current = self.channel_of.get(sid)
+            if current == channel:
+                return True
+            room = self.members.get(channel, ())
+            if len(room) >= self.capacity:
+                return False
+            if current is not None:
+                self._remove(sid, current)
+            self.members.setdefault(channel, set()).add(sid)
+            self.channel_of[sid] = channel
+            return True
+
+    def leave(self, sid):
+        """
+        Remove sid from its channel. Returns the channel, or None if it had not joined.
+        """
+        with self.lock:
+            channel = self.channel_of.get(sid)
+            if channel is not None:
+                self._remove(sid, channel)
+            return channel
+
+    def close(self, channel):
+        """
+        Remove every member of channel and return their sids.
+        """
+        with self.lock:
+            sids = self.members.pop(channel, set())
+            for sid in sids:
+                del self.channel_of[sid]
+            return sids
+
+    def count(self, channel):
+        return len(self.members.get(channel, ()))
+
+    def channel(self, sid):
+        return self.channel_of.get(sid)
+
+    def _remove(self, sid, channel):
+        del self.channel_of[sid]
+        room = self.members[channel]
+        room.discard(sid)
+        if not room:
+            del self.members[channel]
@@ -0,0 +1,265 @@
+import argparse
+import ast
+import json
+import math
+import os
+import struct
+import sys
+import time
+
+#############################################
+# Command-line tool for building, querying and checking the artifacts
+#############################################
+#
+#   python nnd.py build-btable [--spectrum input_big.csv] [--out B_table.csv]
+#   python nnd.py build-index  [--B-file B_table.csv] [--out results_index.npy]
+#   python nnd.py query  --Q 1530-1537-1538 [--exclude 1534-1535] [-k 3]
+#   python nnd.py skr    --Q 1530-1537-1538 --in-use 1534-1535 [--profile default]
+#   python nnd.py bench  [--n 10000] [--backend auto]
+#   python nnd.py verify [--impl numpy]
+#
+# Subcommands import what they need when they run: NumPy, the kernels and
+# pandas are only loaded by the commands that use them. `query` reads the one
+# row it needs from results_index.npy with the standard library only (the .npy
+# header gives the data offset, the row follows from the layout described in
+# results_index.py), so it answers from a cold start without importing NumPy.
+
+
+def parse_channels(text):
+    """
+    Parse a hyphen-separated list of wavelengths such as "1530-1537-1538".
+    """
+    return [int(x) for x in text.split("-") if x.strip()] if text else []
+
+
+#############################################
+# Standard-library reader for results_index.npy
+#############################################
+
+def _npy_header(file):
+    """
+    (dtype descr, shape, data offset) of an .npy file opened in binary mode.
+    """
+    if file.read(6) != b"\x93NUMPY":
+        raise ValueError("not an .npy file")
+    major = file.read(2)[0]
+    size_format = "<H" if major == 1 else "<I"
+    (header_len,) = struct.unpack(size_format, file.read(struct.calcsize(size_format)))
+    header = ast.literal_eval(file.read(header_len).decode("latin1"))
+    if header["fortran_order"]:
+        raise ValueError("Fortran-ordered index files are not supported.")
+    return header["descr"], tuple(header["shape"]), file.tell()
+
+
+def index_row(Q, index_file="results_index.npy"):
+    """
+    (G, S) with S(gi, Q) for every gi in G, read from the index without NumPy.
+    Mirrors results_index.Q_row.
+    """
+    with open(index_file + ".json") as file:
+        meta = json.load(file)
+    G, max_q = meta["G"], meta["max_q"]
+    pos = {int(g): i for i, g in enumerate(G)}
+    try:
+        positions = sorted(pos[int(q)] for q in Q)
+    except KeyError as e:
+        raise ValueError(f"q={e.args[0]} not found in G.")
+    n, k = len(G), len(positions)
+    if not 1 <= k <= max_q or len(set(positions)) != k:
+        raise ValueError(f"Q={Q} must contain 1..{max_q} distinct wavelengths.")
+    row = sum(math.comb(n, size) for size in range(1, k)) + math.comb(n, k) - 1
+    for i, c in enumerate(positions):
+        row -= math.comb(n - 1 - c, k - i)
+
+    with open(index_file, "rb") as file:
+        descr, shape, offset = _npy_header(file)
+        if descr not in ("<f8", "=f8") or shape[1] != n:
+            raise ValueError(f"{index_file} is not a float64 index over {n} channels.")
+        file.seek(offset + row * n * 8)
+        S = struct.unpack(f"<{n}d", file.read(n * 8))
+    return G, S
+
+
+#############################################
+# Subcommands
+#############################################
+
+def cmd_build_btable(args):
+    import numpy as np
+
+    import incremental
+    import kernels
+    import raman
+
+    G = list(range(args.start, args.stop + 1))
+    B = kernels.compute_B_matrix(G, G, raman.load_spectrum(args.spectrum))
+    incremental.save_B_table(G, B, args.out)
+    print(f"B table {len(G)}x{len(G)} ({int(np.isnan(B).sum())} missing) saved to {args.out}")
+
+
+def cmd_build_index(args):
+    import kernels
+    import results_index
+
+    if args.from_csv:
+        S = results_index.build_index_from_results_csv(args.from_csv, max_q=args.max_q)
+        G = results_index.G_DEFAULT
+    else:
+        G, B = kernels.load_B_matrix(args.B_file)
+        S = results_index.compute_S_index(G, B, args.max_q)
+    results_index.save_index(S, G, args.max_q, args.out, source=args.from_csv)
+
+
+def cmd_query(args):
+    Q = parse_channels(args.Q)
+    excluded = set(parse_channels(args.exclude))
+    if os.path.exists(args.index):
+        G, S = index_row(Q, args.index)
+    else:
+        # No prebuilt index: compute the row from the B table.
+        import kernels
+
+        G, B = kernels.load_B_matrix(args.B_file)
+        S = kernels.S_for_Q(G, Q, B).tolist()
+    candidates = sorted((s, int(g)) for g, s in zip(G, S)
+                        if int(g) not in excluded and not math.isnan(s) and not math.isinf(s))[:args.k]
+    if args.json:
+        print(json.dumps({"Q": Q, "excluded": sorted(excluded),
+                          "candidates": [{"gi": g, "S": s} for s, g in candidates]}))
+    elif not candidates:
+        print(f"No candidate found for Q = {Q} excluding {sorted(excluded)}")
+    else:
+        for s, g in candidates:
+            print(f"gi = {g}, S = {s}")
+
+
+def cmd_skr(args):
+    import numpy as np
+
+    import kernels
+    import link_profiles
+    import strategies
+
+    Q = parse_channels(args.Q)
+    G, B = kernels.load_B_matrix(args.B_file)
+    ctx = strategies.prepare(G, B, Q)
+    occupied = strategies.occupied_mask(ctx, parse_channels(args.in_use))
+    noise = np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)
+    p_m = noise[occupied].sum(axis=0)
+    skr = link_profiles.skr_links(p_m[None, :], [args.profile])[0]
+    if args.json:
+        print(json.dumps({"Q": Q, "profile": args.profile, "p_m": p_m.tolist(),
+                          "skr_per_q": skr.tolist(), "skr_total": float(skr.sum())}))
+        return
+    for q, p, r in zip(Q, p_m, skr):
+        print(f"q = {q}: p_m = {p:.6e}, SKR = {r:.6e}")
+    print(f"Total secret key rate: {float(skr.sum()):.6e}")
+
+
+def _timed(n, fn):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def cmd_bench(args):
+    import numpy as np
+
+    import kernels
+    import results_index
+
+    backend = kernels.use_backend(args.backend)
+    G, B = kernels.load_B_matrix(args.B_file)
+    rng = np.random.default_rng(0)
+    Q = sorted(rng.choice(G, size=3, replace=False).tolist())
+    excluded = rng.random(len(G)) < 0.3
+    S = kernels.S_for_Q(G, Q, B)
+    p_m = rng.random(len(Q)) * 1e-9
+
+    rows = [
+        ("S_for_Q (B table)", lambda: kernels.S_for_Q(G, Q, B)),
+        ("least_S (masked argmin)", lambda: kernels.least_S(S, excluded)),
+        ("skr_batch", lambda: kernels.skr_batch(p_m)),
+    ]
+    if os.path.exists(args.index):
+        index = results_index.load_index(args.index, mmap=True)
+        CCh = [int(g) for g in np.asarray(G)[excluded]]
+        rows.append(("index lookup (mmap)", lambda: results_index.get_least_S_from_index(index, Q, CCh)))
+        rows.append(("index row (stdlib)", lambda: index_row(Q, args.index)))
+    print(f"Kernel backend: {backend}, Q = {Q}, {args.n} iterations")
+    for name, fn in rows:
+        fn()  # warm-up (and compilation for Numba)
+        print(f"  {name:<26} {_timed(args.n, fn):10.2f} µs/op")
+
+
+def cmd_verify(args):
+    import conformance
+
+    results = conformance.run(args.impl, args.random_grids, seed=args.seed, lookups=args.lookups)
+    conformance.print_results(args.impl, results)
+    return 0 if all(r["passed"] for r in results) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="nnd", description="Build, query and check the channel allocation artifacts.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("build-btable", help="compute B_table.csv from a spectrum")
+    p.add_argument("--spectrum", default="input_big.csv", help="two-column spectrum (wavelength, B(1550, wavelength))")
+    p.add_argument("--start", type=int, default=1530, help="first wavelength of the grid")
+    p.add_argument("--stop", type=int, default=1565, help="last wavelength of the grid")
+    p.add_argument("--out", default="B_table.csv")
+    p.set_defaults(func=cmd_build_btable)
+
+    p = commands.add_parser("build-index", help="compute results_index.npy (S for every Q)")
+    p.add_argument("--B-file", default="B_table.csv")
+    p.add_argument("--from-csv", default=None, help="build from an existing results.csv instead (needs pandas)")
+    p.add_argument("--max-q", type=int, default=4)
+    p.add_argument("--out", default="results_index.npy")
+    p.set_defaults(func=cmd_build_index)
+
+    p = commands.add_parser("query", help="least-S candidates for Q")
+    p.add_argument("--Q", required=True, help="hyphen-separated quantum channels")
+    p.add_argument("--exclude", default="", help="hyphen-separated channels in use")
+    p.add_argument("-k", type=int, default=1, help="number of candidates")
+    p.add_argument("--index", default="results_index.npy")
+    p.add_argument("--B-file", default="B_table.csv", help="used when the index does not exist")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_query)
+
+    p = commands.add_parser("skr", help="secret key rate of Q with the given channels in use")
+    p.add_argument("--Q", required=True, help="hyphen-separated quantum channels")
+    p.add_argument("--in-use", default="", help="hyphen-separated classical channels in use")
+    p.add_argument("--profile", default="default", help="link profile (see link_profiles.py)")
+    p.add_argument("--B-file", default="B_table.csv")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_skr)
+
+    p = commands.add_parser("bench", help="time the hot-path kernels and lookups")
+    p.add_argument("--n", type=int, default=10000)
+    p.add_argument("--backend", default="auto", choices=["auto", "numpy", "numba"])
+    p.add_argument("--B-file", default="B_table.csv")
+    p.add_argument("--index", default="results_index.npy")
+    p.set_defaults(func=cmd_bench)
+
+    p = commands.add_parser("verify", help="run the kernel conformance checks")
+    p.add_argument("--impl", default="numpy")
+    p.add_argument("--random-grids", type=int, default=3)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--lookups", type=int, default=24)
+    p.set_defaults(func=cmd_verify)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args) or 0
+    except (OSError, ValueError) as e:
+        print(f"nnd {args.command}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
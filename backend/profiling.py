@@ -0,0 +1,160 @@
+import cProfile
+import functools
+import io
+import itertools
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+
+#############################################
+# Opt-in profiling for live requests and batch jobs
+#############################################
+#
+# Profiling is off by default. It is switched on either through the environment:
+#
+#   NND_PROFILE_RATE        fraction (0..1) of request handlers to profile
+#   NND_PROFILE_BATCH_RATE  fraction (0..1) of batch runs to profile
+#   NND_PROFILE_DIR         directory where profiles are written (default "profiles")
+#
+# or at runtime through configure() (used by the admin event in app.py).
+# Every sampled call writes a cProfile dump "<name>-<time>-<pid>-<n>.prof" together
+# with a "<...>.json" sidecar holding the request context and wall time.
+
+settings = {
+    "request_rate": float(os.environ.get("NND_PROFILE_RATE", "0") or 0),
+    "batch_rate": float(os.environ.get("NND_PROFILE_BATCH_RATE", "0") or 0),
+    "directory": os.environ.get("NND_PROFILE_DIR", "profiles"),
+}
+
+_counter = itertools.count()
+_active = threading.local()
+
+
+def configure(request_rate=None, batch_rate=None, directory=None):
+    """
+    Update the sampling rates and/or output directory at runtime.
+    Rates are clamped to [0, 1]. Returns the resulting settings.
+    """
+    if request_rate is not None:
+        settings["request_rate"] = min(1.0, max(0.0, float(request_rate)))
+    if batch_rate is not None:
+        settings["batch_rate"] = min(1.0, max(0.0, float(batch_rate)))
+    if directory is not None:
+        settings["directory"] = directory
+    return dict(settings)
+
+
+def should_sample(kind="request"):
+    """
+    Decide whether the next call of the given kind ("request" or "batch") is profiled.
+    """
+    rate = settings["batch_rate"] if kind == "batch" else settings["request_rate"]
+    if rate <= 0:
+        return False
+    return rate >= 1 or random.random() < rate
+
+
+def _dump(profiler, name, context, elapsed):
+    """
+    Write the profile and its context sidecar to the profile directory.
+    """
+    directory = settings["directory"]
+    os.makedirs(directory, exist_ok=True)
+    stem = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_counter)}"
+    path = os.path.join(directory, stem + ".prof")
+    profiler.dump_stats(path)
+    meta = {"name": name, "elapsed_s": elapsed, "time": time.time(), "context": context}
+    with open(os.path.join(directory, stem + ".json"), "w") as file:
+        json.dump(meta, file, default=str)
+    return path
+
+
+def _run(name, kind, func, args, kwargs, context):
+    """
+    Run func, profiling it if this call is sampled.
+    Nested sampled calls (or another active profiler) simply run unprofiled.
+    """
+    if getattr(_active, "on", False) or not should_sample(kind):
+        return func(*args, **kwargs)
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active in this interpreter.
+        return func(*args, **kwargs)
+    _active.on = True
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _active.on = False
+        elapsed = time.perf_counter() - start
+        try:
+            ctx = context(*args, **kwargs) if callable(context) else context
+        except Exception as e:
+            ctx = {"context_error": str(e)}
+        try:
+            _dump(profiler, name, ctx, elapsed)
+        except OSError as e:
+            print(f"Could not write profile for {name}: {e}")
+
+
+def profiled(name, context=None, kind="request"):
+    """
+    Decorator that samples calls of the wrapped function with cProfile.
+
+    Parameters:
+      - name: label used in the profile file names and in the report.
+      - context: dict, or callable receiving the call arguments and returning a dict,
+                 stored alongside the profile (e.g. the pair or socket sid).
+      - kind: "request" or "batch", selecting which sampling rate applies.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return _run(name, kind, func, args, kwargs, context)
+        return wrapper
+    return decorator
+
+
+def profile_batch(name, func, *args, **kwargs):
+    """
+    Run a whole batch job (e.g. Results_caching.main) under the batch sampling rate.
+    """
+    return _run(name, "batch", func, args, kwargs, {"argv": list(sys.argv)})
+
+
+def report(directory=None, top_n=20, name=None, sort="cumulative"):
+    """
+    Aggregate all profiles in the directory (optionally only those for `name`)
+    and return the top-N functions as text.
+    """
+    directory = directory or settings["directory"]
+    if not os.path.isdir(directory):
+        return f"No profiles found in {directory}"
+    paths = sorted(
+        os.path.join(directory, fn) for fn in os.listdir(directory)
+        if fn.endswith(".prof") and (name is None or fn.startswith(name + "-"))
+    )
+    if not paths:
+        return f"No profiles found in {directory}"
+
+    out = io.StringIO()
+    stats = pstats.Stats(paths[0], stream=out)
+    for path in paths[1:]:
+        stats.add(path)
+    print(f"Aggregated {len(paths)} profiles from {directory}", file=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(top_n)
+    return out.getvalue()
+
+
+if __name__ == "__main__":
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    only = sys.argv[2] if len(sys.argv) > 2 else None
+    print(report(top_n=top, name=only))
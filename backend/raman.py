@@ -0,0 +1,198 @@
+import argparse
+import hashlib
+import os
+
+import numpy as np
+
+import link_profiles
+
+#############################################
+# Forward and backward Raman noise
+#############################################
+#
+# candidatenkeyrate.SKR computes a backward Raman factor C_b next to the forward
+# factor C_f but only the forward table (B_table_calc.compute_B) feeds S and p_m.
+# This module builds both tables in one pass over the grid (λ_del is computed
+# once and looked up in the forward and the backward spectrum) and combines them
+# for the deployment mode of the link:
+#
+#   "co"       classical and quantum co-propagate:      noise = C_f * B_f
+#   "counter"  classical counter-propagates:            noise = C_b * B_b
+#   "both"     classical traffic in both directions:    noise = C_f * B_f + C_b * B_b
+#
+# The combined matrix is expressed in forward units, B_f + (C_b / C_f) * B_b, so
+# strategies.prepare, the allocators and kernels.skr_batch (which multiply by C_f)
+# use it unchanged. Both factors share the launch power, detector and Raman
+# cross-section terms and differ only in the effective interaction length:
+#
+#   forward   L * exp(-alpha L)
+#   backward  (1 - exp(-2 alpha L)) / (2 alpha)
+#
+# so C_b / C_f is the ratio of the two (about 2 for 50 km at 0.046 /km). The
+# C_b of candidatenkeyrate.SKR is not used: its units differ from those of C_f
+# (Δλ and c appear differently), which made the ratio about 1e5.
+#
+# Matrices are cached in memory and as .npz files keyed by the grid and the
+# spectrum files.
+
+MODES = ("co", "counter", "both")
+
+settings = {
+    "mode": os.environ.get("NND_RAMAN_MODE", "co"),
+    "forward_spectrum": os.environ.get("NND_FORWARD_SPECTRUM", "input_big.csv"),
+    # Backward spectrum B(1550, λ) in the input_big.csv format; defaults to the forward one.
+    "backward_spectrum": os.environ.get("NND_BACKWARD_SPECTRUM") or None,
+    "cache_dir": os.environ.get("NND_RAMAN_CACHE_DIR", "raman_cache"),
+}
+
+_matrices = {}
+
+
+def load_spectrum(filename):
+    """
+    Read a two-column spectrum file (wavelength, B(1550, wavelength)) into a dict.
+    """
+    data = np.loadtxt(filename, delimiter=",", ndmin=2)
+    return {int(x): float(y) for x, y in data}
+
+
+def compute_B_pair(a_values, b_values, forward, backward, lambda_ref=1550):
+    """
+    Forward and backward B matrices in one batched computation.
+
+    Parameters:
+      - a_values, b_values: grid wavelengths (rows, columns).
+      - forward, backward: spectra as dicts {λ: B(1550, λ)}.
+
+    Returns:
+      - array of shape (2, len(a_values), len(b_values)); [0] is forward, [1] backward.
+        Same conventions as kernels.compute_B_matrix (inf on a == b, nan if λ_del is missing).
+    """
+    a = np.asarray(a_values, dtype=float)[:, None]
+    b = np.asarray(b_values, dtype=float)[None, :]
+    xs = np.array(sorted(set(forward) | set(backward)), dtype=float)
+    ys = np.array([[spectrum.get(int(x), np.nan) for x in xs] for spectrum in (forward, backward)])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = 1 / lambda_ref - 1 / a + 1 / b
+        lambda_del = np.floor(1 / denominator)
+        pos = np.clip(np.searchsorted(xs, lambda_del), 0, len(xs) - 1)
+        found = (xs[pos] == lambda_del) & (denominator != 0)
+        B = np.where(found, ((lambda_del / b) ** 4) * ys[:, pos], np.nan)
+    return np.where(np.isclose(a, b, rtol=1e-9, atol=0.0), np.inf, B)
+
+
+def _cache_key(G, forward_file, backward_file):
+    parts = [",".join(str(int(g)) for g in G)]
+    for filename in (forward_file, backward_file):
+        stat = os.stat(filename)
+        parts.append(f"{os.path.abspath(filename)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+def raman_matrices(G, forward_file=None, backward_file=None):
+    """
+    (B_forward, B_backward) for the grid G, computed once per grid and spectrum files.
+    """
+    forward_file = forward_file or settings["forward_spectrum"]
+    backward_file = backward_file or settings["backward_spectrum"] or forward_file
+    key = _cache_key(G, forward_file, backward_file)
+    if key in _matrices:
+        return _matrices[key]
+
+    path = os.path.join(settings["cache_dir"], f"raman_{key}.npz") if settings["cache_dir"] else None
+    if path and os.path.exists(path):
+        with np.load(path) as data:
+            pair = (data["forward"], data["backward"])
+    else:
+        forward = load_spectrum(forward_file)
+        backward = forward if backward_file == forward_file else load_spectrum(backward_file)
+        both = compute_B_pair(G, G, forward, backward)
+        pair = (both[0], both[1])
+        if path:
+            os.makedirs(settings["cache_dir"], exist_ok=True)
+            np.savez(path, forward=pair[0], backward=pair[1])
+    _matrices[key] = pair
+    return pair
+
+
+def backward_ratio(profile):
+    """
+    C_b / C_f of a link profile: backward over forward effective interaction length.
+    """
+    if isinstance(profile, str):
+        profile = link_profiles.get_profile(profile)
+    alpha, L = np.asarray(profile.params["alpha"], dtype=float), np.asarray(profile.params["L"], dtype=float)
+    return float((1 - np.exp(-2 * alpha * L)) / (2 * alpha * L * np.exp(-alpha * L)))
+
+
+def weights(profile, mode=None):
+    """
+    (w_f, w_b) such that the combined noise in forward units is w_f * B_f + w_b * B_b.
+    """
+    mode = mode or settings["mode"]
+    if mode not in MODES:
+        raise ValueError(f"Unknown Raman mode '{mode}'. Choose from {list(MODES)}.")
+    if isinstance(profile, str):
+        profile = link_profiles.get_profile(profile)
+    ratio = backward_ratio(profile)
+    return {"co": (1.0, 0.0), "counter": (0.0, ratio), "both": (1.0, ratio)}[mode]
+
+
+def combine(B_forward, B_backward, profile="default", mode=None):
+    """
+    Weighted sum of the two matrices; a direction with weight 0 is left out
+    entirely so its inf/nan cells do not leak into the result.
+    """
+    w_f, w_b = weights(profile, mode)
+    if not w_b:
+        return w_f * B_forward
+    if not w_f:
+        return w_b * B_backward
+    return w_f * B_forward + w_b * B_backward
+
+
+def combined_matrix(G, profile="default", mode=None, forward_file=None, backward_file=None):
+    """
+    Combined noise matrix for the grid, link profile and deployment mode.
+    """
+    B_forward, B_backward = raman_matrices(G, forward_file, backward_file)
+    return combine(B_forward, B_backward, profile, mode)
+
+
+def effective_p_m(p_forward, p_backward, profile="default", mode=None):
+    """
+    Raw p_m (forward units, before C_f) from per-q forward and backward noise sums.
+    """
+    w_f, w_b = weights(profile, mode)
+    p_forward = np.asarray(p_forward, dtype=float)
+    if not w_b:
+        return w_f * p_forward
+    return w_f * p_forward + w_b * np.asarray(p_backward, dtype=float)
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Build forward/backward Raman matrices and compare deployment modes.")
+    parser.add_argument("--Q", default="1530-1537-1538", help="hyphen-separated quantum channels")
+    parser.add_argument("--profile", default="default")
+    parser.add_argument("--channels", default="1545-1550-1555", help="hyphen-separated classical channels in use")
+    args = parser.parse_args()
+
+    import strategies
+
+    G_arr = np.arange(1530, 1566)
+    Q_arg = tuple(int(q) for q in args.Q.split("-"))
+    CCh_arg = [int(ch) for ch in args.channels.split("-")]
+    start = time.perf_counter()
+    raman_matrices(G_arr)
+    print(f"Forward and backward B for {len(G_arr)}x{len(G_arr)} in {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+    profile_obj = link_profiles.get_profile(args.profile)
+    for mode_name in MODES:
+        ctx = strategies.prepare(G_arr, combined_matrix(G_arr, profile_obj, mode_name), Q_arg)
+        best = strategies.get_strategy("least_s").allocate(ctx, CCh_arg)
+        noise = np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)
+        p_m = noise[strategies.occupied_mask(ctx, CCh_arg)].sum(axis=0)
+        print(f"{mode_name:>8}: next channel {best}, total SKR {float(profile_obj.skr(p_m).sum()):.4e}")
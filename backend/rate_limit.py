@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+#############################################
+# Token buckets and load shedding
+#############################################
+#
+# RateLimiter keeps one token bucket per key (client IP, Socket.IO sid): up to
+# `burst` tokens, refilled at `rate` per second. The refill is computed lazily
+# from the time of the last request, so a check is a dict lookup and a few
+# float operations. Buckets sit in an OrderedDict in order of last use; every
+# check also looks at the least recently used bucket and drops it once it has
+# refilled completely (it would behave exactly like a new one), which keeps
+# memory bounded by the active keys at O(1) amortized cost.
+#
+# InFlightLimit caps the number of requests inside a section (the pairing path,
+# which may wait for the allocation lock) and rejects the rest at once instead
+# of letting them queue.
+
+
+class RateLimiter:
+
+    def __init__(self, rate, burst=None):
+        """
+        Parameters:
+          - rate: tokens per second (0 disables the limiter).
+          - burst: bucket size, default max(1, rate).
+        """
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self.buckets = OrderedDict()  # key -> [tokens, last update]
+        self.lock = threading.Lock()
+
+    def allow(self, key, cost=1.0, now=None):
+        """
+        Take cost tokens from key's bucket. Returns False (and takes nothing) if
+        there are not enough.
+        """
+        if self.rate <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self.buckets.move_to_end(key)
+            allowed = bucket[0] >= cost
+            if allowed:
+                bucket[0] -= cost
+            self._evict_one(now)
+            return allowed
+
+    def retry_after(self, key, cost=1.0, now=None):
+        """
+        Seconds until key's bucket holds cost tokens again.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None or self.rate <= 0:
+                return 0.0
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            return max(0.0, (cost - tokens) / self.rate)
+
+    def forget(self, key):
+        with self.lock:
+            self.buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def _evict_one(self, now):
+        key, (tokens, last) = next(iter(self.buckets.items()))
+        if tokens + (now - last) * self.rate >= self.burst:
+            del self.buckets[key]
+
+
+class InFlightLimit:
+
+    def __init__(self, limit):
+        """
+        Parameters:
+          - limit: most requests allowed inside at once (0 disables the limit).
+        """
+        self.limit = int(limit)
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Enter unless limit requests are already inside. Returns False to shed the request.
+        """
+        with self.lock:
+            if self.limit > 0 and self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
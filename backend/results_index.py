@@ -0,0 +1,211 @@
+import itertools
+import json
+import math
+import os
+
+import numpy as np
+
+#############################################
+# Dense results index: S(gi, Q) for every Q, one row per Q
+#############################################
+#
+# results.csv stores, for every Q of size 1..4 drawn from G, the candidates gi
+# sorted by S. The same data is kept here as a dense float64 matrix of shape
+# (number of Q, len(G)) with S = inf for gi in Q. Rows follow the order of
+# itertools.combinations (all Q of size 1, then size 2, ...), so the row of a Q
+# is computed from its lexicographic rank and no key column is stored.
+# The matrix is saved as .npy (memory-mappable) with a small JSON sidecar. An
+# index built from a results CSV records that file's path, mtime and size in the
+# sidecar ("source"), so readers of the CSV can tell whether the index still
+# matches it; rewriting rows (incremental.py) clears the source.
+
+G_DEFAULT = [1530 + i for i in range(36)]
+MAX_Q_SIZE = 4
+
+
+def block_offsets(n, max_q=MAX_Q_SIZE):
+    """
+    Start row of each Q-size block: offsets[k] is the first row with |Q| = k,
+    offsets[max_q + 1] is the total number of rows.
+    """
+    offsets = [0, 0]
+    for k in range(1, max_q + 1):
+        offsets.append(offsets[-1] + math.comb(n, k))
+    return offsets
+
+
+def lex_rank(positions, n):
+    """
+    Rank of a sorted combination of positions among all combinations of the same
+    size from range(n), in itertools.combinations order.
+    """
+    k = len(positions)
+    rank = math.comb(n, k) - 1
+    for i, c in enumerate(positions):
+        rank -= math.comb(n - 1 - c, k - i)
+    return rank
+
+
+def Q_positions(Q, G):
+    """
+    Sorted column positions of the Q wavelengths in G.
+    """
+    pos = {float(g): i for i, g in enumerate(G)}
+    try:
+        return sorted(pos[float(q)] for q in Q)
+    except KeyError as e:
+        raise ValueError(f"q={e.args[0]} not found in G.")
+
+
+def Q_row(Q, G, max_q=MAX_Q_SIZE):
+    """
+    Row of the index holding S(., Q).
+    """
+    positions = Q_positions(Q, G)
+    if not 1 <= len(positions) <= max_q or len(set(positions)) != len(positions):
+        raise ValueError(f"Q={Q} must contain 1..{max_q} distinct wavelengths.")
+    return block_offsets(len(G), max_q)[len(positions)] + lex_rank(positions, len(G))
+
+
+def combinations_array(n, k):
+    """
+    All k-combinations of range(n) in itertools.combinations order, as an array (C(n, k), k).
+    """
+    return np.array(list(itertools.combinations(range(n), k)), dtype=np.intp).reshape(-1, k)
+
+
+def S_block(G, B, combos):
+    """
+    S rows for the Q given as position combinations (array (m, k)):
+
+        S[c, gi] = sum_{q in Q_c} q * B(gi, q),   inf for gi in Q_c.
+    """
+    G_arr = np.asarray(G, dtype=float)
+    B_T = np.asarray(B, dtype=float).T  # B_T[q, gi]
+    block = np.einsum("ck,ckg->cg", G_arr[combos], B_T[combos])
+    block[np.arange(len(combos))[:, None], combos] = np.inf
+    return block
+
+
+def compute_S_index(G, B, max_q=MAX_Q_SIZE):
+    """
+    Compute the dense S matrix directly from the B matrix (rows gi, columns q):
+
+        S[row(Q), gi] = sum_{q in Q} q * B(gi, q),   inf for gi in Q.
+    """
+    n = len(G)
+    offsets = block_offsets(n, max_q)
+    S = np.empty((offsets[-1], n))
+    for k in range(1, max_q + 1):
+        S[offsets[k]:offsets[k + 1]] = S_block(G, B, combinations_array(n, k))
+    return S
+
+
+def build_index_from_results_csv(filename="results.csv", G=G_DEFAULT, max_q=MAX_Q_SIZE):
+    """
+    Build the dense S matrix from an existing results.csv (offline, uses pandas).
+    """
+    import pandas as pd
+
+    df = pd.read_csv(filename)
+    n = len(G)
+    rows = {}
+    for k in range(1, max_q + 1):
+        start = block_offsets(n, max_q)[k]
+        for r, combo in enumerate(itertools.combinations(G, k)):
+            rows['-'.join(map(str, combo))] = start + r
+    col = {g: i for i, g in enumerate(G)}
+
+    S = np.full((block_offsets(n, max_q)[-1], n), np.inf)
+    row_idx = df["Q"].astype(str).map(rows)
+    col_idx = df["gi"].map(col)
+    valid = row_idx.notna() & col_idx.notna()
+    S[row_idx[valid].to_numpy(dtype=np.intp), col_idx[valid].to_numpy(dtype=np.intp)] = df["S"][valid].to_numpy()
+    return S
+
+
+def source_stamp(filename):
+    """
+    Identity of a results CSV as recorded in the sidecar: absolute path, mtime and size.
+    """
+    stat = os.stat(filename)
+    return {"path": os.path.abspath(filename), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def built_from(index, results_csv):
+    """
+    True if the index was built from results_csv and the file has not changed since.
+    """
+    return os.path.exists(results_csv) and index.get("source") == source_stamp(results_csv)
+
+
+def _write_meta(filename, G, max_q, source):
+    with open(filename + ".json", "w") as file:
+        json.dump({"G": [int(g) for g in G], "max_q": max_q, "source": source}, file)
+
+
+def save_index(S, G=G_DEFAULT, max_q=MAX_Q_SIZE, filename="results_index.npy", source=None):
+    """
+    Save the dense S matrix and its metadata sidecar. source is the results CSV
+    the matrix was built from, if any.
+    """
+    np.save(filename, np.ascontiguousarray(S, dtype=np.float64))
+    _write_meta(filename, G, max_q, source_stamp(source) if source else None)
+    print(f"Results index saved to {filename}")
+
+
+def clear_source(filename="results_index.npy"):
+    """
+    Mark the index as no longer matching the CSV it was built from.
+    """
+    index = load_index(filename)
+    _write_meta(filename, index["G"], index["max_q"], None)
+
+
+def load_index(filename="results_index.npy", mmap=True):
+    """
+    Load the index. With mmap=True only the rows that are touched are read from disk.
+    Returns a dict with keys "G", "max_q", "S" and "source".
+    """
+    with open(filename + ".json", "r") as file:
+        meta = json.load(file)
+    S = np.load(filename, mmap_mode="r" if mmap else None)
+    return {"G": meta["G"], "max_q": meta["max_q"], "S": S, "source": meta.get("source")}
+
+
+def load_or_build_index(filename="results_index.npy", results_csv="results.csv"):
+    """
+    Load the index, building it from results.csv first if it does not exist yet.
+    """
+    if not os.path.exists(filename):
+        save_index(build_index_from_results_csv(results_csv), filename=filename, source=results_csv)
+    return load_index(filename)
+
+
+def get_S_row(index, Q):
+    """
+    S(gi, Q) for every gi in G (inf for gi in Q), as a read-only array.
+    """
+    return index["S"][Q_row(Q, index["G"], index["max_q"])]
+
+
+def get_least_S_from_index(index, Q, CCh):
+    """
+    Index-backed equivalent of get_least_S_for_Q_excluding_CCh_from_csv:
+    (gi, S) with the smallest S for gi not in Q or CCh, or None.
+    """
+    G = index["G"]
+    S = get_S_row(index, Q)
+    excluded = np.isin(np.asarray(G), np.asarray(list(CCh), dtype=float))
+    masked = np.where(excluded | np.isnan(S), np.inf, S)
+    pos = int(np.argmin(masked))
+    if not np.isfinite(masked[pos]):
+        return None
+    return G[pos], float(masked[pos])
+
+
+if __name__ == "__main__":
+    import sys
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "results.csv"
+    save_index(build_index_from_results_csv(source), source=source)
@@ -0,0 +1,205 @@
+import argparse
+import csv
+import heapq
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import kernels
+import strategies
+
+#############################################
+# Discrete-event traffic simulator
+#############################################
+#
+# Pairs arrive (Poisson or from a trace), hold a classical channel for a random
+# or given time and release it. Every arrival asks the allocation strategy for a
+# channel; if none is free (get_least_S_for_Q_excluding_CCh_from_csv would return
+# None) the request is blocked. State is kept incrementally in memory:
+#
+#   occupied   boolean mask over G
+#   p_m        noise on each q in Q, updated by +/- noise[gi] on allocate/release
+#
+# and the total SKR of Q is sampled at every arrival (Poisson arrivals see time
+# averages). Independent replications run in a process pool and are summarized
+# with confidence intervals.
+
+# Two-sided 95% Student t quantiles for small numbers of degrees of freedom.
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+        9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+
+def _t_quantile(dof):
+    if dof <= 0:
+        return float("nan")
+    if dof > 30:
+        return 1.96
+    return T_95[max(k for k in T_95 if k <= dof)]
+
+
+def load_trace(filename):
+    """
+    Read a trace CSV with columns arrival,holding (times in seconds, header optional).
+    """
+    events = []
+    with open(filename, newline="") as file:
+        for row in csv.reader(file):
+            try:
+                events.append((float(row[0]), float(row[1])))
+            except (ValueError, IndexError):
+                continue
+    events.sort()
+    return events
+
+
+def poisson_arrivals(rng, rate, mean_holding, n_arrivals):
+    """
+    Generate (arrival_time, holding_time) for a Poisson process with exponential holding.
+    """
+    t = 0.0
+    for _ in range(n_arrivals):
+        t += rng.expovariate(rate)
+        yield t, rng.expovariate(1.0 / mean_holding)
+
+
+def run_replication(ctx, strategy, arrivals, warmup=0, initial_CCh=()):
+    """
+    Run one replication over the arrival sequence.
+
+    Parameters:
+      - ctx: per-Q context from strategies.prepare.
+      - strategy: an AllocationStrategy instance.
+      - arrivals: iterable of (arrival_time, holding_time), sorted by arrival time.
+      - warmup: number of initial arrivals excluded from the statistics.
+      - initial_CCh: channels that are permanently occupied.
+
+    Returns:
+      - dict with arrivals, blocked, blocking_probability and the SKR samples.
+    """
+    occupied = strategies.occupied_mask(ctx, initial_CCh)
+    noise = np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)
+    p_m = noise[occupied].sum(axis=0)
+    constants = kernels.skr_constants()
+    departures = []  # heap of (time, position)
+
+    counted = blocked = 0
+    skr_samples = []
+    occupancy = []
+    for i, (t, holding) in enumerate(arrivals):
+        while departures and departures[0][0] <= t:
+            _, pos = heapq.heappop(departures)
+            occupied[pos] = False
+            p_m -= noise[pos]
+
+        pos = strategy.select(ctx, occupied)
+        if pos is not None:
+            occupied[pos] = True
+            p_m += noise[pos]
+            heapq.heappush(departures, (t + holding, pos))
+
+        if i < warmup:
+            continue
+        counted += 1
+        if pos is None:
+            blocked += 1
+        skr_samples.append(float(kernels.skr_batch(np.maximum(p_m, 0.0), constants=constants).sum()))
+        occupancy.append(len(departures))
+
+    return {
+        "arrivals": counted,
+        "blocked": blocked,
+        "blocking_probability": blocked / counted if counted else 0.0,
+        "skr": np.asarray(skr_samples),
+        "mean_occupancy": float(np.mean(occupancy)) if occupancy else 0.0,
+    }
+
+
+def _replication_worker(job):
+    """
+    Process-pool entry point: one independent replication with its own seed.
+    """
+    Q, strategy_name, B_file, rate, mean_holding, n_arrivals, warmup, seed, trace, initial_CCh = job
+    G, B = kernels.load_B_matrix(B_file)
+    ctx = strategies.prepare(G, B, Q)
+    if trace is not None:
+        arrivals = trace
+    else:
+        arrivals = poisson_arrivals(random.Random(seed), rate, mean_holding, n_arrivals)
+    result = run_replication(ctx, strategies.get_strategy(strategy_name), arrivals, warmup, initial_CCh)
+    skr = result.pop("skr")
+    result["skr_mean"] = float(skr.mean()) if skr.size else float("nan")
+    result["skr_percentiles"] = np.percentile(skr, [5, 50, 95]).tolist() if skr.size else [float("nan")] * 3
+    result["skr_min"] = float(skr.min()) if skr.size else float("nan")
+    return result
+
+
+def confidence_interval(values):
+    """
+    Mean and 95% half-width of independent replication results.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    mean = float(values.mean()) if n else float("nan")
+    if n < 2:
+        return mean, float("nan")
+    return mean, _t_quantile(n - 1) * float(values.std(ddof=1)) / math.sqrt(n)
+
+
+def simulate(Q, strategy_name="least_s", load=20.0, mean_holding=60.0, n_arrivals=20000,
+             replications=10, warmup=1000, seed=0, trace=None, initial_CCh=(),
+             B_file="B_table.csv", workers=None):
+    """
+    Run independent replications and summarize blocking probability and SKR.
+
+    `load` is the offered traffic in Erlangs (arrival rate * mean holding time).
+    Each replication draws its own Poisson arrivals. A trace is replayed once:
+    replaying it again would give the same result, so there is no confidence
+    interval (the half-widths are nan) and `replications` is ignored.
+    """
+    if trace is not None:
+        replications = 1
+    rate = load / mean_holding
+    jobs = [(tuple(Q), strategy_name, B_file, rate, mean_holding, n_arrivals, warmup,
+             seed + r, trace, tuple(initial_CCh)) for r in range(replications)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        runs = list(pool.map(_replication_worker, jobs))
+
+    summary = {"Q": tuple(Q), "strategy": strategy_name, "load": load, "replications": len(runs)}
+    for key in ("blocking_probability", "skr_mean", "skr_min", "mean_occupancy"):
+        summary[key] = confidence_interval([r[key] for r in runs])
+    for j, p in enumerate((5, 50, 95)):
+        summary[f"skr_p{p}"] = confidence_interval([r["skr_percentiles"][j] for r in runs])
+    return summary
+
+
+def print_summary(summary):
+    with_ci = summary["replications"] > 1
+    print(f"Q = {summary['Q']}, strategy = {summary['strategy']}, load = {summary['load']} Erlang, "
+          f"{summary['replications']} replication{'s (mean ± 95% CI)' if with_ci else ' (no CI)'}")
+    for key in ("blocking_probability", "mean_occupancy", "skr_mean", "skr_p5", "skr_p50", "skr_p95", "skr_min"):
+        mean, half = summary[key]
+        print(f"  {key:>20}: {mean:.6g}" + (f" ± {half:.3g}" if with_ci else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate pair arrivals against the allocator and the SKR model.")
+    parser.add_argument("--Q", default="1530-1537-1538", help="hyphen-separated quantum channels")
+    parser.add_argument("--strategy", default="least_s", choices=sorted(strategies.STRATEGIES))
+    parser.add_argument("--load", type=float, nargs="+", default=[20.0], help="offered load(s) in Erlang")
+    parser.add_argument("--holding", type=float, default=60.0, help="mean holding time")
+    parser.add_argument("--arrivals", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--replications", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", default=None, help="CSV of arrival,holding instead of Poisson arrivals (one replication)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    Q_arg = tuple(int(q) for q in args.Q.split("-"))
+    trace_events = load_trace(args.trace) if args.trace else None
+    for offered in args.load:
+        print_summary(simulate(Q_arg, args.strategy, offered, args.holding, args.arrivals,
+                               args.replications, args.warmup, args.seed, trace_events,
+                               workers=args.workers))
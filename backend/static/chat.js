@@ -0,0 +1,56 @@
+// Chat page: join the assigned quantum channel and exchange messages.
+// Channels of the default tenant are numbers, other tenants use "tenant:gi".
+var channelKey = document.getElementById('chat').dataset.channel;
+var channel = /^\d+$/.test(channelKey) ? Number(channelKey) : channelKey;
+var socket = io();
+socket.emit('join', {'channel': channel});
+socket.emit('request_history', {'channel': channel});
+socket.on('chat_history', function(data) {
+    var messages = document.getElementById('messages');
+    messages.innerHTML = "";
+    data.history.forEach(function(msg) {
+        var item = document.createElement('li');
+        item.textContent = msg;
+        messages.appendChild(item);
+    });
+});
+function appendMessages(list) {
+    var messages = document.getElementById('messages');
+    var fragment = document.createDocumentFragment();
+    list.forEach(function(msg) {
+        var item = document.createElement('li');
+        item.textContent = msg;
+        fragment.appendChild(item);
+    });
+    messages.appendChild(fragment);
+}
+socket.on('chat_message', function(data) {
+    appendMessages([data.msg]);
+});
+// With coalesced fan-out enabled the server sends bursts as one event, in order.
+socket.on('chat_batch', function(data) {
+    appendMessages(data.messages);
+});
+socket.on('rate_limited', function(data) {
+    appendMessages(['Sending too fast; message dropped. Wait ' + Math.ceil(data.retry_after) + ' s.']);
+});
+document.getElementById('send_button').onclick = function() {
+    var input = document.getElementById('message_input');
+    var message = input.value.trim();
+    if (message) {
+        socket.emit('send_message', {'channel': channel, 'msg': message});
+        input.value = '';
+    }
+};
+document.getElementById('end_button').onclick = () => {
+    socket.emit('end', {'channel': channel});
+}
+// Keep the channel lease alive while the page is open.
+setInterval(function() { socket.emit('renew', {}); }, 60000);
+socket.on('redirect', function(data) {
+    window.location.href = data.url;
+});
+socket.on('channel_moved', function(data) {
+    // The channel was re-optimized to a less noisy wavelength.
+    window.location.href = data.url;
+});
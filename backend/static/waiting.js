@@ -0,0 +1,31 @@
+// Waiting page: wait in the pair's room until a quantum channel is assigned.
+var statusBox = document.getElementById('status');
+var socket = io();
+socket.emit('join_waiting', {'room': statusBox.dataset.room});
+socket.on('channel_assigned', function(data) {
+    // When channel is assigned, check its current connection count.
+    fetch("/channel_status?channel=" + encodeURIComponent(data.channel))
+      .then(response => response.json())
+      .then(json => {
+          if (json.count < 2) {
+              // If channel is not full, redirect to chat.
+              window.location.href = "/chat?channel=" + encodeURIComponent(data.channel);
+          } else {
+              // Otherwise, redirect back to the query page.
+              statusBox.textContent = "Channel is full. Redirecting to query page...";
+              setTimeout(function(){ window.location.href = "/"; }, 3000);
+          }
+      })
+      .catch(err => {
+          statusBox.textContent = "Error checking channel status.";
+      });
+});
+socket.on('pair_expired', function() {
+    statusBox.textContent = "Your request expired. Redirecting to query page...";
+    setTimeout(function(){ window.location.href = "/"; }, 3000);
+});
+socket.on('no_channel', function(data) {
+    // Both requests arrived but every channel is in use; ask again later.
+    statusBox.textContent = "No quantum channel is free right now. Please try again in " +
+        Math.ceil(data.retry_after) + " seconds.";
+});
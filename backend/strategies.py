@@ -0,0 +1,253 @@
+import argparse
+import random
+
+import numpy as np
+
+import kernels
+import link_profiles
+import raman
+
+#############################################
+# Pluggable allocation strategies
+#############################################
+#
+# A strategy picks a classical channel gi for a fixed quantum set Q given the
+# channels already in use. Everything a strategy needs for one Q is computed
+# once by prepare() from the B matrix:
+#
+#   noise[gi, j] = Q[j] * B(gi, Q[j])     per-q noise contribution of gi
+#   S[gi]        = sum_j noise[gi, j]     (inf for gi in Q)
+#
+# and select() receives a boolean mask over G of the occupied channels.
+# Each select() is a handful of NumPy operations on arrays of len(G).
+
+
+def prepare(G, B, Q):
+    """
+    Per-Q context shared by all strategies.
+    """
+    G = np.asarray(G)
+    cols = kernels.Q_columns(G, Q)
+    noise = B[:, cols] * np.asarray(Q, dtype=float)
+    in_Q = np.zeros(len(G), dtype=bool)
+    in_Q[cols] = True
+    S = np.where(in_Q, np.inf, noise.sum(axis=1))
+    noise = np.where(in_Q[:, None], np.inf, noise)
+    return {"G": G, "Q": tuple(Q), "Q_cols": cols, "in_Q": in_Q, "noise": noise, "S": S}
+
+
+def occupied_mask(ctx, CCh):
+    """
+    Boolean mask over G of the channels in the exclusion list (unknown values are ignored).
+    """
+    return np.isin(ctx["G"], np.asarray(list(CCh), dtype=float))
+
+
+class AllocationStrategy:
+    """
+    Base class: subclasses implement select(ctx, occupied) -> position in G or None.
+    """
+    name = None
+
+    def select(self, ctx, occupied):
+        raise NotImplementedError
+
+    def allocate(self, ctx, CCh):
+        """
+        Pick a channel given the exclusion list CCh.
+        Returns (gi, S) like get_least_S_for_Q_excluding_CCh_from_csv, or None.
+        """
+        pos = self.select(ctx, occupied_mask(ctx, CCh))
+        if pos is None:
+            return None
+        return int(ctx["G"][pos]), float(ctx["S"][pos])
+
+
+class LeastS(AllocationStrategy):
+    """
+    Smallest S(gi, Q) among the free channels (least_candidate_from_csv).
+    """
+    name = "least_s"
+
+    def select(self, ctx, occupied):
+        best = kernels.least_S(ctx["S"], occupied)
+        return None if best is None else best[0]
+
+
+class FirstFit(AllocationStrategy):
+    """
+    First free channel scanning from the longest wavelength down (diff.get_first_fit_candidate).
+    """
+    name = "first_fit"
+
+    def select(self, ctx, occupied):
+        free = ~(occupied | ctx["in_Q"]) & np.isfinite(ctx["S"])
+        if not free.any():
+            return None
+        return len(free) - 1 - int(np.argmax(free[::-1]))
+
+
+class Minimax(AllocationStrategy):
+    """
+    Channel that minimizes the worst per-q noise after it is added, i.e.
+    argmin over gi of max_j (p_m[j] + noise[gi, j]) where p_m is the current
+    noise on each q from the occupied channels. Ties fall back to the smaller S.
+    """
+    name = "minimax"
+
+    def select(self, ctx, occupied):
+        noise = ctx["noise"]
+        current = np.where(occupied[:, None] & ~ctx["in_Q"][:, None], noise, 0.0).sum(axis=0)
+        worst = (current + noise).max(axis=1)
+        worst = np.where(occupied | ~np.isfinite(worst), np.inf, worst)
+        best = np.flatnonzero(worst == worst.min())
+        if not np.isfinite(worst[best[0]]):
+            return None
+        return int(best[np.argmin(ctx["S"][best])])
+
+
+STRATEGIES = {cls.name: cls for cls in (LeastS, FirstFit, Minimax)}
+
+
+def get_strategy(name):
+    """
+    Instantiate a strategy by name (least_s, first_fit, minimax).
+    """
+    try:
+        return STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown allocation strategy '{name}'. Choose from {sorted(STRATEGIES)}.")
+
+
+#############################################
+# Read-only top-K query
+#############################################
+
+def top_k_candidates(ctx, CCh, k=5, with_skr=False, profile="default", raman_contexts=None, raman_mode=None):
+    """
+    The k best non-excluded candidates for Q, ascending by S (ties by wavelength),
+    without changing any state. Uses argpartition, so only the k winners are sorted.
+
+    With with_skr, each entry also carries the total SKR of Q if that candidate
+    were added to the channels in use, and the change relative to now, on the
+    given link profile. raman_contexts (forward and backward contexts of Q) and
+    raman_mode make the SKR use that profile's Raman weights, like /api/skr.
+    """
+    occupied = occupied_mask(ctx, CCh)
+    S = ctx["S"]
+    masked = np.where(occupied | np.isnan(S), np.inf, S)
+    k = min(int(k), int(np.isfinite(masked).sum()))
+    if k <= 0:
+        return []
+    best = np.argpartition(masked, k - 1)[:k] if k < len(masked) else np.arange(len(masked))
+    best = best[np.lexsort((best, masked[best]))]
+
+    rows = [{"gi": int(ctx["G"][pos]), "S": float(S[pos])} for pos in best]
+    if with_skr:
+        profile = link_profiles.get_profile(profile)
+        contexts = raman_contexts or (ctx,)
+        noise = [np.where(np.isfinite(c["noise"]), c["noise"], 0.0) for c in contexts]
+        p_now = [n[occupied].sum(axis=0) for n in noise]
+        p_after = [p[None, :] + n[best] for p, n in zip(p_now, noise)]
+        if raman_contexts:
+            p_now = [raman.effective_p_m(*p_now, profile, raman_mode)]
+            p_after = [raman.effective_p_m(*p_after, profile, raman_mode)]
+        now = float(profile.skr(p_now[0]).sum())
+        after = profile.skr(p_after[0]).sum(axis=1)
+        for row, value in zip(rows, after):
+            row["skr_total"] = float(value)
+            row["skr_delta"] = float(value) - now
+    return rows
+
+
+#############################################
+# Comparison report
+#############################################
+
+def random_traffic(n_events=2000, mean_active=12, seed=0):
+    """
+    A reproducible sequence of ("arrive", id) / ("depart", id) events that keeps
+    roughly mean_active sessions alive.
+    """
+    rng = random.Random(seed)
+    events = []
+    active = []
+    next_id = 0
+    for _ in range(n_events):
+        if active and rng.random() < len(active) / (2.0 * mean_active):
+            events.append(("depart", active.pop(rng.randrange(len(active)))))
+        else:
+            events.append(("arrive", next_id))
+            active.append(next_id)
+            next_id += 1
+    return events
+
+
+def replay(strategy, ctx, traffic, initial_CCh=()):
+    """
+    Replay traffic against one strategy. Returns blocking count, mean S per
+    allocation, mean/peak worst per-q noise and mean total SKR over arrivals.
+    """
+    occupied = occupied_mask(ctx, initial_CCh)
+    noise = np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)
+    assigned = {}
+    arrivals = blocked = 0
+    S_sum = 0.0
+    worst_sum = worst_peak = skr_sum = 0.0
+    for kind, session in traffic:
+        if kind == "depart":
+            pos = assigned.pop(session, None)
+            if pos is not None:
+                occupied[pos] = False
+            continue
+        arrivals += 1
+        pos = strategy.select(ctx, occupied)
+        if pos is None:
+            blocked += 1
+            continue
+        occupied[pos] = True
+        assigned[session] = pos
+        S_sum += ctx["S"][pos]
+        p_m = noise[occupied].sum(axis=0)
+        worst = float(p_m.max())
+        worst_sum += worst
+        worst_peak = max(worst_peak, worst)
+        skr_sum += float(kernels.skr_batch(p_m).sum())
+    served = arrivals - blocked
+    return {
+        "strategy": strategy.name,
+        "arrivals": arrivals,
+        "blocked": blocked,
+        "blocking_probability": blocked / arrivals if arrivals else 0.0,
+        "mean_S": S_sum / served if served else float("nan"),
+        "mean_worst_q_noise": worst_sum / served if served else float("nan"),
+        "peak_worst_q_noise": worst_peak,
+        "mean_total_skr": skr_sum / served if served else float("nan"),
+    }
+
+
+def compare_strategies(Q, traffic, names=None, B_file="B_table.csv", initial_CCh=()):
+    """
+    Run every strategy against the same traffic and return one row per strategy.
+    """
+    G, B = kernels.load_B_matrix(B_file)
+    ctx = prepare(G, B, Q)
+    return [replay(get_strategy(name), ctx, traffic, initial_CCh) for name in (names or STRATEGIES)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare allocation strategies on the same traffic.")
+    parser.add_argument("--Q", default="1530-1537-1538", help="hyphen-separated quantum channels")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--active", type=int, default=12, help="mean number of concurrent sessions")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    Q_arg = tuple(int(q) for q in args.Q.split("-"))
+    rows = compare_strategies(Q_arg, random_traffic(args.events, args.active, args.seed))
+    print(f"Q = {Q_arg}, {args.events} events, ~{args.active} concurrent sessions")
+    for row in rows:
+        print(f"{row['strategy']:>10}: blocked {row['blocked']}/{row['arrivals']} "
+              f"({row['blocking_probability']:.3%}), mean S {row['mean_S']:.4e}, "
+              f"mean worst-q noise {row['mean_worst_q_noise']:.4e}, peak {row['peak_worst_q_noise']:.4e}, "
+              f"mean total SKR {row['mean_total_skr']:.4e}")
@@ -0,0 +1,216 @@
+import argparse
+import hashlib
+import itertools
+import os
+
+import numpy as np
+
+import allocator
+import kernels
+import link_profiles
+import strategies
+
+#############################################
+# Parameter sweeps of the p_m / SKR model
+#############################################
+#
+# A sweep evaluates the SKR of every q in Q over the Cartesian product of
+# parameter ranges (any key of kernels.SKR_PARAMS, e.g. L and I) and channel
+# loads. A load of n means the first n channels an allocation strategy would
+# hand out for Q are in use, so
+#
+#   p_m[n, j] = sum of noise[gi, j] over those n channels      (one cumsum)
+#
+# and the SKR is kernels.skr_batch broadcast over (parameter points, loads, q).
+# Parameter points are evaluated in chunks to cap memory. Every point is
+# evaluated for all loads at once and cached (in memory and in sweep_cache/),
+# keyed by the full parameter vector, so a later sweep over overlapping ranges
+# only computes the points it has not seen.
+
+PARAM_KEYS = tuple(sorted(kernels.SKR_PARAMS))
+
+settings = {
+    "cache_dir": os.environ.get("NND_SWEEP_CACHE_DIR", "sweep_cache"),
+    "chunk_size": int(os.environ.get("NND_SWEEP_CHUNK", "4096")),  # parameter points per chunk
+}
+
+_caches = {}
+
+
+def load_order(ctx, strategy="least_s"):
+    """
+    Positions in G in the order the strategy allocates them on an empty spectrum.
+    """
+    alloc = allocator.make_allocator(strategies.get_strategy(strategy), ctx)
+    pos_of = {int(g): i for i, g in enumerate(ctx["G"])}
+    order = []
+    while True:
+        picked = alloc.allocate()
+        if picked is None:
+            return np.array(order, dtype=np.intp)
+        order.append(pos_of[picked[0]])
+
+
+def p_m_by_load(ctx, order):
+    """
+    Raw p_m per q for loads 0..len(order): array of shape (len(order) + 1, |Q|).
+    """
+    noise = np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)[order]
+    return np.vstack([np.zeros((1, noise.shape[1])), np.cumsum(noise, axis=0)])
+
+
+class SweepCache:
+    """
+    SKR for all loads of one (Q, strategy, B matrix, pinned C_f), keyed by parameter vector.
+    """
+
+    def __init__(self, key):
+        self.path = os.path.join(settings["cache_dir"], f"sweep_{key}.npz") if settings["cache_dir"] else None
+        self.values = {}  # parameter tuple (PARAM_KEYS order) -> array (n_loads, |Q|)
+        if self.path and os.path.exists(self.path):
+            with np.load(self.path) as data:
+                for point, skr in zip(data["points"], data["skr"]):
+                    self.values[tuple(point.tolist())] = skr
+        self.dirty = False
+
+    def save(self):
+        if not self.path or not self.dirty or not self.values:
+            return
+        os.makedirs(settings["cache_dir"], exist_ok=True)
+        points = np.array(list(self.values), dtype=float)
+        np.savez(self.path, points=points, skr=np.stack(list(self.values.values())))
+        self.dirty = False
+
+
+def _cache_for(ctx, strategy, profile, B):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(B).tobytes())
+    digest.update(repr((tuple(ctx["Q"]), strategy, profile.pinned_C_f)).encode())
+    key = digest.hexdigest()[:16]
+    if key not in _caches:
+        _caches[key] = SweepCache(key)
+    return _caches[key]
+
+
+def _evaluate(points, p_m, pinned_C_f, chunk_size):
+    """
+    SKR for the parameter points (array (m, len(PARAM_KEYS))) and all loads.
+    Returns an array of shape (m, n_loads, |Q|).
+    """
+    out = np.empty((len(points),) + p_m.shape)
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        params = {key: chunk[:, i].reshape(-1, 1, 1) for i, key in enumerate(PARAM_KEYS)}
+        constants = kernels.skr_constants(params)
+        if pinned_C_f is not None:
+            constants["C_f"] = pinned_C_f
+        out[start:start + len(chunk)] = kernels.skr_batch(p_m[None, :, :], params, constants)
+    return out
+
+
+def sweep(Q, ranges, loads=None, profile="default", strategy="least_s", B_file="B_table.csv", B=None,
+          chunk_size=None):
+    """
+    Evaluate the SKR over the Cartesian product of parameter ranges and channel loads.
+
+    Parameters:
+      - Q: quantum channels.
+      - ranges: dict {parameter: sequence of values}; parameters not listed keep
+                the value of the link profile.
+      - loads: numbers of classical channels in use (default: every load from 0 to all free channels).
+      - profile: link profile name (or LinkProfile) supplying the fixed parameters.
+      - strategy: allocation strategy that decides which channels a load occupies.
+      - B: noise matrix over the B_table grid (default: loaded from B_file).
+
+    Returns:
+      - dict with "axes" (parameter names followed by "load" and "q"), one value
+        array per axis, and "skr" of shape (len(values_1), ..., len(loads), |Q|).
+    """
+    if isinstance(profile, str):
+        profile = link_profiles.get_profile(profile)
+    unknown = set(ranges) - set(PARAM_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    G, B_table = kernels.load_B_matrix(B_file)
+    B = B_table if B is None else B
+    ctx = strategies.prepare(G, B, tuple(Q))
+    p_m = p_m_by_load(ctx, load_order(ctx, strategy))
+    loads = np.arange(len(p_m)) if loads is None else np.asarray(loads, dtype=int)
+    if loads.size and (loads.min() < 0 or loads.max() >= len(p_m)):
+        raise ValueError(f"Loads must be between 0 and {len(p_m) - 1} for Q={tuple(Q)}.")
+
+    names = list(ranges)
+    values = [np.asarray(ranges[name], dtype=float) for name in names]
+    n_points = int(np.prod([len(v) for v in values]))
+    combos = np.array(list(itertools.product(*values)), dtype=float).reshape(n_points, len(names))
+    grid = np.tile([float(profile.params[key]) for key in PARAM_KEYS], (len(combos), 1))
+    for i, name in enumerate(names):
+        grid[:, PARAM_KEYS.index(name)] = combos[:, i]
+
+    cache = _cache_for(ctx, strategy, profile, B)
+    keys = [tuple(point.tolist()) for point in grid]
+    unique = list(dict.fromkeys(keys))
+    missing = [key for key in unique if key not in cache.values]
+    if missing:
+        computed = _evaluate(np.array(missing, dtype=float), p_m, profile.pinned_C_f,
+                             chunk_size or settings["chunk_size"])
+        for key, skr in zip(missing, computed):
+            cache.values[key] = skr
+        cache.dirty = True
+        cache.save()
+
+    skr = np.stack([cache.values[key][loads] for key in keys])
+    shape = tuple(len(v) for v in values) + (len(loads), len(Q))
+    result = {"axes": names + ["load", "q"], "skr": skr.reshape(shape), "load": loads, "q": np.asarray(Q),
+              "computed": len(missing), "cached": len(unique) - len(missing)}
+    for name, v in zip(names, values):
+        result[name] = v
+    return result
+
+
+def save_sweep(result, filename, dtype=np.float32):
+    """
+    Write a sweep result as a compressed .npz (SKR stored as float32 by default).
+    """
+    arrays = {key: value for key, value in result.items() if isinstance(value, np.ndarray)}
+    arrays["skr"] = result["skr"].astype(dtype)
+    arrays["axes"] = np.array(result["axes"])
+    np.savez_compressed(filename, **arrays)
+    print(f"Saved sweep {result['skr'].shape} to '{filename}'")
+
+
+def parse_range(text):
+    """
+    "start:stop:num" for num evenly spaced values, otherwise a comma-separated list.
+    """
+    if ":" in text:
+        start, stop, num = text.split(":")
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(v) for v in text.split(",")])
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Sweep the SKR model over parameter ranges and channel loads.")
+    parser.add_argument("--Q", default="1530-1537-1538", help="hyphen-separated quantum channels")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=RANGE",
+                        help="e.g. L=10:80:8 or I=1e-10,8e-10 (repeatable)")
+    parser.add_argument("--loads", default=None, help="range of channel loads, e.g. 0:32:33")
+    parser.add_argument("--profile", default="default")
+    parser.add_argument("--strategy", default="least_s", choices=sorted(strategies.STRATEGIES))
+    parser.add_argument("--out", default="sweep.npz")
+    args = parser.parse_args()
+
+    Q_arg = tuple(int(q) for q in args.Q.split("-"))
+    ranges_arg = {}
+    for item in args.param:
+        name, _, text = item.partition("=")
+        ranges_arg[name] = parse_range(text)
+    loads_arg = None if args.loads is None else parse_range(args.loads).astype(int)
+
+    start = time.perf_counter()
+    res = sweep(Q_arg, ranges_arg, loads_arg, args.profile, args.strategy)
+    print(f"{res['skr'].size} values ({res['computed']} points computed, {res['cached']} from cache) "
+          f"in {time.perf_counter() - start:.3f} s")
+    save_sweep(res, args.out)
@@ -0,0 +1,244 @@
+import json
+import os
+import re
+import threading
+
+import allocator
+import strategies
+from least_candidate_from_csv import load_exclusion_list, save_exclusion_list
+
+#############################################
+# Tenants: independent channel sets with their own allocator shard
+#############################################
+#
+# Every tenant (a fiber or a customer group) has its own quantum set Q and
+# allocation strategy, and its own shard of allocator state:
+#
+#   ctx          per-Q context (noise, S) from strategies.prepare
+#   allocator    free/used channels for that Q (allocator.py)
+#   lock         serializes allocate/release/save of this tenant only
+#   exclusion    persisted to its own exclusion file
+#
+# Shards are built on first use, so only the Q of tenants that actually receive
+# requests are prepared; the lazy parts are built under the shard lock (an
+# RLock, so callers already holding it can use them). Allocations for
+# different tenants take different locks and proceed in parallel.
+#
+# Channel keys: the default tenant keeps plain integer channels (gi), so its
+# URLs, rooms and files are unchanged; other tenants use "tenant:gi".
+#
+# Tenants are configured in a JSON file (NND_TENANTS, default tenants.json):
+#
+#   {"fiber2": {"Q": [1531, 1540, 1545], "strategy": "first_fit",
+#               "exclusion_file": "exclusion_list_fiber2.json"}}
+#
+# strategy and exclusion_file are optional. A "default" entry overrides the
+# default tenant (Q_demo, exclusion_list.json).
+
+DEFAULT_TENANT = "default"
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+settings = {
+    "config": os.environ.get("NND_TENANTS", "tenants.json"),
+}
+
+
+def channel_key(tenant, gi):
+    """
+    Key of channel gi of a tenant: gi for the default tenant, "tenant:gi" otherwise.
+    """
+    return int(gi) if tenant == DEFAULT_TENANT else f"{tenant}:{int(gi)}"
+
+
+def parse_channel_key(value):
+    """
+    (tenant, gi) of a channel key, given as an int or as text ("1534", "fiber2:1534").
+    Raises ValueError on anything else.
+    """
+    if isinstance(value, int):
+        return DEFAULT_TENANT, value
+    tenant, sep, gi = str(value).strip().rpartition(":")
+    if not sep:
+        return DEFAULT_TENANT, int(gi)
+    if not NAME_PATTERN.match(tenant):
+        raise ValueError(f"Invalid channel '{value}'.")
+    return tenant, int(gi)
+
+
+def normalize_channel(value):
+    """
+    Canonical channel key (int for the default tenant) of value.
+    """
+    return channel_key(*parse_channel_key(value))
+
+
+class TenantShard:
+
+    def __init__(self, name, Q, G, B, strategy, exclusion_file, raman_B=None):
+        """
+        Parameters:
+          - name: tenant name.
+          - Q: quantum channels of the tenant.
+          - G, B: grid and B matrix used for allocation.
+          - strategy: AllocationStrategy instance.
+          - exclusion_file: where the tenant's channels in use are persisted.
+          - raman_B: optional (B_forward, B_backward) for the SKR of non-co Raman modes.
+        """
+        self.name = name
+        self.Q = tuple(int(q) for q in Q)
+        self.G, self.B = G, B
+        self.strategy = strategy
+        self.exclusion_file = exclusion_file
+        self.raman_B = raman_B
+        self.lock = threading.RLock()
+        self._ctx = None
+        self._raman_contexts = None
+        self._allocator = None
+
+    @property
+    def ctx(self):
+        if self._ctx is None:
+            with self.lock:
+                if self._ctx is None:
+                    self._ctx = strategies.prepare(self.G, self.B, self.Q)
+        return self._ctx
+
+    @property
+    def raman_contexts(self):
+        if self._raman_contexts is None and self.raman_B is not None:
+            with self.lock:
+                if self._raman_contexts is None:
+                    self._raman_contexts = tuple(strategies.prepare(self.G, B, self.Q) for B in self.raman_B)
+        return self._raman_contexts
+
+    @property
+    def allocator(self):
+        """
+        The tenant's allocator, started from its exclusion file on first use.
+        """
+        if self._allocator is None:
+            with self.lock:
+                if self._allocator is None:
+                    stored = load_exclusion_list(self.exclusion_file)
+                    stored = [int(ch) for ch in stored] if isinstance(stored, list) else []
+                    self._allocator = allocator.make_allocator(self.strategy, self.ctx, stored)
+        return self._allocator
+
+    @property
+    def loaded(self):
+        return self._allocator is not None
+
+    def channel_key(self, gi):
+        return channel_key(self.name, gi)
+
+    def allocate(self):
+        """
+        Take a channel and persist the exclusion list. Returns (gi, S) or None.
+        Call with the shard lock held.
+        """
+        result = self.allocator.allocate()
+        if result:
+            self.save()
+        return result
+
+    def release(self, gi):
+        with self.lock:
+            self.allocator.release(gi)
+            self.save()
+
+    def exclusion_list(self):
+        with self.lock:
+            return self.allocator.exclusion_list()
+
+    def save(self):
+        save_exclusion_list(self.allocator.exclusion_list(), self.exclusion_file)
+
+    def reset(self):
+        """
+        Start with an empty exclusion list, on disk and in the allocator.
+        """
+        with self.lock:
+            if self._allocator is not None:
+                self._allocator.reset()
+            save_exclusion_list([], self.exclusion_file)
+
+
+class TenantRegistry:
+
+    def __init__(self, G, B, default_Q, default_strategy, config=None, raman_B=None):
+        """
+        Parameters:
+          - G, B: grid and B matrix shared by all tenants.
+          - default_Q, default_strategy: Q and strategy of the default tenant and
+            the strategy of tenants that do not name one.
+          - config: {name: {"Q": [...], "strategy": ..., "exclusion_file": ...}}.
+          - raman_B: optional (B_forward, B_backward), see TenantShard.
+        """
+        self.G, self.B, self.raman_B = G, B, raman_B
+        self.default_strategy = default_strategy
+        self.config = {DEFAULT_TENANT: {"Q": list(default_Q), "exclusion_file": "exclusion_list.json"}}
+        for name, entry in (config or {}).items():
+            if not NAME_PATTERN.match(name):
+                raise ValueError(f"Invalid tenant name '{name}'.")
+            if "Q" not in entry and name != DEFAULT_TENANT:
+                raise ValueError(f"Tenant '{name}' has no Q.")
+            self.config[name] = {**self.config.get(name, {}), **entry}
+        self.shards = {}
+        self.lock = threading.Lock()
+
+    def names(self):
+        return list(self.config)
+
+    def get(self, name=None):
+        """
+        The shard of a tenant (the default tenant if name is None). Raises KeyError
+        for unknown tenants.
+        """
+        name = name or DEFAULT_TENANT
+        shard = self.shards.get(name)
+        if shard is not None:
+            return shard
+        entry = self.config[name]
+        with self.lock:
+            if name not in self.shards:
+                strategy = entry.get("strategy")
+                self.shards[name] = TenantShard(
+                    name, entry["Q"], self.G, self.B,
+                    strategies.get_strategy(strategy) if strategy else self.default_strategy,
+                    entry.get("exclusion_file", f"exclusion_list_{name}.json"),
+                    self.raman_B)
+            return self.shards[name]
+
+    def normalize_channel(self, value):
+        """
+        Canonical key of a channel of a configured tenant. Raises ValueError for
+        malformed keys and for keys of tenants that are not configured.
+        """
+        tenant, gi = parse_channel_key(value)
+        if tenant not in self.config:
+            raise ValueError(f"Unknown tenant '{tenant}'.")
+        return channel_key(tenant, gi)
+
+    def shard_of(self, channel):
+        """
+        (shard, gi) of a channel key.
+        """
+        tenant, gi = parse_channel_key(channel)
+        return self.get(tenant), gi
+
+    def active(self):
+        """
+        Shards that have been used so far.
+        """
+        return list(self.shards.values())
+
+
+def load_config(filename=None):
+    """
+    Tenant configuration from a JSON file; empty if the file does not exist.
+    """
+    filename = filename or settings["config"]
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as file:
+        return json.load(file)
@@ -0,0 +1,265 @@
+import argparse
+import heapq
+import itertools
+import json
+
+import numpy as np
+
+import kernels
+import link_profiles
+import strategies
+
+#############################################
+# Multi-link routing and wavelength assignment
+#############################################
+#
+# The network is a set of nodes joined by links (fiber spans). Each link has a
+# link profile and optionally its own quantum set Q. A classical channel uses the
+# same wavelength on every link of its path (wavelength continuity), so:
+#
+#   occupancy[link]   int bitmask over G of the wavelengths in use on the link
+#   free on a path    AND of ~occupancy over the links of the path
+#
+# A free wavelength gi is scored by the noise it adds on the path:
+#
+#   score(gi) = sum over links with a Q of S(gi, Q_link)
+#
+# using the same S as the single-fiber allocator (inf where gi is one of the
+# link's quantum wavelengths). Candidate paths (k shortest by hop count) and
+# their summed S vectors are cached per (source, destination), so an allocation
+# is a few bit operations plus one argmin per candidate path.
+
+
+def _mask_to_bool(mask, n):
+    """
+    Expand an int bitmask into a boolean array of length n.
+    """
+    if n <= 64:
+        return ((np.uint64(mask) >> np.arange(n, dtype=np.uint64)) & np.uint64(1)).astype(bool)
+    return np.array([(mask >> i) & 1 for i in range(n)], dtype=bool)
+
+
+class Topology:
+
+    def __init__(self, G, B):
+        self.G = np.asarray(G)
+        self.B = B
+        self.full = (1 << len(self.G)) - 1
+        self.nodes = set()
+        self.links = {}        # link id -> {"id", "u", "v", "profile", "Q", "S"}
+        self.adjacency = {}    # node -> {neighbor: link id}
+        self.occupancy = {}    # link id -> int bitmask of wavelengths in use
+        self.lightpaths = {}   # lightpath id -> (link ids, position in G)
+        self._paths = {}       # (src, dst, k) -> [(nodes, link ids, score vector)]
+        self._next_id = itertools.count()
+
+    def add_node(self, node):
+        self.nodes.add(node)
+        self.adjacency.setdefault(node, {})
+
+    def add_link(self, link_id, u, v, profile="default", Q=()):
+        """
+        Add a bidirectional link. Q is the quantum set carried on this link (may be empty).
+        """
+        link_profiles.get_profile(profile)  # fail early on unknown profiles
+        self.add_node(u)
+        self.add_node(v)
+        Q = tuple(int(q) for q in Q)
+        S = strategies.prepare(self.G, self.B, Q)["S"] if Q else np.zeros(len(self.G))
+        self.links[link_id] = {"id": link_id, "u": u, "v": v, "profile": profile, "Q": Q, "S": S}
+        self.adjacency[u][v] = link_id
+        self.adjacency[v][u] = link_id
+        self.occupancy[link_id] = 0
+        self._paths.clear()
+
+    @classmethod
+    def load(cls, filename, B_file="B_table.csv"):
+        """
+        Build a topology from JSON:
+          {"nodes": [...], "links": [{"id": "l1", "u": "A", "v": "B", "profile": "default", "Q": [1530]}]}
+        """
+        G, B = kernels.load_B_matrix(B_file)
+        with open(filename, "r") as file:
+            spec = json.load(file)
+        topo = cls(G, B)
+        for node in spec.get("nodes", []):
+            topo.add_node(node)
+        for link in spec["links"]:
+            topo.add_link(link["id"], link["u"], link["v"], link.get("profile", "default"), link.get("Q", ()))
+        return topo
+
+    #############################################
+    # Paths
+    #############################################
+
+    def _shortest_path(self, src, dst, banned_nodes=(), banned_links=()):
+        """
+        Fewest-hop path avoiding the banned nodes/links, as a node list (or None).
+        """
+        queue = [(0, src, [src])]
+        seen = set()
+        while queue:
+            hops, node, path = heapq.heappop(queue)
+            if node == dst:
+                return path
+            if node in seen:
+                continue
+            seen.add(node)
+            for nxt, link_id in self.adjacency.get(node, {}).items():
+                if nxt in seen or nxt in banned_nodes or link_id in banned_links:
+                    continue
+                heapq.heappush(queue, (hops + 1, nxt, path + [nxt]))
+        return None
+
+    def k_shortest_paths(self, src, dst, k=3):
+        """
+        Up to k loop-free paths by hop count (Yen's algorithm).
+        """
+        first = self._shortest_path(src, dst)
+        if first is None:
+            return []
+        paths = [first]
+        candidates = []
+        for _ in range(1, k):
+            last = paths[-1]
+            for i in range(len(last) - 1):
+                root = last[:i + 1]
+                banned_links = {self.adjacency[p[i]][p[i + 1]] for p in paths if p[:i + 1] == root}
+                spur = self._shortest_path(root[-1], dst, banned_nodes=set(root[:-1]), banned_links=banned_links)
+                if spur is not None:
+                    candidate = root[:-1] + spur
+                    if candidate not in paths and all(candidate != c for _, c in candidates):
+                        heapq.heappush(candidates, (len(candidate), candidate))
+            if not candidates:
+                break
+            paths.append(heapq.heappop(candidates)[1])
+        return paths
+
+    def candidate_paths(self, src, dst, k=3):
+        """
+        Cached candidate paths with their link ids and summed S vectors.
+        """
+        key = (src, dst, k)
+        if key not in self._paths:
+            entries = []
+            for nodes in self.k_shortest_paths(src, dst, k):
+                link_ids = [self.adjacency[a][b] for a, b in zip(nodes, nodes[1:])]
+                score = np.sum([self.links[l]["S"] for l in link_ids], axis=0)
+                entries.append((nodes, link_ids, score))
+            self._paths[key] = entries
+        return self._paths[key]
+
+    #############################################
+    # Allocation
+    #############################################
+
+    def free_mask(self, link_ids):
+        """
+        Bitmask of the wavelengths free on every link of the path.
+        """
+        used = 0
+        for link_id in link_ids:
+            used |= self.occupancy[link_id]
+        return self.full & ~used
+
+    def allocate(self, src, dst, k=3):
+        """
+        Find the path and wavelength with the smallest noise score among the k
+        shortest paths, and occupy it on every link of the path.
+        Returns a dict describing the lightpath, or None if blocked.
+        """
+        n = len(self.G)
+        best = None
+        for nodes, link_ids, score in self.candidate_paths(src, dst, k):
+            free = self.free_mask(link_ids)
+            if not free:
+                continue
+            masked = np.where(_mask_to_bool(free, n) & np.isfinite(score), score, np.inf)
+            pos = int(np.argmin(masked))
+            if not np.isfinite(masked[pos]):
+                continue
+            if best is None or (masked[pos], len(nodes)) < (best[0], len(best[1])):
+                best = (float(masked[pos]), nodes, link_ids, pos)
+        if best is None:
+            return None
+
+        score, nodes, link_ids, pos = best
+        for link_id in link_ids:
+            self.occupancy[link_id] |= 1 << pos
+        lightpath_id = next(self._next_id)
+        self.lightpaths[lightpath_id] = (link_ids, pos)
+        return {"id": lightpath_id, "path": nodes, "links": link_ids, "gi": int(self.G[pos]), "score": score}
+
+    def release(self, lightpath_id):
+        """
+        Free the wavelength of a lightpath on all its links.
+        """
+        link_ids, pos = self.lightpaths.pop(lightpath_id)
+        for link_id in link_ids:
+            self.occupancy[link_id] &= ~(1 << pos)
+
+    def link_noise(self, link_id):
+        """
+        Per-q noise (p_m before C_f) on one link from the wavelengths in use on it.
+        """
+        link = self.links[link_id]
+        if not link["Q"]:
+            return np.zeros(0)
+        ctx = strategies.prepare(self.G, self.B, link["Q"])
+        noise = np.where(np.isfinite(ctx["noise"]), ctx["noise"], 0.0)
+        return noise[_mask_to_bool(self.occupancy[link_id], len(self.G))].sum(axis=0)
+
+    def link_skr(self, link_id):
+        """
+        Per-q SKR on one link under its own link profile.
+        """
+        profile = link_profiles.get_profile(self.links[link_id]["profile"])
+        return profile.skr(self.link_noise(link_id))
+
+
+def ring_topology(n_nodes, G, B, Q_every=3, Q=(1530, 1537, 1538)):
+    """
+    A ring of n_nodes with a chord every 5 nodes; every Q_every-th link carries Q.
+    Used for benchmarking.
+    """
+    topo = Topology(G, B)
+    for i in range(n_nodes):
+        topo.add_link(f"r{i}", i, (i + 1) % n_nodes, Q=Q if i % Q_every == 0 else ())
+    for i in range(0, n_nodes, 5):
+        topo.add_link(f"c{i}", i, (i + n_nodes // 2) % n_nodes, Q=())
+    return topo
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Route and assign wavelengths on a multi-link topology.")
+    parser.add_argument("--topology", default=None, help="JSON topology file (default: a synthetic ring)")
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.topology:
+        topo = Topology.load(args.topology)
+    else:
+        G_arr, B_arr = kernels.load_B_matrix("B_table.csv")
+        topo = ring_topology(args.nodes, G_arr, B_arr)
+    rng = random.Random(args.seed)
+    nodes = sorted(topo.nodes, key=str)
+    active = []
+    blocked = 0
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        if active and rng.random() < 0.4:
+            topo.release(active.pop(rng.randrange(len(active))))
+        src, dst = rng.sample(nodes, 2)
+        result = topo.allocate(src, dst)
+        if result is None:
+            blocked += 1
+        else:
+            active.append(result["id"])
+    elapsed = time.perf_counter() - start
+    print(f"{len(topo.links)} links, {args.requests} requests, {blocked} blocked, "
+          f"{elapsed / args.requests * 1e3:.3f} ms per request (including path computation)")
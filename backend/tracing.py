@@ -0,0 +1,190 @@
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+#############################################
+# Lightweight trace spans for the allocation pipeline
+#############################################
+#
+# A trace is started by the outermost span on a thread (an HTTP request or a
+# Socket.IO handler); nested spans are recorded into it. When the root span ends,
+# the trace is appended as one JSON line to the trace file. Traces slower than
+# the threshold are also printed with their full breakdown. Once the trace file
+# reaches its size cap it is rotated to "<file>.1" (replacing the previous one),
+# so at most twice the cap is kept on disk.
+#
+#   NND_TRACING          "1" enables tracing (default off)
+#   NND_TRACE_FILE       JSON-lines file for finished traces (default "traces.jsonl")
+#   NND_TRACE_MAX_BYTES  size at which the trace file is rotated (default 50 MB)
+#   NND_TRACE_SLOW_MS    slow-request threshold in milliseconds (default 250)
+
+settings = {
+    "enabled": os.environ.get("NND_TRACING", "0") == "1",
+    "file": os.environ.get("NND_TRACE_FILE", "traces.jsonl"),
+    "max_bytes": int(os.environ.get("NND_TRACE_MAX_BYTES", str(50 * 1024 * 1024))),
+    "slow_ms": float(os.environ.get("NND_TRACE_SLOW_MS", "250")),
+}
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def _current_trace():
+    return getattr(_local, "trace", None)
+
+
+def begin(name, **attrs):
+    """
+    Open a span. If no trace is active on this thread, this span becomes the root.
+    Returns the span dict, to be passed to end().
+    """
+    if not settings["enabled"]:
+        return None
+    trace = _current_trace()
+    if trace is None:
+        trace = {"trace_id": uuid.uuid4().hex[:16], "spans": [], "stack": []}
+        _local.trace = trace
+    span = {
+        "name": name,
+        "attrs": dict(attrs),
+        "depth": len(trace["stack"]),
+        "start": time.perf_counter(),
+        "duration_ms": None,
+    }
+    trace["spans"].append(span)
+    trace["stack"].append(span)
+    return span
+
+
+def end(span):
+    """
+    Close a span. Closing the root span finishes and exports the trace,
+    which is returned; otherwise returns None.
+    """
+    if span is None:
+        return None
+    trace = _current_trace()
+    span["duration_ms"] = (time.perf_counter() - span["start"]) * 1000.0
+    if trace is None:
+        return None
+    if trace["stack"] and trace["stack"][-1] is span:
+        trace["stack"].pop()
+    elif span in trace["stack"]:
+        trace["stack"].remove(span)
+    if span["depth"] == 0:
+        _local.trace = None
+        _export(trace)
+        return trace
+    return None
+
+
+def set_attributes(**attrs):
+    """
+    Attach attributes (e.g. channel, pair, Q) to the innermost open span.
+    """
+    trace = _current_trace()
+    if trace and trace["stack"]:
+        trace["stack"][-1]["attrs"].update(attrs)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Context manager form of begin()/end().
+    """
+    s = begin(name, **attrs)
+    try:
+        yield s
+    finally:
+        end(s)
+
+
+def traced(name, attrs=None):
+    """
+    Decorator that wraps a function in a span. `attrs` is an optional callable
+    receiving the call arguments and returning the span attributes.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                span_attrs = attrs(*args, **kwargs) if attrs else {}
+            except Exception:
+                span_attrs = {}
+            with span(name, **span_attrs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _breakdown(trace):
+    """
+    Finished spans as plain records, in start order.
+    """
+    root_start = trace["spans"][0]["start"]
+    return [
+        {
+            "name": s["name"],
+            "depth": s["depth"],
+            "offset_ms": round((s["start"] - root_start) * 1000.0, 3),
+            "duration_ms": round(s["duration_ms"], 3) if s["duration_ms"] is not None else None,
+            "attrs": s["attrs"],
+        }
+        for s in trace["spans"]
+    ]
+
+
+def _rotate(filename, max_bytes):
+    """
+    Move filename to filename.1 once it holds max_bytes or more (0 never rotates).
+    """
+    if max_bytes > 0 and os.path.exists(filename) and os.path.getsize(filename) >= max_bytes:
+        os.replace(filename, filename + ".1")
+
+
+def _export(trace):
+    """
+    Append the trace to the trace file and log it if it was slow.
+    """
+    spans = _breakdown(trace)
+    record = {
+        "trace_id": trace["trace_id"],
+        "time": time.time(),
+        "root": spans[0]["name"],
+        "duration_ms": spans[0]["duration_ms"],
+        "spans": spans,
+    }
+    trace["record"] = record
+    try:
+        line = json.dumps(record, default=str)
+        with _write_lock:
+            _rotate(settings["file"], settings["max_bytes"])
+            with open(settings["file"], "a") as file:
+                file.write(line + "\n")
+    except OSError as e:
+        print(f"Could not write trace {trace['trace_id']}: {e}")
+
+    if record["duration_ms"] is not None and record["duration_ms"] >= settings["slow_ms"]:
+        print(f"Slow trace {record['trace_id']} {record['root']}: {record['duration_ms']:.1f} ms")
+        for s in spans:
+            print(f"  {'  ' * s['depth']}{s['name']}: {s['duration_ms']} ms {s['attrs']}")
+
+
+def server_timing(trace):
+    """
+    Build a Server-Timing header value from a finished trace.
+    """
+    if not trace or "record" not in trace:
+        return ""
+    parts = []
+    for s in trace["record"]["spans"]:
+        if s["duration_ms"] is None:
+            continue
+        metric = re.sub(r"[^A-Za-z0-9_\-]", "_", s["name"])
+        parts.append(f"{metric};dur={s['duration_ms']:.3f}")
+    return ", ".join(parts)